@@ -7,5 +7,8 @@
 #
 
 __all__ = ['primarykey', 'columnfamily', 'supercolumnfamily', 'supercolumn',
-           'view']
+           'view', 'concurrency', 'scan', 'bulk',
+           'export', 'writebehind', 'blob', 'identity',
+           'keygen', 'instrument', 'budget',
+           'memory', 'bench', 'replay', 'shard']
 
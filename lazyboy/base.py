@@ -7,14 +7,30 @@
 #
 
 import uuid
+import thread
 
-from lazyboy.exceptions import ErrorUnknownTable
+from lazyboy.exceptions import ErrorUnknownTable, ErrorPartialWrite
 import lazyboy.connection as connection
 from lazyboy.primarykey import PrimaryKey
+from lazyboy.concurrency import submit
+
+# Marks a deleted pk, which isn't regenerated
+_NO_PK = object()
 
 class CassandraBase(object):
     """The base class for all Cassandra-accessing objects."""
 
+    # A callable returning new keys, such as a lazyboy.keygen generator.
+    # Plain functions must be wrapped in staticmethod().
+    _key_generator = None
+
+    # The PrimaryKey, generated when first used
+    _pk = None
+
+    # The most columns, and approximate bytes, to send in one batch
+    _batch_columns = 1000
+    _batch_bytes = 2 ** 20
+
     def __init__(self):
         self._clients = {}
 
@@ -25,10 +41,28 @@ class CassandraBase(object):
             raise ErrorUnknownTable()
 
         table = table or self.pk.table
-        if table not in self._clients:
-            self._clients[table] = connection.get_pool(table)
+        # Clients aren't thread-safe, so keep one per thread.
+        key = (thread.get_ident(), table)
+        if key not in self._clients:
+            self._clients[key] = connection.get_pool(table)
+
+        return self._clients[key]
+
+    def _get_pk(self):
+        if self._pk is None:
+            self._pk = self._gen_pk()
+        elif self._pk is _NO_PK:
+            raise AttributeError("pk")
+        return self._pk
+
+    def _set_pk(self, pk):
+        self._pk = pk
 
-        return self._clients[table]
+    def _del_pk(self):
+        self._pk = _NO_PK
+
+    pk = property(_get_pk, _set_pk, _del_pk,
+                  "The PrimaryKey. New keys aren't generated until used.")
 
     def _gen_pk(self, key=None):
         """Generate and return a PrimaryKey with a new UUID."""
@@ -37,4 +71,45 @@ class CassandraBase(object):
 
     def _gen_uuid(self):
         """Generate a UUID for this object"""
+        if self._key_generator is not None:
+            return self._key_generator()
         return uuid.uuid4().hex
+
+    def _split_batch(self, items, size):
+        """Split items into lists within the batch limits.
+
+        size(item) returns the approximate number of bytes an item
+        will take up on the wire."""
+        batches, batch, total = [], [], 0
+        for item in items:
+            n = size(item)
+            if batch and (len(batch) >= self._batch_columns or
+                          total + n > self._batch_bytes):
+                batches.append(batch)
+                batch, total = [], 0
+            batch.append(item)
+            total += n
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _write_batches(self, write, batches, names):
+        """Call write(batch) for every batch, in parallel if there are many.
+
+        If any fail, ErrorPartialWrite is raised listing names(batch)
+        for the batches which were and weren't written."""
+        if len(batches) == 1:
+            write(batches[0])
+            return
+
+        written, failed = [], {}
+        futures = [submit(write, batch) for batch in batches]
+        for (batch, future) in zip(batches, futures):
+            try:
+                future.result()
+                written.extend(names(batch))
+            except Exception, e:
+                for name in names(batch):
+                    failed[name] = e
+        if failed:
+            raise ErrorPartialWrite(written, failed)
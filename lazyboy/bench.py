@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Benchmarks
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+"""Benchmark lazyboy's hot paths against an in-memory server.
+
+    python -m lazyboy.bench -o new.json -B old.json
+"""
+
+import gc
+import sys
+import time
+import platform
+from optparse import OptionParser
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from lazyboy import memory
+from lazyboy.primarykey import PrimaryKey
+from lazyboy.columnfamily import ColumnFamily
+from lazyboy.supercolumnfamily import SuperColumnFamily
+from lazyboy.supercolumn import SuperColumn
+from lazyboy.view import View
+
+TABLE = 'bench'
+
+# (name, setup) for each benchmark, in the order they run. setup(n)
+# prepares n operations and returns op(i), which runs the i'th.
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """Register a benchmark setup function under name."""
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+class Story(ColumnFamily):
+    _key = {'table': TABLE, 'family': 'Story'}
+
+
+class Comment(SuperColumnFamily):
+    _key = {'table': TABLE, 'family': 'Comments', 'supercol': 'Comments'}
+
+
+class Comments(SuperColumn):
+    _key = {'table': TABLE, 'family': 'Comments'}
+    name = 'Comments'
+    family = Comment
+
+
+class StoryView(View):
+    _key = {'table': TABLE, 'family': 'StoryView'}
+    family = Story
+
+    def view_keys(self, start=''):
+        return ['stories']
+
+
+FIELDS = {'title': 'A story about spam', 'url': 'http://example.com/spam',
+          'user': 'eggs', 'diggs': '1234', 'body': 'x' * 200}
+
+
+def _stories(count):
+    """Save count stories, returning their keys."""
+    keys = []
+    for i in range(count):
+        story = Story(FIELDS)
+        story.save()
+        keys.append(story.pk.key)
+    return keys
+
+
+@benchmark('primarykey.create')
+def bench_pk_create(n):
+    return lambda i: PrimaryKey(table=TABLE, key='story', family='Story')
+
+
+@benchmark('primarykey.clone')
+def bench_pk_clone(n):
+    pk = PrimaryKey(table=TABLE, key='story', family='Story')
+    return lambda i: pk.clone(supercol='Comments', superkey='comment')
+
+
+@benchmark('columnfamily.setitem')
+def bench_cf_setitem(n):
+    story = Story()
+    return lambda i: story.__setitem__('title', str(i))
+
+
+@benchmark('columnfamily.load')
+def bench_cf_load(n):
+    keys = _stories(min(n, 1000))
+    return lambda i: Story().load(keys[i % len(keys)])
+
+
+@benchmark('columnfamily.save')
+def bench_cf_save(n):
+    return lambda i: Story(FIELDS).save()
+
+
+def _comments(superkeys):
+    comments = Comments()
+    comments.pk = comments._gen_pk('story')
+    for i in range(superkeys):
+        comment = Comment({'user': 'eggs', 'body': 'y' * 100})
+        comment.pk = comment._gen_pk('story', 'comment%05d' % i)
+        comments.append(comment)
+    comments.save()
+
+
+@benchmark('supercolumn.iterate')
+def bench_sc_iterate(n):
+    _comments(50)
+    def op(i):
+        comments = Comments()
+        comments.pk = comments._gen_pk('story')
+        for comment in comments: pass
+    return op
+
+
+@benchmark('supercolumn.load_all')
+def bench_sc_load_all(n):
+    _comments(50)
+    def op(i):
+        comments = Comments()
+        comments.pk = comments._gen_pk('story')
+        comments.load_all()
+    return op
+
+
+@benchmark('view.append')
+def bench_view_append(n):
+    view, stories = StoryView(), [Story(FIELDS) for i in range(100)]
+    for story in stories: story.save()
+    return lambda i: view.append(stories[i % len(stories)])
+
+
+@benchmark('view.iterate')
+def bench_view_iterate(n):
+    view = StoryView()
+    view.extend([Story().load(key) for key in _stories(100)])
+    def op(i):
+        for story in StoryView(): pass
+    return op
+
+
+def _percentile(values, pct):
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def _peak_rss():
+    """Return the peak resident set size of this process, in KB."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run(setup, n, warmup=None):
+    """Run n operations of one benchmark, returning its results.
+
+    Python 2 can't trace allocations, so memory is reported as:
+    net_objects_per_op, the GC-tracked objects per operation still
+    alive after a collection, which only catches leaks and caches;
+    process_peak_rss_kb, the whole process's peak RSS so far; and
+    peak_rss_growth_kb, how much this benchmark raised that peak."""
+    op = setup(n)
+    for i in range(warmup is None and max(1, n / 10) or warmup):
+        op(i)
+
+    latencies, clock = [0.0] * n, time.time
+    gc.collect()
+    objects, peak = len(gc.get_objects()), _peak_rss()
+    start = clock()
+    for i in xrange(n):
+        begin = clock()
+        op(i)
+        latencies[i] = clock() - begin
+    total = clock() - start
+    gc.collect()
+    objects = len(gc.get_objects()) - objects
+    growth = None
+    if peak is not None:
+        growth = _peak_rss() - peak
+
+    latencies.sort()
+    return {'n': n, 'seconds': total, 'ops_per_sec': n / (total or 1e-9),
+            'mean': sum(latencies) / n, 'p50': _percentile(latencies, 50),
+            'p90': _percentile(latencies, 90),
+            'p99': _percentile(latencies, 99), 'max': latencies[-1],
+            'net_objects_per_op': float(objects) / n,
+            'process_peak_rss_kb': _peak_rss(),
+            'peak_rss_growth_kb': growth}
+
+
+def run_all(n=1000, names=None, latency=0.0, jitter=0.0, out=None):
+    """Run every benchmark (or those starting with one of names).
+
+    Each runs against a fresh MemoryServer with the given latency
+    model. Returns a dict suitable for saving as JSON."""
+    results = {}
+    for (name, setup) in BENCHMARKS:
+        if names and not [p for p in names if name.startswith(p)]:
+            continue
+        memory.add_pool(TABLE, memory.MemoryServer(latency, jitter))
+        results[name] = run(setup, n)
+        if out:
+            print >> out, _format(name, results[name])
+
+    return {'meta': {'time': time.time(), 'n': n, 'latency': latency,
+                     'jitter': jitter, 'python': platform.python_version(),
+                     'platform': platform.platform()},
+            'results': results}
+
+
+def compare(results, baseline):
+    """Return {name: new ops/sec / baseline ops/sec} for shared benchmarks."""
+    old = baseline['results']
+    return dict((name, r['ops_per_sec'] / old[name]['ops_per_sec'])
+                for (name, r) in results['results'].items() if name in old)
+
+
+def _format(name, result, ratio=None):
+    line = "%-24s %10.0f ops/s  p50 %8.1fus  p99 %8.1fus  " \
+        "%6.1f net obj/op" % \
+        (name, result['ops_per_sec'], result['p50'] * 1e6,
+         result['p99'] * 1e6, result['net_objects_per_op'])
+    if ratio is not None:
+        line += "  %+6.1f%%" % ((ratio - 1) * 100)
+    return line
+
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options] [BENCHMARK ...]")
+    parser.add_option("-n", "--iterations", type="int", default=1000)
+    parser.add_option("-l", "--latency", type="float", default=0.0,
+                      help="Seconds of simulated latency per RPC")
+    parser.add_option("-j", "--jitter", type="float", default=0.0,
+                      help="Seconds of random jitter per RPC")
+    parser.add_option("-o", "--output", help="File to save results to")
+    parser.add_option("-B", "--baseline",
+                      help="Results file to compare against")
+    (opts, args) = parser.parse_args(argv)
+
+    results = run_all(opts.iterations, args, opts.latency, opts.jitter,
+                      not opts.baseline and sys.stdout or None)
+    if opts.baseline:
+        ratios = compare(results, json.load(open(opts.baseline)))
+        for (name, setup) in BENCHMARKS:
+            if name in results['results']:
+                print _format(name, results['results'][name],
+                              ratios.get(name))
+    if opts.output:
+        out = open(opts.output, 'w')
+        try:
+            json.dump(results, out, indent=2)
+        finally:
+            out.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Chunked values
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+from StringIO import StringIO
+
+from cassandra.ttypes import Column, ColumnParent, ColumnPathOrParent, \
+    BatchMutation
+
+
+def chunk_name(index):
+    """Return the column name holding chunk index of a value."""
+    return "%08d" % index
+
+
+def manifest(chunks, size):
+    """Return the column value describing a chunked value."""
+    return "%d:%d" % (chunks, size)
+
+
+def parse_manifest(value):
+    """Return (chunks, size) from a manifest column value."""
+    (chunks, size) = value.split(':', 1)
+    return int(chunks), int(size)
+
+
+def write_chunks(client, table, family, key, value, chunk_size, ts):
+    """Write value, a string or file-like object, as chunk columns.
+
+    Only one chunk is held in memory at a time. Returns the manifest."""
+    if not hasattr(value, 'read'):
+        value = StringIO(str(value))
+
+    chunks, size = 0, 0
+    while True:
+        data = value.read(chunk_size)
+        if not data and chunks: break
+        client.batch_insert(table, BatchMutation(
+                key, {family: [Column(chunk_name(chunks), data, ts)]}), 0)
+        chunks, size = chunks + 1, size + len(data)
+        if not data: break
+    return manifest(chunks, size)
+
+
+def remove_chunks(client, table, family, key, start, stop, ts):
+    """Remove chunk columns start up to stop."""
+    for index in range(start, stop):
+        client.remove(table, key,
+                      ColumnPathOrParent(family, None, chunk_name(index)),
+                      ts, 0)
+
+
+class Blob(object):
+    """A read-only, file-like view of a chunked value.
+
+    Chunks are fetched page_size at a time as they're read, so the
+    whole value is never held in memory."""
+
+    def __init__(self, client, table, family, key, chunks, size,
+                 page_size=4):
+        self._client = client
+        self.table, self.family, self.key = table, family, key
+        self.chunks, self.size = chunks, size
+        self.page_size = page_size
+        self._next, self._pages, self._buf = 0, [], ''
+        self.closed = False
+
+    def __len__(self):
+        return self.size
+
+    def _fetch(self):
+        """Fetch the next page of chunks."""
+        if self._next >= self.chunks: return False
+        cols = self._client.get_slice(
+            self.table, self.key, ColumnParent(self.family),
+            chunk_name(self._next), chunk_name(self.chunks - 1), True,
+            self.page_size)
+        if not cols: return False
+        self._pages.extend([col.value for col in cols])
+        self._next += len(cols)
+        return True
+
+    def _chunk(self):
+        """Return the next chunk, or None at the end."""
+        if not self._pages and not self._fetch():
+            return None
+        return self._pages.pop(0)
+
+    def __iter__(self):
+        """Iterate over the chunks of the value."""
+        if self._buf:
+            buf, self._buf = self._buf, ''
+            yield buf
+        while True:
+            chunk = self._chunk()
+            if chunk is None: return
+            yield chunk
+
+    def read(self, size=-1):
+        """Read up to size bytes, or everything left if size is negative."""
+        parts, have = [self._buf], len(self._buf)
+        while size < 0 or have < size:
+            chunk = self._chunk()
+            if chunk is None: break
+            parts.append(chunk)
+            have += len(chunk)
+
+        data = ''.join(parts)
+        if size < 0:
+            self._buf = ''
+            return data
+        self._buf = data[size:]
+        return data[:size]
+
+    def close(self):
+        self._pages, self._buf = [], ''
+        self.closed = True
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: RPC budgets
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import os
+import sys
+import random
+import threading
+import warnings
+
+from lazyboy import instrument
+from lazyboy.concurrency import ScopeStack
+from lazyboy.exceptions import ErrorBudgetExceeded
+
+_SCOPES = ScopeStack()
+
+_PACKAGE = os.path.dirname(os.path.abspath(__file__))
+
+def _module_path(path):
+    return os.path.splitext(os.path.abspath(path))[0]
+
+# Frames which never count as a call site
+_INTERNAL = [os.path.join(_PACKAGE, name) for name in
+             ('connection', 'instrument', 'budget', 'concurrency')] + \
+             [_module_path(threading.__file__)]
+
+
+def _call_site():
+    """Return "file:line (function)" for the code which made an RPC.
+
+    That's the innermost frame outside lazyboy, or failing that (in a
+    worker thread) the lazyboy code which made the call."""
+    frame, inner = sys._getframe(2), None
+    while frame is not None:
+        path = _module_path(frame.f_code.co_filename)
+        internal = path in _INTERNAL
+        if not internal and not path.startswith(_PACKAGE):
+            break
+        if inner is None and not internal:
+            inner = frame
+        frame = frame.f_back
+    frame = frame or inner
+    if frame is None:
+        return None
+    return "%s:%d (%s)" % (frame.f_code.co_filename, frame.f_lineno,
+                           frame.f_code.co_name)
+
+
+class RPCBudget(instrument.Hook):
+    """Counts the RPCs made inside a block, by method, table and call site.
+
+    Use it as a context manager, or decorate a function with it to
+    count each call separately:
+
+        with RPCBudget(limit=10) as budget:
+            for story in StoryView(): ...
+        print budget.report()
+
+    When more than limit RPCs are made, or any method goes over its
+    count in limits, or one identical call is made more than
+    max_repeats times, the budget is exceeded. With action 'raise',
+    the RPC which went over raises ErrorBudgetExceeded; with 'warn', a
+    RuntimeWarning is issued once; with None, it's only counted.
+
+    Calls made from this thread, and from WorkerPool threads running
+    calls it submitted, are counted. With sample below 1.0, the budget
+    only counts that fraction of the blocks it's used on."""
+
+    def __init__(self, limit=None, limits=None, max_repeats=None,
+                 action='raise', sample=1.0):
+        if action not in ('raise', 'warn', None):
+            raise ValueError("Unknown action %r" % (action,))
+        self.limit, self.limits = limit, limits or {}
+        self.max_repeats, self.action = max_repeats, action
+        self.sample = sample
+        self.active, self.exceeded = False, []
+        self.total = 0
+        self.methods, self.tables, self.sites = {}, {}, {}
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        if self.sample >= 1.0 or random.random() < self.sample:
+            self.active = True
+            instrument.add_hook(self)
+            _SCOPES.push(self)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if self.active:
+            _SCOPES.pop(self)
+            instrument.remove_hook(self)
+        return False
+
+    def __call__(self, func):
+        """Decorate func to run it inside a fresh copy of this budget."""
+        def wrapped(*args, **kwargs):
+            budget = self.__class__(self.limit, self.limits,
+                                    self.max_repeats, self.action,
+                                    self.sample)
+            budget.__enter__()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                budget.__exit__(None, None, None)
+        wrapped.__name__, wrapped.__doc__ = func.__name__, func.__doc__
+        return wrapped
+
+    def _count(self, counts, key):
+        counts[key] = counts.get(key, 0) + 1
+        return counts[key]
+
+    def before(self, call):
+        if self not in _SCOPES.stack():
+            return
+
+        site = _call_site()
+        self._lock.acquire()
+        try:
+            self.total += 1
+            calls = self._count(self.methods, call.method)
+            self._count(self.tables, call.table)
+            self._count(self.sites, site)
+            same = (call.method, repr(call.args))
+            if same not in self._calls:
+                self._calls[same] = [call.table, call.key, 0, site]
+            self._calls[same][2] += 1
+            repeats = self._calls[same][2]
+        finally:
+            self._lock.release()
+
+        if self.limit is not None and self.total > self.limit:
+            self._exceeded("%d RPCs made, over the budget of %d" % \
+                               (self.total, self.limit))
+        if call.method in self.limits and calls > self.limits[call.method]:
+            self._exceeded("%d %s calls made, over the budget of %d" % \
+                               (calls, call.method, self.limits[call.method]))
+        if self.max_repeats is not None and repeats > self.max_repeats:
+            self._exceeded("%s(%s, %s) called %d times, at %s" % \
+                               (call.method, call.table, call.key, repeats,
+                                site))
+
+    def _exceeded(self, message):
+        self.exceeded.append(message)
+        if self.action == 'raise':
+            raise ErrorBudgetExceeded(message)
+        if self.action == 'warn' and len(self.exceeded) == 1:
+            warnings.warn(message, RuntimeWarning, 4)
+
+    def repeated(self):
+        """Return [(method, table, key, count, site)] for repeated calls."""
+        self._lock.acquire()
+        try:
+            return sorted([(method, table, key, count, site)
+                           for ((method, args), (table, key, count, site))
+                           in self._calls.items() if count > 1],
+                          key=lambda r: -r[3])
+        finally:
+            self._lock.release()
+
+    def report(self):
+        """Return the counts as a dict."""
+        return {'total': self.total, 'methods': dict(self.methods),
+                'tables': dict(self.tables), 'sites': dict(self.sites),
+                'repeated': self.repeated(), 'exceeded': list(self.exceeded)}
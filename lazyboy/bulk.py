@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Bulk loading
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import csv
+import sys
+import time
+import threading
+import Queue
+from optparse import OptionParser
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import lazyboy.connection as connection
+from lazyboy.supercolumnfamily import SuperColumnFamily
+from lazyboy.export import decode_row, encode_name, encode_value
+from lazyboy.exceptions import ErrorInvalidField, ErrorMissingField
+
+
+def read_jsonl(stream):
+    """Yield a dict for each line of JSON in stream.
+
+    Binary values written by lazyboy.export are decoded. Lines which
+    aren't a JSON object are yielded as-is, so the Loader rejects them."""
+    for line in stream:
+        if not line.strip(): continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line
+            continue
+        if isinstance(record, dict):
+            record = decode_row(record)
+        yield record
+
+
+def read_csv(stream):
+    """Yield a dict for each row of a CSV file with a header row."""
+    return csv.DictReader(stream)
+
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv}
+
+
+class Loader(object):
+    """Saves records into instances of a ColumnFamily class.
+
+    Each record is a dict of columns. The object's key is taken from
+    the `key' field, and for a SuperColumnFamily, its superkey from the
+    `superkey' field. Records are saved by worker threads, one
+    batch_insert per row; reading blocks while backlog records are
+    waiting, so input is never read faster than it can be written.
+
+    Records which can't be saved are written, with the error, as JSON
+    lines to dead_letter."""
+
+    def __init__(self, family, key='key', superkey='superkey', workers=4,
+                 backlog=1000, dead_letter=None):
+        self.family = family
+        self.key, self.superkey = key, superkey
+        self.workers, self.backlog = workers, backlog
+        self.dead_letter = dead_letter
+        self._lock = threading.Lock()
+        self._stats = {'read': 0, 'written': 0, 'rejected': 0,
+                       'start': None}
+
+    def _build(self, record):
+        """Return an unsaved object holding record."""
+        if not isinstance(record, dict):
+            raise ErrorInvalidField("Record isn't a dict")
+        record = dict(record)
+        if not record.get(self.key):
+            raise ErrorMissingField("Record has no %s" % (self.key,))
+
+        obj = self.family()
+        if issubclass(self.family, SuperColumnFamily):
+            if not record.get(self.superkey):
+                raise ErrorMissingField("Record has no %s" % \
+                                            (self.superkey,))
+            obj.pk = obj._gen_pk(record.pop(self.key),
+                                 record.pop(self.superkey))
+        else:
+            obj.pk = obj._gen_pk(record.pop(self.key))
+
+        obj.update(record)
+        return obj
+
+    def _count(self, stat):
+        self._lock.acquire()
+        try:
+            self._stats[stat] += 1
+        finally:
+            self._lock.release()
+
+    def _reject(self, record, error):
+        """Count a rejected record, and write it to dead_letter.
+
+        Bytes which aren't UTF-8 are written as lazyboy.export does."""
+        if isinstance(record, dict):
+            record = dict((encode_name(k), encode_value(v))
+                          for (k, v) in record.items())
+        else:
+            record = encode_value(record)
+        self._lock.acquire()
+        try:
+            self._stats['rejected'] += 1
+            if self.dead_letter:
+                self.dead_letter.write(json.dumps(
+                        {'record': record, 'error': repr(error)}) + "\n")
+        finally:
+            self._lock.release()
+
+    def _work(self, queue):
+        while True:
+            record = queue.get()
+            if record is None: return
+            try:
+                self._build(record).save()
+                self._count('written')
+            except Exception, e:
+                try:
+                    self._reject(record, e)
+                except Exception, e:
+                    # Keep draining the queue, or load() would block.
+                    print >> sys.stderr, "Couldn't record rejected " \
+                        "record: %r" % (e,)
+
+    def stats(self):
+        """Return counts of records read, written and rejected."""
+        stats = dict(self._stats)
+        elapsed = time.time() - (stats.pop('start') or time.time())
+        stats['seconds'] = elapsed
+        stats['rate'] = stats['written'] / max(elapsed, 1e-6)
+        return stats
+
+    def load(self, records, progress=None, every=1000):
+        """Save every record, returning stats() when done.
+
+        If given, progress is called with stats() every `every'
+        records, and once at the end."""
+        self._stats['start'] = time.time()
+        queue = Queue.Queue(self.backlog)
+        threads = []
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(queue,),
+                                      name="lazyboy-bulk-%d" % n)
+            thread.setDaemon(True)
+            thread.start()
+            threads.append(thread)
+
+        try:
+            for record in records:
+                queue.put(record)
+                self._count('read')
+                if progress and self._stats['read'] % every == 0:
+                    progress(self.stats())
+        finally:
+            for thread in threads:
+                queue.put(None)
+            for thread in threads:
+                thread.join()
+
+        if progress:
+            progress(self.stats())
+        return self.stats()
+
+
+def _import(path):
+    """Return the object named by `module.path:name'."""
+    (module, name) = path.split(':', 1)
+    return getattr(__import__(module, {}, {}, [name]), name)
+
+
+def _print_progress(stats):
+    print >> sys.stderr, "%(read)d read, %(written)d written, " \
+        "%(rejected)d rejected, %(rate).1f rows/s" % stats
+
+
+def main(argv=None):
+    parser = OptionParser(
+        usage="%prog [options] module.path:ClassName [FILE]")
+    parser.add_option("-f", "--format", choices=READERS.keys(),
+                      default="jsonl", help="jsonl or csv (default jsonl)")
+    parser.add_option("-s", "--servers", default="localhost:9160",
+                      help="Comma-separated host:port list")
+    parser.add_option("-k", "--key", default="key",
+                      help="Field holding the row key")
+    parser.add_option("-K", "--superkey", default="superkey",
+                      help="Field holding the superkey")
+    parser.add_option("-w", "--workers", type="int", default=8)
+    parser.add_option("-b", "--backlog", type="int", default=1000,
+                      help="Records to buffer ahead of the workers")
+    parser.add_option("-d", "--dead-letter", dest="dead_letter",
+                      help="File to write rejected records to")
+    (opts, args) = parser.parse_args(argv)
+    if not args or len(args) > 2:
+        parser.error("Expected a class and at most one file")
+
+    family = _import(args[0])
+    connection.add_pool(family._key['table'], opts.servers.split(','))
+    stream = len(args) > 1 and open(args[1]) or sys.stdin
+    dead_letter = opts.dead_letter and open(opts.dead_letter, 'a')
+
+    loader = Loader(family, opts.key, opts.superkey, opts.workers,
+                    opts.backlog, dead_letter)
+    stats = loader.load(READERS[opts.format](stream), _print_progress)
+    if dead_letter:
+        dead_letter.close()
+    return int(bool(stats['rejected']))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
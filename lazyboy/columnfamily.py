@@ -8,11 +8,19 @@
 
 import time
 
-from cassandra.ttypes import Column, ColumnParent, BatchMutation
+from cassandra.ttypes import Column, ColumnParent, ColumnPath, \
+    ColumnPathOrParent, BatchMutation
 
 from lazyboy.base import CassandraBase
+from lazyboy import blob, identity
+from lazyboy.concurrency import pmap, submit
 from lazyboy.exceptions import *
 
+def _column_size(col):
+    """Return the approximate size of a Column, in bytes."""
+    return len(col.name) + len(col.value) + 8
+
+
 class ColumnFamily(CassandraBase, dict):
     # The template to use for the PK
     _key = {}
@@ -20,14 +28,35 @@ class ColumnFamily(CassandraBase, dict):
     # A tuple of items which must be present for the object to be valid
     _required = ()
 
+    # A tuple of items to maintain value -> key index rows for
+    _indexes = ()
+
+    # The family to keep index rows in; required with _indexes, and must
+    # not be the object's own family, or scans would see index rows
+    _index_family = None
+
+    # A lazyboy.writebehind.WriteBehind to queue saves on, if any; not
+    # supported with _indexes or _blobs
+    _write_behind = None
+
+    # A tuple of items holding large values, stored in chunks
+    _blobs = ()
+
+    # The family to keep chunks in; required with _blobs, and must not be
+    # the object's own family, or scans would see chunk rows
+    _blob_family = None
+
+    # The size of each chunk of a large value
+    _blob_chunk_size = 2 ** 18
+
     def __init__(self, *args, **kwargs):
         super(ColumnFamily, self).__init__()
 
         # Initialize
         self._columns, self._original = {}, []
         self._modified, self._deleted = {}, {}
+        self._pending_blobs = {}
 
-        self.pk = self._gen_pk()
         if args or kwargs:
             self.update(*args, **kwargs)
 
@@ -46,6 +75,7 @@ class ColumnFamily(CassandraBase, dict):
         self._original = []
         self._columns = {}
         self._modified, self._deleted = {}, {}
+        self._pending_blobs = {}
 
     def update(self, arg=None, **kwargs):
         """Update the object as with dict.update"""
@@ -60,6 +90,13 @@ class ColumnFamily(CassandraBase, dict):
 
     def __setitem__(self, item, value):
         """Set an item, storing it into the _columns backing store."""
+        if item in self._blobs:
+            # Written in chunks on save; value may be a file.
+            super(ColumnFamily, self).__setitem__(item, value)
+            self._pending_blobs[item] = value
+            if item in self._deleted: del self._deleted[item]
+            return
+
         if value.__class__ is unicode:
             value = value.encode('utf-8')
         value = str(value)
@@ -82,49 +119,195 @@ class ColumnFamily(CassandraBase, dict):
 
     def __delitem__(self, item):
         super(ColumnFamily, self).__delitem__(item)
-        del self._columns[item]
+        self._pending_blobs.pop(item, None)
+        self._columns.pop(item, None)
         self._deleted[item] = True
         if item in self._modified: del self._modified[item]
 
     def load(self, key):
-        """Load this ColumnFamily from primary key"""
-        self._clean()
-        self.pk = self._gen_pk(key)
+        """Load this ColumnFamily from primary key
+
+        Inside an IdentityMap, an object already loaded for key is
+        returned instead, so use the return value."""
+        imap = identity.current()
+        pk = self._gen_pk(key)
+        if imap is not None:
+            loaded = imap.get(pk)
+            if loaded is not None:
+                return loaded
 
+        self._clean()
+        self.pk = pk
         self._original = self._get_cas().get_slice(
             self.pk.table, self.pk.key, ColumnParent(self.pk.family),
             '', '', True, 100)
         self.revert()
+        if imap is not None:
+            imap.add(self)
         return self
 
+    def load_async(self, key):
+        """Load this ColumnFamily on the shared pool, returning a Future."""
+        return submit(self.load, key)
+
+    def save_async(self):
+        """Save this ColumnFamily on the shared pool, returning a Future."""
+        return submit(self.save)
+
     def save(self):
         if not self.valid():
             raise ErrorMissingField("Missing required field(s):",
                                         self.missing())
 
+        if self._write_behind is not None and (self._indexes or self._blobs):
+            raise ErrorNotSupported(
+                "Write-behind saves can't maintain indexes or blobs")
+
         client = self._get_cas()
+        index_family = self._indexes and self._family_for('_index_family')
+        if self._blobs:
+            self._save_blobs(client, self._family_for('_blob_family'))
+
+        original = [c.name for c in self._original]
+        deleted = [dlt for dlt in self._deleted.keys() if dlt in original]
+        changed = [self._columns[k] for k in self._modified.keys() \
+                       if self._columns.has_key(k) and self._columns[k].value != None]
+
+        if self._write_behind is not None:
+            now = time.time()
+            self._write_behind.put(
+                self.pk, [Column(c.name, c.value, c.timestamp) \
+                              for c in changed],
+                dict((dlt, now) for dlt in deleted))
+            changed, deleted = [], []
+
         # Delete items
-        deleted = self._deleted.keys()
         [client.remove(self.pk.table, self.pk.key,
                        ColumnPathOrParent(self.pk.family, None, dlt),
-                       time.time(), 0) \
-             for dlt in deleted if dlt in self._original]
+                       time.time(), 0) for dlt in deleted]
 
         # Update items
-        changed = [self._columns[k] for k in self._modified.keys() \
-                       if self._columns.has_key(k) and self._columns[k].value != None]
         if changed:
-            client.batch_insert(
-                self.pk.table,
-                BatchMutation(
-                    self.pk.key, {self.pk.family: changed}), 0)
+            self._write_batches(
+                lambda cols: self._get_cas().batch_insert(
+                    self.pk.table,
+                    BatchMutation(self.pk.key, {self.pk.family: cols}), 0),
+                self._split_batch(changed, _column_size),
+                lambda cols: [c.name for c in cols])
+
+        if self._indexes:
+            self._save_indexes(client, index_family)
+
+        self._original = [Column(c.name, c.value, c.timestamp) \
+                              for c in self._columns.values()]
+        self._modified, self._deleted = {}, {}
         return self
 
+    def _blob_key(self, field):
+        """Return the key of the row holding chunks of field."""
+        return "%s:%s" % (self.pk.key, field)
+
+    def _save_blobs(self, client, family):
+        """Write pending large values in chunks, and drop deleted ones.
+
+        The item itself is saved as a manifest of the chunks."""
+        original = dict((c.name, c.value) for c in self._original \
+                            if c.name in self._blobs)
+        ts = time.time()
+
+        for (field, value) in self._pending_blobs.items():
+            man = blob.write_chunks(client, self.pk.table, family,
+                                    self._blob_key(field), value,
+                                    self._blob_chunk_size, ts)
+            if field in original:
+                blob.remove_chunks(
+                    client, self.pk.table, family, self._blob_key(field),
+                    blob.parse_manifest(man)[0],
+                    blob.parse_manifest(original[field])[0], ts)
+            super(ColumnFamily, self).__setitem__(field, man)
+            self._columns[field] = Column(field, man, ts)
+            self._modified[field] = True
+            del self._pending_blobs[field]
+
+        for field in self._deleted.keys():
+            if field in original:
+                blob.remove_chunks(
+                    client, self.pk.table, family, self._blob_key(field),
+                    0, blob.parse_manifest(original[field])[0], ts)
+
+    def open_blob(self, field, page_size=4):
+        """Return a file-like object reading a saved large value."""
+        if field not in self._blobs:
+            raise ErrorInvalidField("%s is not a blob" % (field,))
+        (chunks, size) = blob.parse_manifest(self[field])
+        return blob.Blob(self._get_cas(), self.pk.table,
+                         self._family_for('_blob_family'),
+                         self._blob_key(field), chunks, size, page_size)
+
+    def _family_for(self, attr):
+        """Return the family named by attr, which can't be our own."""
+        family = getattr(self, attr)
+        if not family or family == self.pk.family:
+            raise ErrorNotSupported(
+                "%s.%s must name a family other than %s" % \
+                    (self.__class__.__name__, attr, self.pk.family))
+        return family
+
+    def _index_row(self, field, value):
+        """Return the key of the index row for field = value."""
+        return "%s:%s:%s" % (self.pk.family, field, value)
+
+    def _save_indexes(self, client, family):
+        """Point index rows at this object for changed indexed fields."""
+        original = dict((col.name, col.value) for col in self._original)
+        ts = time.time()
+
+        for field in self._indexes:
+            if field not in self._modified and field not in self._deleted:
+                continue
+            old, new = original.get(field), self.get(field)
+            if old == new: continue
+
+            if new is not None:
+                client.batch_insert(
+                    self.pk.table,
+                    BatchMutation(self._index_row(field, new),
+                                  {family: [Column(self.pk.key, self.pk.key,
+                                                   ts)]}), 0)
+            if old is not None:
+                client.remove(self.pk.table, self._index_row(field, old),
+                              ColumnPathOrParent(family, None, self.pk.key),
+                              ts, 0)
+
+    def find_keys(self, field, value, start='', count=100):
+        """Return up to count keys of objects where field = value.
+
+        Keys are returned in order; pass the last one as start to get
+        the next page."""
+        if field not in self._indexes:
+            raise ErrorInvalidField("%s is not indexed" % (field,))
+
+        family = self._family_for('_index_family')
+        fudge = int(bool(start))
+        cols = self._get_cas().get_slice(
+            self.pk.table, self._index_row(field, value),
+            ColumnParent(family),
+            start, '', True, count + fudge)
+        if fudge and cols and cols[0].name == start:
+            cols = cols[1:]
+        return [col.name for col in cols[:count]]
+
+    def find(self, field, value, start='', count=100):
+        """Return up to count objects where field = value."""
+        return pmap(lambda key: self.__class__().load(key),
+                    self.find_keys(field, value, start, count))
+
     def revert(self):
         "Revert changes, restoring to the state we were in when loaded"
         for c in self._original:
             super(ColumnFamily, self).__setitem__(c.name, c.value)
-            self._columns[c.name] = c
+            # Copy, so changes don't touch the original
+            self._columns[c.name] = Column(c.name, c.value, c.timestamp)
 
         self._modified, self._deleted = {}, {}
 
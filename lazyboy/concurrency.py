@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Concurrency
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import sys
+import time
+import atexit
+import threading
+import Queue
+
+
+# The number of worker threads in the shared pool
+_POOL_SIZE = 8
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+# Every ScopeStack, so workers can carry them over
+_SCOPE_STACKS = []
+
+
+class ScopeStack(object):
+    """A per-thread stack of active scopes, such as identity maps.
+
+    Calls submitted to a WorkerPool run with the submitting thread's
+    innermost scope of every stack pushed in the worker."""
+
+    def __init__(self):
+        self._local = threading.local()
+        _SCOPE_STACKS.append(self)
+
+    def stack(self):
+        """Return this thread's list of scopes, innermost last."""
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self):
+        """Return the innermost scope in this thread, or None."""
+        stack = self.stack()
+        if not stack:
+            return None
+        return stack[-1]
+
+    def push(self, scope):
+        self.stack().append(scope)
+
+    def pop(self, scope):
+        self.stack().remove(scope)
+
+
+def _current_scopes():
+    """Return [(stack, scope)] for this thread's innermost scopes."""
+    return [(stack, stack.current()) for stack in _SCOPE_STACKS
+            if stack.current() is not None]
+
+
+class Future(object):
+    """The pending result of a call running on a WorkerPool."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result, self._error = None, None
+
+    def _set_result(self, result):
+        self._result = result
+        self._done.set()
+
+    def _set_error(self, error):
+        self._error = error
+        self._done.set()
+
+    def done(self):
+        """Return a boolean indicating whether the call has finished."""
+        return self._done.isSet()
+
+    def result(self, timeout=None):
+        """Wait for the call to finish and return its result.
+
+        If the call raised an exception, it is re-raised here."""
+        self._done.wait(timeout)
+        if not self._done.isSet():
+            raise RuntimeError("Timed out waiting for result")
+        if self._error:
+            raise self._error[0], self._error[1], self._error[2]
+        return self._result
+
+
+class WorkerPool(object):
+    """A fixed set of long-lived threads which run submitted calls.
+
+    Threads are kept around so the per-thread connections made by
+    lazyboy.connection.get_pool are reused between calls. Those are
+    kept per thread, not per thread name, so name only labels the
+    threads."""
+
+    def __init__(self, size=_POOL_SIZE, name="lazyboy-worker"):
+        self.size = size
+        self._queue = Queue.Queue()
+        self._threads = []
+        for i in range(size):
+            thread = threading.Thread(target=self._work,
+                                      name="%s-%d" % (name, i))
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None: return
+            future, func, args, kwargs, scopes = task
+            for (stack, scope) in scopes: stack.push(scope)
+            try:
+                try:
+                    future._set_result(func(*args, **kwargs))
+                except:
+                    future._set_error(sys.exc_info())
+            finally:
+                for (stack, scope) in scopes: stack.pop(scope)
+
+    def in_worker(self):
+        """Return a boolean indicating whether we're running in this pool."""
+        return threading.currentThread() in self._threads
+
+    def submit(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) on a worker, returning a Future."""
+        future = Future()
+        if self.in_worker():
+            # Waiting on our own pool from inside it could deadlock.
+            try:
+                future._set_result(func(*args, **kwargs))
+            except:
+                future._set_error(sys.exc_info())
+            return future
+
+        self._queue.put((future, func, args, kwargs, _current_scopes()))
+        return future
+
+    def map(self, func, items):
+        """Return [func(item) for item in items], run in parallel."""
+        return [future.result() for future in
+                [self.submit(func, item) for item in items]]
+
+    def shutdown(self, wait=False):
+        """Stop the worker threads once queued calls have run.
+
+        With wait, block until they have stopped."""
+        threads, self._threads = self._threads, []
+        for thread in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+def set_workers(size):
+    """Set the number of threads in the shared WorkerPool."""
+    global _POOL, _POOL_SIZE
+    _POOL_LOCK.acquire()
+    try:
+        _POOL_SIZE = size
+        if _POOL is not None:
+            _POOL.shutdown()
+            _POOL = None
+    finally:
+        _POOL_LOCK.release()
+
+
+def get_workers():
+    """Return the shared WorkerPool, creating it if needed."""
+    global _POOL
+    _POOL_LOCK.acquire()
+    try:
+        if _POOL is None:
+            _POOL = WorkerPool(_POOL_SIZE)
+        return _POOL
+    finally:
+        _POOL_LOCK.release()
+
+
+def _shutdown():
+    """Stop the shared pool's threads before the interpreter exits."""
+    if _POOL is not None:
+        _POOL.shutdown(True)
+
+atexit.register(_shutdown)
+
+
+def submit(func, *args, **kwargs):
+    """Run func(*args, **kwargs) on the shared pool, returning a Future."""
+    return get_workers().submit(func, *args, **kwargs)
+
+
+def wait_all(futures, timeout=None):
+    """Wait for every future, returning their results in order.
+
+    If any call raised an exception, the first is re-raised once all
+    of them have finished. A timeout applies to the whole wait."""
+    futures = list(futures)
+    end = timeout is not None and time.time() + timeout
+    for future in futures:
+        if timeout is None:
+            future._done.wait()
+        else:
+            future._done.wait(max(0, end - time.time()))
+    return [future.result(0) for future in futures]
+
+
+def pmap(func, items):
+    """Apply func to every item on the shared pool, preserving order."""
+    items = list(items)
+    if len(items) < 2:
+        return map(func, items)
+    return get_workers().map(func, items)
@@ -8,7 +8,9 @@
 #
 
 import inspect
-import random, os
+import random, os, sys, time
+import socket
+import thread
 import threading
 
 from cassandra import *
@@ -17,34 +19,270 @@ from thrift.transport import TTransport
 from thrift.transport import TSocket
 from thrift.protocol import TBinaryProtocol
 
-from lazyboy.exceptions import ErrorCassandraClientNotFound
+try:
+    from thrift.protocol import TCompactProtocol
+except ImportError:
+    TCompactProtocol = None
+
+try:
+    from thrift.protocol import fastbinary
+except ImportError:
+    fastbinary = None
+
+from lazyboy.exceptions import ErrorCassandraClientNotFound, \
+    ErrorNotSupported
+from lazyboy import instrument
+from lazyboy.shard import HashRing
+from lazyboy.concurrency import pmap
 
 
 _SERVERS = {}
 _CLIENTS = {}
+_LIMITERS = {}
+_STACKS = {}
+_RINGS = {}
+
+
+def add_pool(name, servers, limiter=None, stack=None):
+    """Add a connection
+
+    servers is a list of "host:port" strings, or of objects with a
+    client() method returning a Thrift client, like
+    lazyboy.memory.MemoryServer.
 
+    Pass a Limiter to cap how many requests to the pool, from every
+    thread, may be in flight at once; by default there's no cap. Pass
+    a Stack to change the transport and protocol.
 
-def add_pool(name, servers):
-    """Add a connection"""
+    Adding a pool under a name already in use replaces it."""
     _SERVERS[name] = servers
+    _LIMITERS[name] = limiter
+    _STACKS[name] = stack or Stack()
+    _forget_clients(name)
+
+
+def add_sharded_pool(name, shards, vnodes=100, limiter=None, stack=None):
+    """Add a pool spread over several clusters.
+
+    shards maps a shard name to its list of servers. Each shard
+    becomes a pool named "name/shard", and rows are assigned to shards
+    by consistent hashing of their keys; see lazyboy.shard.
+
+    limiter is called with no arguments for each shard, and should
+    return a Limiter (Limiter itself will do), so a slow shard only
+    holds back its own requests; by default there's no cap."""
+    for (shard, servers) in shards.items():
+        add_pool("%s/%s" % (name, shard), servers,
+                 limiter and limiter(), stack)
+    _RINGS[name] = HashRing(shards.keys(), vnodes)
+    _forget_clients(name)
+
+
+def _forget_clients(name):
+    """Drop every thread's cached client for a pool."""
+    for key in _CLIENTS.keys():
+        if key[2] == name:
+            _CLIENTS.pop(key, None)
+
+
+def get_stack(name):
+    """Return the Stack of a pool."""
+    return _STACKS.get(name)
+
+
+def get_ring(name):
+    """Return the HashRing of a sharded pool, or None."""
+    return _RINGS.get(name)
+
+
+def get_limiter(name):
+    """Return the Limiter for a pool."""
+    return _LIMITERS.get(name)
 
 
 def get_pool(name):
-    key = str(os.getpid()) + threading.currentThread().getName() + name
+    # Clients aren't thread-safe, so keep one per thread. Thread names
+    # needn't be unique, so key by thread identity.
+    key = (os.getpid(), thread.get_ident(), name)
     if key in _CLIENTS:
         return _CLIENTS[key]
 
+    if name in _RINGS:
+        _CLIENTS[key] = ShardedClient(name, _RINGS[name])
+        return _CLIENTS[key]
+
     try:
-        _CLIENTS[key] = Client(_SERVERS[name])
+        _CLIENTS[key] = Client(_SERVERS[name], _LIMITERS.get(name),
+                               _STACKS.get(name))
         return _CLIENTS[key]
     except Exception, e:
         raise ErrorCassandraClientNotFound
 
 
+class Limiter(object):
+    """Caps the number of requests in flight, adapting the cap as it goes.
+
+    The limit grows by about one for every limit requests which finish
+    while it's reached, and shrinks by backoff when a request fails or
+    takes more than tolerance times the usual latency of its method, a
+    moving average kept per method (AIMD). It shrinks at most once per
+    round trip: requests which were already in flight when it last
+    shrank don't shrink it again. Requests over the limit wait for one
+    in flight to finish."""
+
+    def __init__(self, initial=32, minimum=1, maximum=1024, backoff=0.9,
+                 tolerance=2.0, smoothing=0.1):
+        self.limit = float(initial)
+        self.minimum, self.maximum = minimum, maximum
+        self.backoff, self.tolerance = backoff, tolerance
+        self.smoothing = smoothing
+        self.in_flight = 0
+        self.latencies = {}
+        self.queue_delay, self.max_queue_delay = 0.0, 0.0
+        self._backed_off = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Wait until a request may be sent."""
+        start = time.time()
+        self._cond.acquire()
+        try:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            delay = time.time() - start
+            self.queue_delay = self.queue_delay * 0.9 + delay * 0.1
+            self.max_queue_delay = max(self.max_queue_delay, delay)
+        finally:
+            self._cond.release()
+
+    def release(self, latency, failed=False, method=None):
+        """Record a finished request, adjusting the limit."""
+        now = time.time()
+        self._cond.acquire()
+        try:
+            self.in_flight -= 1
+            usual = self.latencies.get(method)
+            slow = usual is not None and latency > usual * self.tolerance
+            if usual is None:
+                self.latencies[method] = latency
+            elif not failed:
+                self.latencies[method] = usual + \
+                    (latency - usual) * self.smoothing
+
+            if failed or slow:
+                if now - latency >= self._backed_off:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._backed_off = now
+            elif self.in_flight + 1 >= int(self.limit):
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+    def stats(self):
+        """Return the current limit, requests in flight and queueing delay."""
+        return {'limit': int(self.limit), 'in_flight': self.in_flight,
+                'queue_delay': self.queue_delay,
+                'max_queue_delay': self.max_queue_delay}
+
+
+class Stack(object):
+    """The transport and protocol a Client talks to its servers with.
+
+    transport is 'buffered' or 'framed', and protocol 'binary' or
+    'compact'; both must match the server. rbuf_size is the buffered
+    transport's read buffer, in bytes. nodelay sets TCP_NODELAY,
+    keepalive sets SO_KEEPALIVE, and sndbuf and rcvbuf set the socket
+    buffer sizes. timeout is in milliseconds.
+
+    The binary protocol uses Thrift's C codec when accelerate is set
+    and it's available; describe() says whether it is."""
+
+    def __init__(self, transport='buffered', protocol='binary',
+                 rbuf_size=4096, nodelay=False, keepalive=False,
+                 sndbuf=None, rcvbuf=None, timeout=None, accelerate=True):
+        if transport not in ('buffered', 'framed'):
+            raise ValueError("Unknown transport %r" % (transport,))
+        if protocol not in ('binary', 'compact'):
+            raise ValueError("Unknown protocol %r" % (protocol,))
+        if protocol == 'compact' and TCompactProtocol is None:
+            raise ErrorNotSupported(
+                "This version of Thrift has no compact protocol")
+        self.transport, self.protocol = transport, protocol
+        self.rbuf_size, self.timeout = rbuf_size, timeout
+        self.nodelay, self.keepalive = nodelay, keepalive
+        self.sndbuf, self.rcvbuf = sndbuf, rcvbuf
+        self.accelerate = accelerate
+
+    def build(self, host, port):
+        """Return (socket, transport, protocol) for a server."""
+        sock = TSocket.TSocket(host, int(port))
+        if self.timeout is not None:
+            sock.setTimeout(self.timeout)
+
+        if self.transport == 'framed':
+            transport = TTransport.TFramedTransport(sock)
+        else:
+            transport = TTransport.TBufferedTransport(sock, self.rbuf_size)
+
+        if self.protocol == 'compact':
+            protocol = (self.accelerate and getattr(
+                    TCompactProtocol, 'TCompactProtocolAccelerated', None) or
+                        TCompactProtocol.TCompactProtocol)(transport)
+        elif self.accelerate:
+            protocol = TBinaryProtocol.TBinaryProtocolAccelerated(transport)
+        else:
+            protocol = TBinaryProtocol.TBinaryProtocol(transport)
+        return sock, transport, protocol
+
+    def tune(self, sock):
+        """Apply socket options to a newly opened TSocket."""
+        handle = getattr(sock, 'handle', None)
+        if handle is None:
+            return
+        options = ((socket.IPPROTO_TCP, socket.TCP_NODELAY, self.nodelay),
+                   (socket.SOL_SOCKET, socket.SO_KEEPALIVE, self.keepalive),
+                   (socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf),
+                   (socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf))
+        for (level, option, value) in options:
+            if value:
+                handle.setsockopt(level, option, int(value))
+
+    def accelerated(self, transport, protocol):
+        """Return (accelerated, reason) for a built transport and protocol."""
+        if not self.accelerate:
+            return False, "acceleration is turned off"
+        if fastbinary is None:
+            return False, "thrift.protocol.fastbinary isn't installed"
+        if not protocol.__class__.__name__.endswith('Accelerated'):
+            return False, "the %s protocol has no C codec here" % \
+                (self.protocol,)
+        readable = getattr(TTransport, 'CReadableTransport', None)
+        if readable is None or not isinstance(transport, readable):
+            return False, "the %s transport can't feed the C codec" % \
+                (self.transport,)
+        return True, "using the C codec"
+
+    def describe(self):
+        """Return the settings as a dict."""
+        return {'transport': self.transport, 'protocol': self.protocol,
+                'rbuf_size': self.rbuf_size, 'nodelay': self.nodelay,
+                'keepalive': self.keepalive, 'sndbuf': self.sndbuf,
+                'rcvbuf': self.rcvbuf, 'timeout': self.timeout,
+                'accelerate': self.accelerate}
+
+
 class Client(object):
-    def __init__(self, servers):
+    def __init__(self, servers, limiter=None, stack=None):
         self._clients = []
+        self.limiter = limiter
+        self.stack = stack or Stack()
         for server in servers:
+            if not isinstance(server, basestring):
+                # An in-process server, such as lazyboy.memory.MemoryServer
+                self._clients.append(server.client())
+                continue
             host, port = server.split(":")
             self._addServer(host,port)
 
@@ -52,12 +290,11 @@ class Client(object):
 
     def _addServer(self, host, port):
         try:
-            socket = TSocket.TSocket(host, int(port))
-            # socket.setTimeout(200)
-            transport = TTransport.TBufferedTransport(socket)
-            protocol = TBinaryProtocol.TBinaryProtocolAccelerated(transport)
+            (sock, transport, protocol) = self.stack.build(host, port)
             client = Cassandra.Client(protocol)
-            client.transport = transport
+            client.transport, client.socket = transport, sock
+            client.server = "%s:%s" % (host, port)
+            client.accelerated = self.stack.accelerated(transport, protocol)
             self._clients.append(client)
         finally:
             return True
@@ -76,6 +313,17 @@ class Client(object):
     def listServers(self):
         return self._clients
 
+    def describe(self):
+        """Return the Stack settings and which servers use the C codec."""
+        info = self.stack.describe()
+        info['servers'] = dict(
+            (getattr(c, 'server', None), {'accelerated': c.accelerated[0],
+                                          'reason': c.accelerated[1]})
+            for c in self._clients if hasattr(c, 'accelerated'))
+        info['accelerated'] = bool(info['servers']) and \
+            not [s for s in info['servers'].values() if not s['accelerated']]
+        return info
+
     def _connect(self, client):
         """Connect to Cassandra if not connected"""
         if client.transport.isOpen():
@@ -83,6 +331,8 @@ class Client(object):
 
         try:
             client.transport.open()
+            if hasattr(client, 'socket'):
+                self.stack.tune(client.socket)
             return True
         except Thrift.ErrorT, tx:
             if tx.message:
@@ -96,22 +346,98 @@ class Client(object):
 
         return False
 
+    def _call(self, client, attr, args, kwargs):
+        """Call attr on client, closing its transport if that fails."""
+        try:
+            return getattr(client, attr).__call__(*args, **kwargs)
+        except Thrift.ErrorT, tx:
+            if tx.message:
+                message = tx.message
+            else:
+                message = "Transport error, reconnect"
+            client.transport.close()
+            raise ErrorThriftMessage(message)
+        except Exception, e:
+            client.transport.close()
+            raise e
+
     def __getattr__(self, attr):
         """Wrap every __func__ call to Cassandra client and connect()"""
         def func(*args, **kwargs):
             client = self._getServer()
             if self._connect(client):
+                call = None
+                if instrument.hooks:
+                    call = instrument.Call(
+                        attr, getattr(client, 'server', None), args)
+                    instrument.before(call)
+
+                if self.limiter:
+                    self.limiter.acquire()
+                start, failed = time.time(), True
                 try:
-                    return getattr(client, attr).__call__(*args, **kwargs)
-                except Thrift.ErrorT, tx:
-                    if tx.message:
-                        message = tx.message
-                    else:
-                        message = "Transport error, reconnect"
-                    client.transport.close()
-                    raise ErrorThriftMessage(message)
-                except Exception, e:
-                    client.transport.close()
-                    raise e
+                    try:
+                        res = self._call(client, attr, args, kwargs)
+                        failed = False
+                    except:
+                        if call is None: raise
+                        exc_info = sys.exc_info()
+                        instrument.error(call, time.time() - start, exc_info)
+                        raise exc_info[0], exc_info[1], exc_info[2]
+                    if call is not None:
+                        instrument.after(call, time.time() - start, res)
+                    return res
+                finally:
+                    if self.limiter:
+                        self.limiter.release(time.time() - start, failed,
+                                             attr)
+
+        return func
+
+
+def _row_key(args):
+    """Return the row key a Cassandra call's arguments refer to, or None."""
+    if len(args) > 1:
+        if isinstance(args[1], basestring):
+            return args[1]
+        return getattr(args[1], 'key', None)
+    return None
+
 
+class ShardedClient(object):
+    """Routes each call to the shard owning the row it refers to.
+
+    get_key_range is sent to every shard in parallel and the results
+    merged. Other calls which don't name a row aren't supported."""
+
+    def __init__(self, name, ring):
+        self.name, self.ring = name, ring
+
+    def shard_pool(self, key):
+        """Return the name of the pool holding the row with key."""
+        return "%s/%s" % (self.name, self.ring.shard_for(key))
+
+    def group(self, keys):
+        """Return {pool name: [keys]}, to split bulk work by shard."""
+        return dict(("%s/%s" % (self.name, shard), shard_keys)
+                    for (shard, shard_keys) in self.ring.group(keys).items())
+
+    def get_key_range(self, table, families, start, finish, count):
+        pools = ["%s/%s" % (self.name, shard) for shard in self.ring.shards]
+        keys = []
+        for shard_keys in pmap(lambda pool: get_pool(pool).get_key_range(
+                table, families, start, finish, count), pools):
+            keys.extend(shard_keys)
+        keys.sort()
+        return keys[:count]
+
+    def __getattr__(self, attr):
+        def func(*args, **kwargs):
+            key = _row_key(args)
+            if key is None:
+                raise ErrorNotSupported("%s can't be routed to a shard" % \
+                                            (attr,))
+            # Clients aren't thread-safe; get_pool keeps one per thread.
+            return getattr(get_pool(self.shard_pool(key)), attr)(
+                *args, **kwargs)
         return func
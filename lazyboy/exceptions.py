@@ -27,3 +27,18 @@ class ErrorUnknownTable(Exception):
 
 class ErrorCassandraClientNotFound(Exception):
     pass
+
+class ErrorBudgetExceeded(Exception):
+    pass
+
+
+class ErrorPartialWrite(Exception):
+    """Raised when some pieces of a split write fail.
+
+    written is a list of the columns which were saved, and failed a
+    dict mapping the columns which weren't to the exception raised."""
+
+    def __init__(self, written, failed):
+        Exception.__init__(self, "%d column(s) failed to save" % \
+                               (len(failed),))
+        self.written, self.failed = written, failed
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Exporting
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import os
+import time
+import base64
+import struct
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from cassandra.ttypes import ColumnParent
+
+from lazyboy.scan import Scanner
+from lazyboy.concurrency import WorkerPool
+from lazyboy.exceptions import ErrorInvalidField
+
+
+# Marks bytes which aren't UTF-8, and so are base64 encoded in JSON
+BINARY = '__base64__'
+
+
+def _is_text(value):
+    try:
+        value.decode('utf-8')
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def encode_name(name):
+    """Return a name as a JSON-safe string; see decode_row."""
+    if not isinstance(name, str) or \
+            (_is_text(name) and not name.startswith(BINARY + ':')):
+        return name
+    return "%s:%s" % (BINARY, base64.b64encode(name))
+
+
+def encode_value(value):
+    """Return a value as a JSON-safe value; see decode_row."""
+    if not isinstance(value, str) or _is_text(value):
+        return value
+    return {BINARY: base64.b64encode(value)}
+
+
+def encode_row(key, cols, key_field='key'):
+    """Return a row as a JSON-safe dict.
+
+    Values which aren't UTF-8 become {BINARY: base64}, and such names
+    become BINARY + ':' + base64; see decode_row. A column named
+    key_field raises ErrorInvalidField, rather than being overwritten."""
+    row = dict((encode_name(col.name), encode_value(col.value))
+               for col in cols)
+    if encode_name(key_field) in row:
+        raise ErrorInvalidField(
+            "Row %r has a column named %r; use another key_field" % \
+                (key, key_field))
+    row[key_field] = encode_value(key)
+    return row
+
+
+def decode_row(row):
+    """Return a dict from encode_row with its original names and values.
+
+    Text is returned as UTF-8 strings, as lazyboy stores it."""
+    decoded = {}
+    for (name, value) in row.items():
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        if name.startswith(BINARY + ':'):
+            name = base64.b64decode(name[len(BINARY) + 1:])
+        if isinstance(value, dict) and BINARY in value:
+            value = base64.b64decode(value[BINARY])
+        elif isinstance(value, unicode):
+            value = value.encode('utf-8')
+        decoded[name] = value
+    return decoded
+
+
+def write_jsonl(out, key, cols, key_field='key'):
+    """Write a row as one JSON object, readable by lazyboy.bulk."""
+    out.write(json.dumps(encode_row(key, cols, key_field)) + "\n")
+
+
+def write_binary(out, key, cols, key_field=None):
+    """Write a row as length-prefixed binary; see read_binary."""
+    parts = [struct.pack('>I', len(key)), key, struct.pack('>I', len(cols))]
+    for col in cols:
+        parts.extend((struct.pack('>I', len(col.name)), col.name,
+                      struct.pack('>I', len(col.value)), col.value,
+                      struct.pack('>d', col.timestamp)))
+    out.write(''.join(parts))
+
+
+def read_binary(stream):
+    """Yield (key, [(name, value, timestamp)]) for rows in a binary file."""
+    def read_str():
+        (size,) = struct.unpack('>I', stream.read(4))
+        return stream.read(size)
+
+    while True:
+        head = stream.read(4)
+        if not head: return
+        key = stream.read(struct.unpack('>I', head)[0])
+        (count,) = struct.unpack('>I', stream.read(4))
+        cols = []
+        for i in range(count):
+            name, value = read_str(), read_str()
+            cols.append((name, value,
+                         struct.unpack('>d', stream.read(8))[0]))
+        yield key, cols
+
+
+FORMATS = {'jsonl': write_jsonl, 'binary': write_binary}
+
+
+class Exporter(Scanner):
+    """Writes every row of a ColumnFamily to sharded files.
+
+    Each key range becomes one shard file in directory, written by a
+    worker thread as it pages through the range, so only a batch of
+    rows per worker is held in memory. Rows are exported with all
+    their columns, read chunk_size at a time.
+
+    Shards are written to a temporary file and renamed when complete;
+    complete shards are skipped if the export is run again. JSON rows
+    hold their key in key_field, which no column may be named."""
+
+    # The number of columns to fetch per get_slice
+    chunk_size = 1000
+
+    def __init__(self, family, directory, format='jsonl', prefix=None,
+                 key_field='key', **kwargs):
+        super(Exporter, self).__init__(family, **kwargs)
+        self.directory, self.format = directory, format
+        self.key_field = key_field
+        self.prefix = prefix or self.pk.family
+
+    def _get_columns(self, key):
+        """Return every column of the row with key."""
+        client, cols, start = self._get_cas(), [], ''
+        while True:
+            fudge = int(bool(start))
+            page = client.get_slice(self.pk.table, key,
+                                    ColumnParent(self.pk.family),
+                                    start, '', True,
+                                    self.chunk_size + fudge)
+            more = len(page) >= self.chunk_size + fudge
+            if fudge and page and page[0].name == start: page = page[1:]
+            cols.extend(page)
+            if not more or not page: return cols
+            start = page[-1].name
+
+    def _load_rows(self, keys):
+        return [(key, cols) for (key, cols) in
+                ((key, self._get_columns(key)) for key in keys) if cols]
+
+    def _row_size(self, row):
+        return len(row[0]) + sum([len(c.name) + len(c.value)
+                                  for c in row[1]])
+
+    def shard_path(self, index):
+        """Return the filename of the shard for range index."""
+        return os.path.join(self.directory, "%s-%04d.%s" % \
+                                (self.prefix, index, self.format))
+
+    def _export_shard(self, index):
+        """Write the rows of one key range to its shard, returning its path."""
+        path = self.shard_path(index)
+        if os.path.exists(path):
+            return path
+
+        write = FORMATS[self.format]
+        stats = self._stats.setdefault(index, {'rows': 0, 'bytes': 0,
+                                               'start': None, 'end': None})
+        stats['start'] = stats['start'] or time.time()
+        out = open(path + '.tmp', 'wb')
+        try:
+            for (last, rows) in self._iter_range(index):
+                for (key, cols) in rows:
+                    write(out, key, cols, self.key_field)
+                stats['rows'] += len(rows)
+                stats['bytes'] += sum(map(self._row_size, rows))
+        finally:
+            out.close()
+            stats['end'] = time.time()
+        os.rename(path + '.tmp', path)
+        return path
+
+    def export(self):
+        """Export every shard, returning the list of shard filenames."""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        pool = WorkerPool(self.workers, "lazyboy-export")
+        try:
+            return pool.map(self._export_shard, range(len(self.ranges)))
+        finally:
+            pool.shutdown(True)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Identity map
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import threading
+import weakref
+
+from lazyboy.concurrency import ScopeStack
+
+_SCOPES = ScopeStack()
+
+
+def current():
+    """Return the innermost active IdentityMap, or None."""
+    return _SCOPES.current()
+
+
+class IdentityMap(object):
+    """Maps primary keys to the objects loaded for them.
+
+    While a map is active, loading a key which was already loaded
+    returns the same object instead of reading the row again:
+
+        with IdentityMap():
+            story = Story().load(key)
+            assert Story().load(key) is story
+
+    Objects are held weakly, so they are dropped once nothing else
+    refers to them. Maps are active in the thread which entered them,
+    and in calls it submits to a lazyboy.concurrency.WorkerPool."""
+
+    def __init__(self):
+        self._objects = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self.hits, self.misses = 0, 0
+
+    def get(self, pk):
+        """Return the object loaded for pk, or None."""
+        self._lock.acquire()
+        try:
+            obj = self._objects.get(pk)
+            if obj is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return obj
+        finally:
+            self._lock.release()
+
+    def add(self, obj):
+        """Remember obj under its primary key, and return it."""
+        self._lock.acquire()
+        try:
+            self._objects[obj.pk] = obj
+            return obj
+        finally:
+            self._lock.release()
+
+    def discard(self, pk):
+        """Forget the object for pk, if there is one."""
+        self._lock.acquire()
+        try:
+            self._objects.pop(pk, None)
+        finally:
+            self._lock.release()
+
+    def __contains__(self, pk):
+        return pk in self._objects
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __enter__(self):
+        _SCOPES.push(self)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        _SCOPES.pop(self)
+        return False
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Instrumentation
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import threading
+from bisect import bisect_left
+
+# Registered hooks. This list is replaced, never changed in place, so
+# Client can read it without locking.
+hooks = []
+
+_HOOKS_LOCK = threading.Lock()
+
+
+def add_hook(hook):
+    """Register a Hook to be called around every Cassandra RPC."""
+    global hooks
+    _HOOKS_LOCK.acquire()
+    try:
+        hooks = hooks + [hook]
+    finally:
+        _HOOKS_LOCK.release()
+
+
+def remove_hook(hook):
+    """Stop calling a registered Hook."""
+    global hooks
+    _HOOKS_LOCK.acquire()
+    try:
+        hooks = [h for h in hooks if h is not hook]
+    finally:
+        _HOOKS_LOCK.release()
+
+
+def approx_size(obj):
+    """Return roughly how many bytes obj takes up on the wire."""
+    if isinstance(obj, basestring):
+        return len(obj)
+    if obj is None:
+        return 0
+    if isinstance(obj, (int, long, float, bool)):
+        return 8
+    if isinstance(obj, (list, tuple)):
+        return sum([approx_size(o) for o in obj])
+    if isinstance(obj, dict):
+        return sum([approx_size(k) + approx_size(v)
+                    for (k, v) in obj.items()])
+    if hasattr(obj, '__dict__'):
+        return approx_size(obj.__dict__.values())
+    return 0
+
+
+class Call(object):
+    """Describes one RPC, for hooks.
+
+    method, server, table and key say what was called and where;
+    bytes_out and bytes_in are approximate request and response sizes.
+    latency is set once the call finishes."""
+
+    __slots__ = ('method', 'server', 'table', 'key', 'args', 'bytes_out',
+                 'bytes_in', 'latency', 'retries')
+
+    def __init__(self, method, server, args):
+        self.method, self.server, self.args = method, server, args
+        self.table = self.key = None
+        if args and isinstance(args[0], basestring):
+            self.table = args[0]
+            if len(args) > 1:
+                if isinstance(args[1], basestring):
+                    self.key = args[1]
+                else:
+                    self.key = getattr(args[1], 'key', None)
+        self.bytes_out = approx_size(args)
+        self.bytes_in, self.latency, self.retries = 0, None, 0
+
+
+class Hook(object):
+    """Base class for instrumentation hooks; override what you need.
+
+    Exceptions raised by a hook propagate to the caller of the RPC."""
+
+    def before(self, call):
+        """Called before the RPC is sent."""
+        pass
+
+    def after(self, call, result):
+        """Called when the RPC returns result."""
+        pass
+
+    def error(self, call, exc_info):
+        """Called when the RPC raises an exception."""
+        pass
+
+
+def before(call):
+    for hook in hooks: hook.before(call)
+
+
+def after(call, latency, result):
+    call.latency, call.bytes_in = latency, approx_size(result)
+    for hook in hooks: hook.after(call, result)
+
+
+def error(call, latency, exc_info):
+    call.latency = latency
+    for hook in hooks: hook.error(call, exc_info)
+
+
+# Histogram bucket upper bounds, in seconds: 10us doubling up to ~80s
+_BOUNDS = [0.00001 * 2 ** i for i in range(24)]
+
+
+class Histogram(object):
+    """A fixed-bucket latency histogram."""
+
+    def __init__(self):
+        self.counts = [0] * (len(_BOUNDS) + 1)
+        self.count, self.total = 0, 0.0
+        self.min, self.max = None, None
+
+    def add(self, value):
+        self.counts[bisect_left(_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min: self.min = value
+        if self.max is None or value > self.max: self.max = value
+
+    def percentile(self, pct):
+        """Return the upper bound of the bucket holding percentile pct."""
+        if not self.count: return None
+        rank, seen = self.count * pct / 100.0, 0
+        for (i, n) in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(self.max, i < len(_BOUNDS) and _BOUNDS[i] or
+                           self.max)
+        return self.max
+
+    def snapshot(self):
+        """Return the histogram as a dict of plain values."""
+        return {'count': self.count, 'sum': self.total,
+                'min': self.min, 'max': self.max,
+                'mean': self.count and self.total / self.count or None,
+                'p50': self.percentile(50), 'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'buckets': [(i < len(_BOUNDS) and _BOUNDS[i] or None, n)
+                            for (i, n) in enumerate(self.counts) if n]}
+
+
+class Stats(object):
+    """Counters and a latency histogram for one method or server."""
+
+    def __init__(self):
+        self.calls, self.errors = 0, 0
+        self.bytes_out, self.bytes_in = 0, 0
+        self.latency = Histogram()
+
+    def add(self, call, failed):
+        self.calls += 1
+        self.errors += int(failed)
+        self.bytes_out += call.bytes_out
+        self.bytes_in += call.bytes_in
+        self.latency.add(call.latency)
+
+    def snapshot(self):
+        return {'calls': self.calls, 'errors': self.errors,
+                'bytes_out': self.bytes_out, 'bytes_in': self.bytes_in,
+                'latency': self.latency.snapshot()}
+
+
+class Collector(Hook):
+    """Keeps counters and latency histograms per method and per server.
+
+        collector = Collector()
+        add_hook(collector)
+        ...
+        print collector.snapshot()['methods']['get_slice']['latency']['p99']
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything collected so far."""
+        self._lock.acquire()
+        try:
+            self._methods, self._servers = {}, {}
+        finally:
+            self._lock.release()
+
+    def _add(self, call, failed):
+        self._lock.acquire()
+        try:
+            for (stats, name) in ((self._methods, call.method),
+                                  (self._servers, call.server)):
+                if name not in stats:
+                    stats[name] = Stats()
+                stats[name].add(call, failed)
+        finally:
+            self._lock.release()
+
+    def after(self, call, result):
+        self._add(call, False)
+
+    def error(self, call, exc_info):
+        self._add(call, True)
+
+    def snapshot(self):
+        """Return {'methods': {...}, 'servers': {...}} of plain values."""
+        self._lock.acquire()
+        try:
+            return dict((kind, dict((name, s.snapshot())
+                                    for (name, s) in stats.items()))
+                        for (kind, stats) in (('methods', self._methods),
+                                              ('servers', self._servers)))
+        finally:
+            self._lock.release()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Key generators
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import os
+import time
+import threading
+from binascii import hexlify
+
+
+class KeyGenerator(object):
+    """Base class for callables which return new keys.
+
+    Keys are made batch at a time and handed out one per call, so
+    high-rate writers pay the cost of generating them less often.
+    Set a class's _key_generator to an instance to use it:
+
+        class Story(ColumnFamily):
+            _key = {'table': 'digg', 'family': 'Story'}
+            _key_generator = TimeOrdered(batch=100)
+    """
+
+    def __init__(self, batch=1):
+        self.batch = batch
+        self._keys, self._pid = [], None
+        self._lock = threading.Lock()
+
+    def _generate(self, count):
+        """Return a list of count new keys."""
+        raise NotImplementedError()
+
+    def _reset(self):
+        """Called in a new process, before any keys are generated."""
+        pass
+
+    def __call__(self):
+        self._lock.acquire()
+        try:
+            if self._pid != os.getpid():
+                # Keys made before a fork would be handed out twice.
+                self._pid, self._keys = os.getpid(), []
+                self._reset()
+            if not self._keys:
+                self._keys = self._generate(self.batch)
+                self._keys.reverse()
+            return self._keys.pop()
+        finally:
+            self._lock.release()
+
+
+class Random(KeyGenerator):
+    """Random 32-character hex keys, like uuid.uuid4().hex.
+
+    A batch is read from os.urandom at once."""
+
+    def _generate(self, count):
+        data = hexlify(os.urandom(16 * count))
+        return [data[i:i + 32] for i in range(0, len(data), 32)]
+
+
+class TimeOrdered(KeyGenerator):
+    """32-character hex keys which sort in the order they were made.
+
+    Keys are the time in microseconds followed by a random node ID
+    chosen per process. Keys from one generator always increase, even
+    when several are made in the same microsecond or the clock steps
+    back. That makes them suit views over an order-preserving
+    partitioner, where they're stored in time order."""
+
+    def _reset(self):
+        self.node = hexlify(os.urandom(8))
+        self._last = 0
+
+    def _generate(self, count):
+        start = max(int(time.time() * 1000000), self._last + 1)
+        self._last = start + count - 1
+        return ["%016x%s" % (start + i, self.node) for i in range(count)]
+
+
+def key_time(key):
+    """Return the time a TimeOrdered key was made, in seconds."""
+    return int(key[:16], 16) / 1000000.0
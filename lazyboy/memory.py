@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: In-memory Cassandra
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import time
+import random
+import threading
+
+from cassandra.ttypes import Column, SuperColumn, NotFoundException, \
+    InvalidRequestException
+
+import lazyboy.connection as connection
+
+
+def add_pool(name, server=None, limiter=None):
+    """Add a connection pool served from memory, returning its server."""
+    server = server or MemoryServer()
+    connection.add_pool(name, [server], limiter)
+    return server
+
+
+def _slice(names, start, finish, ascending, count):
+    """Return up to count of the sorted names between start and finish."""
+    if ascending:
+        names = [n for n in names if (not start or n >= start) and
+                 (not finish or n <= finish)]
+    else:
+        names.reverse()
+        names = [n for n in names if (not start or n <= start) and
+                 (not finish or n >= finish)]
+    return names[:count]
+
+
+class MemoryServer(object):
+    """An in-memory stand-in for a Cassandra node.
+
+    Put one in the server list given to lazyboy.connection.add_pool
+    (or use lazyboy.memory.add_pool) and every client of the pool
+    reads and writes the same data. Columns are sorted by name, newer
+    timestamps win, and removes leave tombstones, as in Cassandra.
+
+    Every call sleeps for latency seconds, give or take up to jitter,
+    plus per_column seconds for each column read or written. The
+    jitter comes from a random.Random seeded with seed, so runs are
+    repeatable."""
+
+    def __init__(self, latency=0.0, jitter=0.0, per_column=0.0, seed=0,
+                 name='memory'):
+        self.latency, self.jitter = latency, jitter
+        self.per_column, self.name = per_column, name
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Remove all data."""
+        # (table, key) -> family -> name -> (value, timestamp)
+        # Super column families nest one more level. Deleted columns
+        # have a value of None.
+        self._rows = {}
+        # (table, key, family, super_column) -> timestamp of removal
+        self._tombs = {}
+
+    def client(self):
+        """Return a Thrift-like client for this server."""
+        return MemoryClient(self)
+
+    def delay(self, columns=0):
+        """Sleep as the latency model says a call should take."""
+        if not (self.latency or self.jitter or self.per_column):
+            return
+        self._lock.acquire()
+        try:
+            jitter = self._random.uniform(-self.jitter, self.jitter)
+        finally:
+            self._lock.release()
+        time.sleep(max(0, self.latency + jitter + self.per_column * columns))
+
+
+class _Transport(object):
+    def isOpen(self):
+        return True
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryClient(object):
+    """The Cassandra Thrift calls lazyboy uses, served by a MemoryServer."""
+
+    def __init__(self, server):
+        self._server, self.server = server, server.name
+        self.transport = _Transport()
+
+    def _locked(self, func, *args):
+        self._server._lock.acquire()
+        try:
+            return func(*args)
+        finally:
+            self._server._lock.release()
+
+    def _family(self, table, key, family, create=False):
+        row = self._server._rows.get((table, key))
+        if row is None:
+            if not create: return {}
+            row = self._server._rows[(table, key)] = {}
+        if family not in row:
+            if not create: return {}
+            row[family] = {}
+        return row[family]
+
+    def _cols(self, table, key, family, super_column=None, create=False):
+        cols = self._family(table, key, family, create)
+        if super_column is None:
+            return cols
+        if super_column not in cols:
+            if not create: return {}
+            cols[super_column] = {}
+        return cols[super_column]
+
+    def _put(self, table, key, family, super_column, col):
+        tomb = max(self._server._tombs.get((table, key, family, None), -1),
+                   self._server._tombs.get((table, key, family,
+                                            super_column), -1))
+        if col.timestamp <= tomb:
+            return
+        cols = self._cols(table, key, family, super_column, True)
+        old = cols.get(col.name)
+        if old is None or old[1] <= col.timestamp:
+            cols[col.name] = (col.value, col.timestamp)
+
+    def _is_live(self, cell):
+        if isinstance(cell, dict):
+            return bool([c for c in cell.values() if c[0] is not None])
+        return cell[0] is not None
+
+    def _live(self, cols):
+        """Return the sorted names of the live columns in cols."""
+        return sorted([name for (name, cell) in cols.items()
+                       if self._is_live(cell)])
+
+    def _columns(self, cols, names):
+        return [Column(name, cols[name][0], cols[name][1]) for name in names]
+
+    def _super(self, name, cols):
+        return SuperColumn(name, self._columns(cols, self._live(cols)))
+
+    def _remove(self, table, key, path, timestamp):
+        family, super_column = path.column_family, path.super_column
+        if path.column is None:
+            self._server._tombs[(table, key, family, super_column)] = max(
+                timestamp, self._server._tombs.get(
+                    (table, key, family, super_column), -1))
+            cols = self._cols(table, key, family, super_column)
+            names = cols.keys()
+        else:
+            cols = self._cols(table, key, family, super_column)
+            names = [path.column]
+
+        for name in names:
+            cell = cols.get(name)
+            if isinstance(cell, dict):
+                for (sub, subcell) in cell.items():
+                    if subcell[1] <= timestamp:
+                        cell[sub] = (None, timestamp)
+            elif cell is not None and cell[1] <= timestamp:
+                cols[name] = (None, timestamp)
+
+    def get_slice(self, table, key, column_parent, start, finish,
+                  is_ascending, count):
+        def read():
+            cols = self._cols(table, key, column_parent.column_family,
+                              column_parent.super_column)
+            names = _slice(self._live(cols), start, finish, is_ascending,
+                           count)
+            return self._columns(cols, names)
+        cols = self._locked(read)
+        self._server.delay(len(cols))
+        return cols
+
+    def get_column(self, table, key, column_path):
+        def read():
+            cols = self._cols(table, key, column_path.column_family,
+                              column_path.super_column)
+            cell = cols.get(column_path.column)
+            if cell is None or cell[0] is None:
+                raise NotFoundException()
+            return Column(column_path.column, cell[0], cell[1])
+        col = self._locked(read)
+        self._server.delay(1)
+        return col
+
+    def get_column_count(self, table, key, column_parent):
+        count = self._locked(lambda: len(self._live(self._cols(
+                        table, key, column_parent.column_family,
+                        column_parent.super_column))))
+        self._server.delay()
+        return count
+
+    def get_slice_super(self, table, key, family, start, finish,
+                        is_ascending, offset, count):
+        def read():
+            scols = self._family(table, key, family)
+            names = _slice(self._live(scols), start, finish, is_ascending,
+                           offset + count)[offset:]
+            return [self._super(name, scols[name]) for name in names]
+        scols = self._locked(read)
+        self._server.delay(sum([len(s.columns) for s in scols]))
+        return scols
+
+    def get_superColumn(self, table, key, path):
+        (family, name) = path.split(':', 1)
+        def read():
+            cols = self._family(table, key, family).get(name)
+            if not cols or not self._is_live(cols):
+                raise NotFoundException()
+            return self._super(name, cols)
+        scol = self._locked(read)
+        self._server.delay(len(scol.columns))
+        return scol
+
+    def get_key_range(self, table, column_families, start, finish, count):
+        def read():
+            keys = [k for ((t, k), row) in self._server._rows.items()
+                    if t == table and
+                    [f for f in column_families if self._live(row.get(f, {}))]]
+            keys.sort()
+            return _slice(keys, start, finish, True, count)
+        keys = self._locked(read)
+        self._server.delay()
+        return keys
+
+    def insert(self, table, key, column_path, value, timestamp, block_for):
+        if column_path.column is None:
+            raise InvalidRequestException("A column name is required")
+        self._locked(self._put, table, key, column_path.column_family,
+                     column_path.super_column,
+                     Column(column_path.column, value, timestamp))
+        self._server.delay(1)
+
+    def batch_insert(self, table, batch_mutation, block_for):
+        def write():
+            for (family, cols) in batch_mutation.cfmap.items():
+                for col in cols:
+                    self._put(table, batch_mutation.key, family, None, col)
+        self._locked(write)
+        self._server.delay(sum(map(len, batch_mutation.cfmap.values())))
+
+    def batch_insert_superColumn(self, table, batch_mutation, block_for):
+        def write():
+            for (family, scols) in batch_mutation.cfmap.items():
+                for scol in scols:
+                    for col in scol.columns:
+                        self._put(table, batch_mutation.key, family,
+                                  scol.name, col)
+        self._locked(write)
+        self._server.delay(sum([len(s.columns) for scols in
+                                batch_mutation.cfmap.values()
+                                for s in scols]))
+
+    def remove(self, table, key, column_path_or_parent, timestamp,
+               block_for):
+        self._locked(self._remove, table, key, column_path_or_parent,
+                     timestamp)
+        self._server.delay(1)
@@ -8,12 +8,39 @@
 
 from lazyboy.exceptions import ErrorIncompleteKey
 
+_FIELDS = ('table', 'key', 'family', 'supercol', 'superkey')
+
 class PrimaryKey(object):
+    """An immutable key naming a row, or a row in a supercolumn.
+
+    Keys are hashable and compare by value. Use clone() to get a key
+    with some parts changed."""
+
+    __slots__ = _FIELDS + ('_colspec', '_str', '_hash')
+
     def __init__(self, table, key, family = None, supercol=None, superkey=None):
         """Construct a PK object from a string representation or keyword args"""
         if (supercol or superkey) and not (supercol and superkey):
             raise ErrorIncompleteKey("You must set both supercol and superkey")
-        for (k, v) in vars().items(): setattr(self, k, v)
+        _set = object.__setattr__
+        _set(self, 'table', table)
+        _set(self, 'key', key)
+        _set(self, 'family', family)
+        _set(self, 'supercol', supercol)
+        _set(self, 'superkey', superkey)
+        _set(self, '_str', None)
+        _set(self, '_hash', None)
+
+        colspec = "%s:" % (family,)
+        if supercol and superkey:
+            colspec += "%s:%s" % (supercol, superkey)
+        _set(self, '_colspec', colspec)
+
+    def __setattr__(self, attr, value=None):
+        raise AttributeError("`%s' object is immutable; use clone()" % \
+                                 (self.__class__.__name__,))
+
+    __delattr__ = __setattr__
 
     def is_super(self):
         """Return bool if this is a PK for CF in a SCF."""
@@ -22,15 +49,34 @@ class PrimaryKey(object):
 
     def colspec(self):
         """Return the column specification needed by Cassandra."""
-        out = "%s:" % (self.family,)
-        if self.supercol and self.superkey:
-            out += "%s:%s" % (self.supercol, self.superkey)
-        return out
+        return self._colspec
+
+    def _values(self):
+        return (self.table, self.key, self.family, self.supercol,
+                self.superkey)
+
+    def __eq__(self, other):
+        return isinstance(other, PrimaryKey) and \
+            self._values() == other._values()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        if self._hash is None:
+            object.__setattr__(self, '_hash', hash(self._values()))
+        return self._hash
+
+    def __reduce__(self):
+        return (self.__class__, self._values())
 
     def __str__(self):
         """Return the string representation of this PK"""
-        keys = ('table', 'family', 'key', 'supercol', 'superkey')
-        return str(dict(((key, getattr(self, key)) for key in keys)))
+        if self._str is None:
+            keys = ('table', 'family', 'key', 'supercol', 'superkey')
+            object.__setattr__(self, '_str', str(dict(
+                        ((key, getattr(self, key)) for key in keys))))
+        return self._str
 
     def __unicode__(self):
         return unicode(str(self))
@@ -40,23 +86,12 @@ class PrimaryKey(object):
 
     def clone(self, **kwargs):
         """Return a clone of this key with keyword args changed"""
-        return DecoratedPrimaryKey(self, **kwargs)
-
-
-class DecoratedPrimaryKey(PrimaryKey):
-    def __init__(self, parent_key, **kwargs):
-        self.parent_key = parent_key
-        for (k, v) in kwargs.items(): setattr(self, k, v)
-
-    def __getattr__(self, attr):
-        if attr in self.__dict__:
-            return self.__dict__[attr]
-
-        if hasattr(self.parent_key, attr):
-            return getattr(self.parent_key, attr)
+        if not kwargs:
+            return self
+        values = dict(zip(_FIELDS, self._values()))
+        values.update(kwargs)
+        return self.__class__(**values)
 
-        raise AttributeError("`%s' object has no attribute `%s'" % \
-                                 (self.__class__.__name__, attr))
 
-    def __hasattr__(self, attr):
-        return attr in self.__dict__ or hasattr(self.parent_key, attr)
+# Clones used to be a separate class which read through to their parent.
+DecoratedPrimaryKey = PrimaryKey
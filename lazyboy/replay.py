@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Recording and replaying RPCs
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+"""Record RPC traffic, and replay it for load testing.
+
+    recorder = Recorder(open('traffic.jsonl', 'a'), hash_keys=True)
+    add_hook(recorder)
+
+    python -m lazyboy.replay -s staging:9160 -x 2 traffic.jsonl
+"""
+
+import sys
+import time
+import random
+import threading
+import Queue
+from md5 import md5
+from optparse import OptionParser
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import cassandra.ttypes
+
+import lazyboy.connection as connection
+from lazyboy import instrument
+from lazyboy.memory import MemoryServer
+
+
+def encode(obj):
+    """Return obj, which may hold Thrift structs, as JSON-safe values.
+
+    Strings are stored as latin-1 so any bytes survive."""
+    if isinstance(obj, str):
+        return obj.decode('latin-1')
+    if isinstance(obj, (list, tuple)):
+        return [encode(o) for o in obj]
+    if isinstance(obj, dict):
+        return dict((encode(k), encode(v)) for (k, v) in obj.items())
+    if hasattr(obj, '__dict__') and \
+            hasattr(cassandra.ttypes, obj.__class__.__name__):
+        return {'__type__': obj.__class__.__name__,
+                'fields': encode(vars(obj))}
+    return obj
+
+
+def decode(obj):
+    """Return obj as it was before encode()."""
+    if isinstance(obj, unicode):
+        return obj.encode('latin-1')
+    if isinstance(obj, list):
+        return [decode(o) for o in obj]
+    if isinstance(obj, dict):
+        if '__type__' in obj:
+            return getattr(cassandra.ttypes, str(obj['__type__']))(
+                **dict((str(k), decode(v))
+                       for (k, v) in obj['fields'].items()))
+        return dict((decode(k), decode(v)) for (k, v) in obj.items())
+    return obj
+
+
+def _hash(key):
+    return md5(key).hexdigest()
+
+
+def _mask_values(obj):
+    """Replace the values of encoded Columns with filler of the same size."""
+    if isinstance(obj, list):
+        for o in obj: _mask_values(o)
+    elif isinstance(obj, dict):
+        if obj.get('__type__') == 'Column' and \
+                isinstance(obj['fields'].get('value'), basestring):
+            obj['fields']['value'] = u'x' * len(obj['fields']['value'])
+        for o in obj.values(): _mask_values(o)
+
+
+def read(stream):
+    """Yield recorded calls from a stream."""
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+class Recorder(instrument.Hook):
+    """Writes every RPC to out as a line of JSON.
+
+    Each line has the time since recording started, the method, its
+    arguments, latency and the name of the exception raised, if any.
+    With hash_keys, row keys are replaced by their MD5; with
+    hash_values, column values are replaced by filler of the same
+    length. With sample below 1.0, only that fraction of row keys are
+    recorded, so recorded keys keep their full access pattern."""
+
+    def __init__(self, out, hash_keys=False, hash_values=False,
+                 sample=1.0):
+        self.out, self.sample = out, sample
+        self.hash_keys, self.hash_values = hash_keys, hash_values
+        self.start, self.count = time.time(), 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        instrument.add_hook(self)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        instrument.remove_hook(self)
+        self.out.flush()
+        return False
+
+    def _sampled(self, key):
+        if self.sample >= 1.0:
+            return True
+        if key is None:
+            return random.random() < self.sample
+        return int(_hash(key)[:8], 16) < self.sample * 0x100000000
+
+    def _args(self, method, args):
+        args = encode(args)
+        if self.hash_keys:
+            if len(args) > 1 and isinstance(args[1], basestring):
+                args[1] = _hash(args[1].encode('latin-1'))
+            for arg in args[1:2]:
+                if isinstance(arg, dict) and 'key' in arg.get('fields', {}):
+                    arg['fields']['key'] = _hash(
+                        arg['fields']['key'].encode('latin-1'))
+            if method == 'get_key_range':
+                args[2:4] = [a and _hash(a.encode('latin-1')) or a
+                             for a in args[2:4]]
+        if self.hash_values:
+            _mask_values(args)
+            if method == 'insert' and len(args) > 3:
+                args[3] = u'x' * len(args[3])
+        return args
+
+    def _record(self, call, error):
+        if not self._sampled(call.key):
+            return
+        line = json.dumps({'t': time.time() - call.latency - self.start,
+                           'method': call.method,
+                           'args': self._args(call.method, call.args),
+                           'latency': call.latency, 'error': error})
+        self._lock.acquire()
+        try:
+            self.out.write(line + "\n")
+            self.count += 1
+        finally:
+            self._lock.release()
+
+    def after(self, call, result):
+        self._record(call, None)
+
+    def error(self, call, exc_info):
+        self._record(call, exc_info[0].__name__)
+
+
+class Replayer(object):
+    """Replays recorded calls, reporting latency and throughput.
+
+    Calls go to the connection pool named pool, or if that's None, the
+    pool named after each call's table. They're sent at speed times
+    the recorded rate, or as fast as possible if speed is None, from
+    concurrency threads."""
+
+    def __init__(self, pool=None, speed=1.0, concurrency=8):
+        self.pool, self.speed, self.concurrency = pool, speed, concurrency
+        self._lock = threading.Lock()
+
+    def _add(self, method, latency, failed):
+        self._lock.acquire()
+        try:
+            for name in (None, method):
+                if name not in self._stats:
+                    self._stats[name] = [0, 0, instrument.Histogram()]
+                stats = self._stats[name]
+                stats[0] += 1
+                stats[1] += int(failed)
+                stats[2].add(latency)
+        finally:
+            self._lock.release()
+
+    def _work(self, queue):
+        while True:
+            record = queue.get()
+            if record is None: return
+            method = str(record.get('method'))
+            start, failed = time.time(), True
+            try:
+                # A bad record counts as an error, rather than killing
+                # this thread and leaving run() blocked on the queue.
+                args = decode(record['args'])
+                client = connection.get_pool(self.pool or args[0])
+                start = time.time()
+                getattr(client, method)(*args)
+                failed = False
+            except Exception:
+                pass
+            self._add(method, time.time() - start, failed)
+
+    def run(self, records):
+        """Replay an iterable of recorded calls, returning a report."""
+        self._stats = {}
+        queue = Queue.Queue(self.concurrency * 10)
+        threads = []
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._work, args=(queue,),
+                                      name="lazyboy-replay-%d" % i)
+            thread.setDaemon(True)
+            thread.start()
+            threads.append(thread)
+
+        start, lag = time.time(), 0.0
+        try:
+            for record in records:
+                if self.speed:
+                    wait = start + record['t'] / self.speed - time.time()
+                    if wait > 0:
+                        time.sleep(wait)
+                    lag = max(lag, -wait)
+                queue.put(record)
+        finally:
+            for thread in threads: queue.put(None)
+            for thread in threads: thread.join()
+        return self._report(time.time() - start, lag)
+
+    def _report(self, seconds, lag):
+        (calls, errors, hist) = self._stats.get(
+            None, [0, 0, instrument.Histogram()])
+        return {'calls': calls, 'errors': errors, 'seconds': seconds,
+                'ops_per_sec': calls / (seconds or 1e-9), 'max_lag': lag,
+                'latency': hist.snapshot(),
+                'methods': dict((name, {'calls': c, 'errors': e,
+                                        'latency': h.snapshot()})
+                                for (name, (c, e, h)) in self._stats.items()
+                                if name is not None)}
+
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options] [FILE]")
+    parser.add_option("-s", "--servers", default="localhost:9160",
+                      help="Comma-separated host:port list")
+    parser.add_option("-m", "--memory", action="store_true",
+                      help="Replay against an in-memory server")
+    parser.add_option("-x", "--speed", type="float", default=1.0,
+                      help="Multiple of the recorded rate; 0 for no limit")
+    parser.add_option("-c", "--concurrency", type="int", default=8)
+    (opts, args) = parser.parse_args(argv)
+    if len(args) > 1:
+        parser.error("Expected at most one file")
+
+    servers = opts.memory and [MemoryServer()] or opts.servers.split(',')
+    connection.add_pool('replay', servers)
+    stream = args and open(args[0]) or sys.stdin
+    report = Replayer('replay', opts.speed or None,
+                      opts.concurrency).run(read(stream))
+    print json.dumps(report, indent=2)
+    return int(bool(report['errors']))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
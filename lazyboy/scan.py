@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Scanner
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import os
+import sys
+import time
+import threading
+import Queue
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from lazyboy.base import CassandraBase
+
+
+# Hex digits, which keys made by CassandraBase._gen_uuid start with
+HEX = '0123456789abcdef'
+
+
+def split_ranges(count, alphabet=HEX):
+    """Return count (start, finish) key ranges covering every key.
+
+    The ranges split the two-character prefixes of alphabet evenly. An
+    empty start or finish leaves that end of the range open."""
+    prefixes = [a + b for a in alphabet for b in alphabet]
+    count = max(1, min(count, len(prefixes)))
+    bounds = [''] + [prefixes[i * len(prefixes) / count]
+                     for i in range(1, count)] + ['']
+    return zip(bounds[:-1], bounds[1:])
+
+
+class Scanner(CassandraBase):
+    """Iterates over every row of a ColumnFamily.
+
+    The key space is split into ranges, which are walked in parallel
+    by worker threads using get_key_range. This needs the cluster to
+    use an order-preserving partitioner.
+
+    If checkpoint is a filename, progress is recorded there after each
+    batch is consumed, and a new Scanner with the same ranges resumes
+    where the last one stopped."""
+
+    def __init__(self, family, ranges=None, workers=4, batch_size=100,
+                 checkpoint=None):
+        super(Scanner, self).__init__()
+        self.family = family
+        self.pk = family().pk
+        self.ranges = ranges or split_ranges(workers * 4)
+        self.workers, self.batch_size = workers, batch_size
+        self.checkpoint = checkpoint
+        self._progress = self._load_checkpoint()
+        self._stats = {}
+        self._stop = threading.Event()
+
+    def _load_checkpoint(self):
+        """Return {range index: last key, or True if done}."""
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return {}
+        state = json.load(open(self.checkpoint))
+        if [list(r) for r in self.ranges] != state['ranges']:
+            return {}
+        return dict((int(i), last) for (i, last) in
+                    state['progress'].items())
+
+    def _save_checkpoint(self):
+        if not self.checkpoint: return
+        tmp = self.checkpoint + '.tmp'
+        out = open(tmp, 'w')
+        json.dump({'ranges': [list(r) for r in self.ranges],
+                   'progress': self._progress}, out)
+        out.close()
+        os.rename(tmp, self.checkpoint)
+
+    def _load_rows(self, keys):
+        """Return the rows for keys which still exist."""
+        return [row for row in (self.family().load(key) for key in keys)
+                if row._original]
+
+    def _row_size(self, row):
+        """Return the approximate size of a row, in bytes."""
+        return sum([len(c.name) + len(c.value) for c in row._original])
+
+    def _iter_range(self, index):
+        """Yield (last key, rows) batches from one key range."""
+        start, finish = self.ranges[index]
+        start = self._progress.get(index) or start
+        resumed = index in self._progress
+        client = self._get_cas()
+        while True:
+            fudge = int(resumed)
+            keys = client.get_key_range(self.pk.table, [self.pk.family],
+                                        start, finish,
+                                        self.batch_size + fudge)
+            more = len(keys) >= self.batch_size + fudge
+            if resumed and keys and keys[0] == start: keys = keys[1:]
+            if finish: keys = [k for k in keys if k < finish]
+            if not keys: return
+
+            yield keys[-1], self._load_rows(keys)
+            if not more: return
+            start, resumed = keys[-1], True
+
+    def _put(self, out, item):
+        """Put item on out, unless the scan is stopped first."""
+        while not self._stop.isSet():
+            try:
+                out.put(item, True, 0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _work(self, n, tasks, out):
+        stats = self._stats[n] = {'rows': 0, 'bytes': 0,
+                                  'start': time.time(), 'end': None}
+        try:
+            try:
+                while not self._stop.isSet():
+                    try:
+                        index = tasks.get_nowait()
+                    except Queue.Empty:
+                        break
+
+                    for (last, rows) in self._iter_range(index):
+                        stats['rows'] += len(rows)
+                        stats['bytes'] += sum(map(self._row_size, rows))
+                        if not self._put(out, ('rows', (index, last, rows))):
+                            return
+                    if not self._put(out, ('rows', (index, True, []))):
+                        return
+            except:
+                self._put(out, ('error', sys.exc_info()))
+        finally:
+            stats['end'] = time.time()
+            self._put(out, None)
+
+    def iter_batches(self):
+        """Iterate over lists of rows, in no particular order."""
+        tasks, out = Queue.Queue(), Queue.Queue(self.workers * 2)
+        for index in range(len(self.ranges)):
+            if self._progress.get(index) is not True:
+                tasks.put(index)
+
+        self._stop.clear()
+        running = 0
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work,
+                                      args=(n, tasks, out),
+                                      name="lazyboy-scan-%d" % n)
+            thread.setDaemon(True)
+            thread.start()
+            running += 1
+
+        try:
+            while running:
+                item = out.get()
+                if item is None:
+                    running -= 1
+                    continue
+                (kind, value) = item
+                if kind == 'error':
+                    raise value[0], value[1], value[2]
+
+                (index, last, rows) = value
+                if rows:
+                    yield rows
+                self._progress[index] = last
+                self._save_checkpoint()
+        finally:
+            self._stop.set()
+
+    def __iter__(self):
+        """Iterate over every row, in no particular order."""
+        for rows in self.iter_batches():
+            for row in rows:
+                yield row
+
+    def report(self):
+        """Return {worker: stats} with rows/s and bytes/s for each."""
+        report = {}
+        for (n, stats) in self._stats.items():
+            secs = max((stats['end'] or time.time()) - stats['start'],
+                       1e-6)
+            report[n] = {'rows': stats['rows'], 'bytes': stats['bytes'],
+                         'seconds': secs,
+                         'rows_per_sec': stats['rows'] / secs,
+                         'bytes_per_sec': stats['bytes'] / secs}
+        return report
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Consistent hashing
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import sys
+from md5 import md5
+from bisect import bisect_left
+from optparse import OptionParser
+
+# The size of the hash ring
+RING_SIZE = 2 ** 32
+
+
+def hash_key(key):
+    """Return the position of key on the ring."""
+    return int(md5(key).hexdigest()[:8], 16)
+
+
+class HashRing(object):
+    """Assigns keys to shards by consistent hashing.
+
+    Each shard is placed on the ring at vnodes points, and a key
+    belongs to the shard owning the first point at or after the key's
+    hash. Adding a shard only moves keys onto it, about 1/N of them."""
+
+    def __init__(self, shards, vnodes=100):
+        if not shards:
+            raise ValueError("A ring needs at least one shard")
+        self.shards, self.vnodes = list(shards), vnodes
+        points = sorted([(hash_key("%s-%d" % (shard, i)), shard)
+                         for shard in self.shards for i in range(vnodes)])
+        self._hashes = [h for (h, shard) in points]
+        self._owners = [shard for (h, shard) in points]
+
+    def shard_for(self, key):
+        """Return the shard key belongs to."""
+        return self._owner(hash_key(key))
+
+    def _owner(self, position):
+        index = bisect_left(self._hashes, position)
+        return self._owners[index % len(self._owners)]
+
+    def group(self, keys):
+        """Return {shard: [keys]} for keys."""
+        groups = {}
+        for key in keys:
+            groups.setdefault(self.shard_for(key), []).append(key)
+        return groups
+
+    def add(self, shard):
+        """Return a new ring with shard added."""
+        return self.__class__(self.shards + [shard], self.vnodes)
+
+    def remove(self, shard):
+        """Return a new ring without shard."""
+        return self.__class__([s for s in self.shards if s != shard],
+                              self.vnodes)
+
+
+def movement(old, new):
+    """Return {(from shard, to shard): fraction of keys} moving between rings.
+
+    Fractions are of the whole key space, computed from the rings, so
+    they're exact for well-distributed keys."""
+    points = sorted(set(old._hashes + new._hashes))
+    moves = {}
+    for (i, point) in enumerate(points):
+        # The arc ending at point, starting after the previous point
+        start = i and points[i - 1] or points[-1] - RING_SIZE
+        src, dest = old._owner(point), new._owner(point)
+        if src != dest:
+            moves[(src, dest)] = moves.get((src, dest), 0.0) + \
+                float(point - start) / RING_SIZE
+    return moves
+
+
+def moved_keys(old, new, keys):
+    """Yield (key, from shard, to shard) for keys which change shards."""
+    for key in keys:
+        (src, dest) = (old.shard_for(key), new.shard_for(key))
+        if src != dest:
+            yield key, src, dest
+
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options] SHARD ...")
+    parser.add_option("-a", "--add", action="append", default=[],
+                      help="Shard to add")
+    parser.add_option("-r", "--remove", action="append", default=[],
+                      help="Shard to remove")
+    parser.add_option("-v", "--vnodes", type="int", default=100)
+    parser.add_option("-k", "--keys",
+                      help="File of keys, one per line, to list moves for")
+    (opts, args) = parser.parse_args(argv)
+    if not args:
+        parser.error("Expected the current shards")
+
+    old = new = HashRing(args, opts.vnodes)
+    for shard in opts.add: new = new.add(shard)
+    for shard in opts.remove: new = new.remove(shard)
+
+    moves = movement(old, new)
+    for ((src, dest), fraction) in sorted(moves.items()):
+        print "%s -> %s: %.2f%%" % (src, dest, fraction * 100)
+    print "total: %.2f%%" % (sum(moves.values()) * 100)
+
+    if opts.keys:
+        for (key, src, dest) in moved_keys(
+            old, new, (line.strip() for line in open(opts.keys))):
+            print "%s\t%s\t%s" % (key, src, dest)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,8 +8,13 @@
 
 import time
 
+import cassandra.ttypes as cassandra
+
 from lazyboy.columnfamily import *
+from lazyboy import identity
+from lazyboy.columnfamily import _column_size
 from lazyboy.base import CassandraBase
+from lazyboy.concurrency import submit
 
 class SuperColumn(CassandraBase, dict):
     name = ""
@@ -18,7 +23,6 @@ class SuperColumn(CassandraBase, dict):
 
     def __init__(self):
         super(SuperColumn, self).__init__()
-        self.pk = self._gen_pk()
 
     def load(self):
         return self
@@ -35,21 +39,32 @@ class SuperColumn(CassandraBase, dict):
 
     def _load_one(self, superkey):
         """Load and return an instance of the SCF with key superkey."""
-        client = self._get_cas()
-        if not (self.pk.colspec() + ':' + superkey) in self.__class__.__cache:
-            scol = client.get_superColumn(
+        cache_key = (self.pk, superkey)
+        if not cache_key in self.__class__.__cache:
+            scol = self._get_cas().get_superColumn(
                 self.pk.table, self.pk.key,
                 self.name + ':' + superkey)
-            self.__class__.__cache[self.pk.colspec() + ':' + superkey] = scol
+            self.__class__.__cache[cache_key] = scol
         else:
-            scol = self.__class__.__cache[self.pk.colspec() + ':' + superkey]
+            scol = self.__class__.__cache[cache_key]
 
         return self._instantiate(superkey, scol.columns)
 
     def _instantiate(self, superkey, columns):
         """Return an instance of a SuperColumnFamily for this SuperColumn."""
+        pk = self.pk.clone(supercol=self.name, superkey=superkey)
+        imap = identity.current()
+        if imap is not None:
+            scf = imap.get(pk)
+            if scf is not None:
+                return scf
+
         scf = self.family().load(self.pk.key, superkey, columns)
-        scf.pk = self.pk.clone(supercol=self.name, superkey=superkey)
+        if imap is not None:
+            imap.discard(scf.pk)
+        scf.pk = pk
+        if imap is not None:
+            imap.add(scf)
         return scf
 
     def __getitem__(self, superkey):
@@ -60,6 +75,10 @@ class SuperColumn(CassandraBase, dict):
 
         return super(SuperColumn, self).__getitem__(superkey)
 
+    def get_async(self, superkey):
+        """Return a Future for self[superkey], loaded on the shared pool."""
+        return submit(self.__getitem__, superkey)
+
     def __len_db__(self):
         """Return the number of SuperColumnFamilies in Cassandra for this SC."""
         return self._get_cas().get_column_count(
@@ -84,9 +103,9 @@ class SuperColumn(CassandraBase, dict):
 
             for scol in scols[fudge:]:
                 returned += 1
-                self.__class__.__cache[self.pk.colspec() + ':' + scol.name] = scol
+                self.__class__.__cache[(self.pk, scol.name)] = scol
                 yield scol
-                if returned >= limit:
+                if limit is not None and returned >= limit:
                    raise StopIteration()
             start = scol.name
 
@@ -135,14 +154,13 @@ class SuperColumn(CassandraBase, dict):
 
     def save(self):
         client = self._get_cas()
-        mutation = cassandra.BatchMutationSuper(
-            self.pk.key, dict(((k.pk.supercol, [])) for k in self.values()))
+        changed = []
 
         for col in self.values():
             if col.is_modified():
                 changes = col._marshal()
-                if changes['changed']:
-                    mutation.cfmap[col.pk.supercol].append(changes['changed'])
+                changed.extend([(changes['changed'].name, c) \
+                                    for c in changes['changed'].columns])
 
                 if changes['deleted']:
                     [client.remove(
@@ -151,6 +169,23 @@ class SuperColumn(CassandraBase, dict):
                                                          c.name),
                             time.time(), 0) for c in changes['deleted']]
 
-        if mutation.cfmap:
-            client.batch_insert_super_Column(self.pk.table, mutation, 0)
+        if changed:
+            self._write_batches(
+                self._write_super, self._split_batch(
+                    changed, lambda (superkey, c): len(superkey) + \
+                        _column_size(c)),
+                lambda batch: [(superkey, c.name) for (superkey, c) in batch])
         return self
+
+    def _write_super(self, batch):
+        """Write a list of (superkey, Column) in one batch mutation."""
+        scols = {}
+        for (superkey, col) in batch:
+            if superkey not in scols:
+                scols[superkey] = cassandra.SuperColumn(superkey, [])
+            scols[superkey].columns.append(col)
+
+        self._get_cas().batch_insert_superColumn(
+            self.pk.table,
+            cassandra.BatchMutationSuper(self.pk.key,
+                                         {self.name: scols.values()}), 0)
@@ -9,8 +9,12 @@
 import time
 import uuid
 
+import cassandra.ttypes as cassandra
+
 from lazyboy.base import CassandraBase
+from lazyboy.primarykey import PrimaryKey
 from lazyboy.columnfamily import *
+from lazyboy import identity
 
 class SuperColumnFamily(ColumnFamily):
     _key = {}
@@ -23,10 +27,19 @@ class SuperColumnFamily(ColumnFamily):
 
     def load(self, key, superkey, cols = None):
         """Load this ColumnFamily from primary key"""
+        imap = identity.current()
+        pk = self._gen_pk(key, superkey)
+        if imap is not None:
+            loaded = imap.get(pk)
+            if loaded is not None:
+                return loaded
+
         self._clean()
-        self.pk = self._gen_pk(key, superkey)
+        self.pk = pk
         self._original = cols or []
         self.revert()
+        if imap is not None:
+            imap.add(self)
         return self
 
     def _marshal(self):
@@ -8,19 +8,78 @@
 
 import time
 import datetime
+import heapq
+import itertools
+import threading
 from md5 import md5
 
+from cassandra.ttypes import ColumnPath
+
 from lazyboy.columnfamily import *
+from lazyboy.columnfamily import _column_size
+from lazyboy.concurrency import get_workers, pmap, submit
+
+
+def append_time(col):
+    """Return the time a column was written by View.append."""
+    return float(col.name.split('.', 1)[1])
+
 
 class View(CassandraBase):
     """A view"""
     family = ColumnFamily
 
+    # The number of objects to load at once when iterating
+    page_size = 20
+
+    # The number of columns to fetch per get_slice
+    chunk_size = 100
+
+    # The number of partitions to read at once
+    fanout = 1
+
+    # If set to a function or method taking a column, partitions are
+    # merged in order of merge_key(column), rather than read in
+    # partition order. See append_time. Every partition is read before
+    # the first column is returned, so this needs an occupancy_key, or
+    # view_keys() returning a list or tuple.
+    merge_key = None
+
+    # If set, the key of a row which records the partitions holding
+    # objects. View.append maintains it, and iteration only reads the
+    # partitions it lists. Partitions written before it was set are
+    # hidden, so run rebuild_occupancy() on an instance with it set
+    # before enabling it for the class.
+    occupancy_key = None
+
+    # The number of leading objects to cache, shared by every instance
+    # with the same cache_key. Cached objects must not be modified.
+    cache_size = 0
+
+    # The number of seconds the cached first page is used for
+    cache_ttl = 60
+
+    # First pages, by cache_key, as (time loaded, cache_ttl, page), and
+    # their keys from least to most recently used
+    _page_cache = {}
+    _page_cache_order = []
+    _page_cache_lock = threading.Lock()
+
+    # The most first pages to keep cached, across every view
+    _page_cache_size = 1000
+
+    # Remember a cursor every this many columns when seeking
+    _cursor_interval = 100
+
+    # The maximum number of offset cursors to keep
+    _cursor_cache_size = 32
+
     def __init__(self, start='', stop='', offset=0, limit=100):
         super(View, self).__init__()
-        self.pk = self._gen_pk()
         self.start, self.stop = start, stop
         self.offset, self.limit = offset, limit
+        self._cursors, self._cursor_order = {}, []
+        self._occupied = set()
 
     def view_keys(self, start=''):
         "Return a sequence of keys representing the partitions of this view."
@@ -37,31 +96,284 @@ class View(CassandraBase):
             return key
         raise Exception("I don't know how to cope with these keys.")
 
-    def _iter_partition_keys(self, partition_key):
-        """Return keys in one partition of the view."""
-        client = self._get_cas()
-        last_col, offset, limit = '', 0, 100
+    def _get_page(self, partition_key, start, count):
+        """Return up to count columns of a partition, from start."""
+        return self._get_cas().get_slice(self.pk.table, partition_key,
+                                         ColumnParent(self.pk.family),
+                                         start, '', True, count)
+
+    def _iter_partition_cols(self, partition_key, start='', first=None):
+        """Return columns in one partition of the view, after start.
+
+        If first is given, it is used as the already-fetched first
+        page of the partition."""
+        chunk_size = self.chunk_size
         while True:
-            cols = client.get_slice(self.pk.table, partition_key,
-                                    cassandra.ColumnParent(self.pk.family) ,
-                                    last_col, '', True, limit)
+            fudge = int(bool(start))
+            cols = first
+            if cols is None:
+                cols = self._get_page(partition_key, start,
+                                      chunk_size + fudge)
+            first = None
             if len(cols) == 0: raise StopIteration()
-            for col in cols: yield col.value
-            offset, last_col = 1, col.name
+            more = len(cols) >= chunk_size + fudge
+            if fudge and cols[0].name == start: cols = cols[1:]
+            for col in cols: yield col
+            if not cols or not more: raise StopIteration()
+            start = col.name
 
-            if len(cols) < limit: raise StopIteration()
+    def _iter_partition_keys(self, partition_key):
+        """Return keys in one partition of the view."""
+        return (col.value for col in
+                self._iter_partition_cols(partition_key))
 
-    def _iter_keys(self):
-        """Iterate over object keys for a given view key"""
-        for partk in self.view_keys():
-            for key in self._iter_partition_keys(partk):
+    def _iter_cols(self, cursor=None):
+        """Iterate over (partition key, column) pairs in this view.
+
+        If cursor is a (partition key, column name) pair, iteration
+        resumes with the column following it."""
+        partk, start = cursor or (None, '')
+        keys = self._iter_view_keys()
+        if partk is not None:
+            keys = itertools.dropwhile(lambda key: key != partk, keys)
+
+        if self.merge_key:
+            if not self.occupancy_key and \
+                    not isinstance(self.view_keys(), (list, tuple)):
+                raise ErrorNotSupported(
+                    "merge_key needs an occupancy_key or finite view_keys")
+            return self._iter_merged(keys)
+        if self.fanout > 1:
+            return self._iter_prefetched(keys, start)
+        return self._iter_serial(keys, start)
+
+    def _occupied_keys(self):
+        """Return the set of partition keys holding objects."""
+        return set(col.name for col in
+                   self._iter_partition_cols(self.occupancy_key))
+
+    def _iter_view_keys(self):
+        """Iterate over the keys of partitions which may hold objects.
+
+        With an occupancy_key, empty partitions are skipped without
+        reading them, and iteration stops after the last occupied one."""
+        keys = iter(self.view_keys())
+        if not self.occupancy_key:
+            return keys
+        return self._iter_occupied(keys, self._occupied_keys())
+
+    def _iter_occupied(self, keys, occupied):
+        for key in keys:
+            if not occupied: raise StopIteration()
+            if key in occupied:
+                occupied.discard(key)
                 yield key
 
         raise StopIteration()
 
+    def _iter_serial(self, keys, start=''):
+        """Read partitions one after another."""
+        for key in keys:
+            for col in self._iter_partition_cols(key, start):
+                yield key, col
+            start = ''
+
+        raise StopIteration()
+
+    def _iter_prefetched(self, keys, start=''):
+        """Read partitions in order, fetching up to fanout at once.
+
+        The first page of the next fanout partitions is requested in
+        the background while the current one is consumed."""
+        workers, pending = get_workers(), []
+        for key in keys:
+            count = self.chunk_size + int(bool(start))
+            pending.append((key, start, workers.submit(
+                        self._get_page, key, start, count)))
+            start = ''
+            if len(pending) < self.fanout: continue
+
+            (partk, _start, page) = pending.pop(0)
+            for col in self._iter_partition_cols(partk, _start,
+                                                 page.result()):
+                yield partk, col
+
+        for (partk, _start, page) in pending:
+            for col in self._iter_partition_cols(partk, _start,
+                                                 page.result()):
+                yield partk, col
+
+        raise StopIteration()
+
+    def _read_partition(self, key):
+        """Return every column of a partition, sorted by merge_key."""
+        cols = [(self.merge_key(col), i, col) for (i, col) in
+                enumerate(self._iter_partition_cols(key))]
+        cols.sort()
+        return cols
+
+    def _iter_merged(self, keys):
+        """Read every partition, merging them in merge_key order.
+
+        This needs the partitions to be few and small enough to hold
+        in memory; fanout of them are read at once."""
+        keys, streams = list(keys), []
+        for i in range(0, len(keys), self.fanout):
+            streams.extend(pmap(self._read_partition,
+                                keys[i:i + self.fanout]))
+
+        merged = heapq.merge(*[[(sort, n, i, key, col)
+                                for (sort, i, col) in cols]
+                               for (n, key, cols) in
+                               zip(itertools.count(), keys, streams)])
+        return ((key, col) for (sort, n, i, key, col) in merged)
+
+    def _iter_keys(self):
+        """Iterate over object keys for a given view key"""
+        return (col.value for (partk, col) in self._iter_cols())
+
+    def _load(self, key):
+        """Load and return the object for key, or None if it's gone."""
+        obj = self.family().load(key)
+        if not obj._original:
+            return None
+        return obj
+
+    def _load_keys(self, keys):
+        """Load objects for keys in parallel, returning them in order.
+
+        Keys whose objects no longer exist are passed to missing_key
+        and left out of the result."""
+        objs = []
+        for (key, obj) in zip(keys, pmap(self._load, keys)):
+            if obj is None:
+                self.missing_key(key)
+            else:
+                objs.append(obj)
+        return objs
+
+    def missing_key(self, key):
+        """Called with keys in this view whose objects no longer exist."""
+        pass
+
     def __iter__(self):
         """Iterate over all objects in this view."""
-        return (self.family().load(key) for key in self._iter_keys())
+        cached = self._cached()
+        if cached is None:
+            return self._iter_objects(self._iter_keys())
+        return self._iter_from_cache(cached)
+
+    def _iter_objects(self, keys):
+        """Load objects for keys a page at a time."""
+        while True:
+            page = list(itertools.islice(keys, self.page_size))
+            if not page: raise StopIteration()
+            for obj in self._load_keys(page):
+                yield obj
+
+    def _iter_from_cache(self, cached):
+        """Iterate over the cached first page, then the rest of the view."""
+        for (partk, col, obj) in cached:
+            if obj is not None:
+                yield obj
+
+        if len(cached) < self.cache_size: raise StopIteration()
+        partk, col = cached[-1][:2]
+        keys = (col.value for (partk, col) in
+                self._iter_cols((partk, col.name)))
+        for obj in self._iter_objects(keys):
+            yield obj
+
+    def cache_key(self):
+        """Return the key identifying this view in the first-page cache.
+
+        By default, views of the same class share a cache entry if
+        their current partition is the same."""
+        return (self.__class__, self.pk.table, self.pk.family,
+                self.current_key())
+
+    def _cached(self):
+        """Return the cached first page of this view, or None.
+
+        The page is a list of (partition key, column, object) tuples,
+        with None for objects which no longer exist. It is loaded if
+        missing or older than cache_ttl."""
+        if not self.cache_size or self.merge_key:
+            return None
+
+        key = self.cache_key()
+        page = self._cache_get(key)
+        if page is not None:
+            return page
+
+        now = time.time()
+        cols = list(itertools.islice(self._iter_cols(), self.cache_size))
+        objs = pmap(self._load, [col.value for (partk, col) in cols])
+        page = [(partk, col, obj) for ((partk, col), obj) in zip(cols, objs)]
+        self._cache_put(key, now, page)
+        return page
+
+    def _cache_get(self, key):
+        """Return the cached page for key, or None if missing or stale."""
+        self._page_cache_lock.acquire()
+        try:
+            entry = self._page_cache.get(key)
+            if key in self._page_cache_order:
+                self._page_cache_order.remove(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] >= self.cache_ttl:
+                del self._page_cache[key]
+                return None
+            self._page_cache_order.append(key)
+            return entry[2]
+        finally:
+            self._page_cache_lock.release()
+
+    def _cache_put(self, key, when, page):
+        """Cache a page, dropping expired and least recently used ones."""
+        cache, now = self._page_cache, time.time()
+        self._page_cache_lock.acquire()
+        try:
+            for (_key, (loaded, ttl, _page)) in cache.items():
+                if now - loaded >= ttl:
+                    del cache[_key]
+            cache[key] = (when, self.cache_ttl, page)
+            self._page_cache_order[:] = [
+                _key for _key in self._page_cache_order
+                if _key in cache and _key != key] + [key]
+
+            while len(self._page_cache_order) > self._page_cache_size:
+                cache.pop(self._page_cache_order.pop(0), None)
+        finally:
+            self._page_cache_lock.release()
+
+    def _cache_insert(self, partition_key, col, obj):
+        """Add a newly appended entry to the cached first page."""
+        key = self.cache_key()
+        self._page_cache_lock.acquire()
+        try:
+            entry = self._page_cache.get(key)
+            if not entry: return
+            (when, ttl, page) = entry
+
+            parts = [partk for (partk, _col, _obj) in page]
+            if partition_key not in parts:
+                # We can't tell where this partition sorts, so start over.
+                self._page_cache.pop(key, None)
+                return
+
+            pos = len(parts) - parts[::-1].index(partition_key)
+            for (i, (partk, _col, _obj)) in enumerate(page):
+                if partk == partition_key and _col.name > col.name:
+                    pos = i
+                    break
+
+            if pos >= self.cache_size: return
+            page = page[:pos] + [(partition_key, col, obj)] + page[pos:]
+            self._page_cache[key] = (when, ttl, page[:self.cache_size])
+        finally:
+            self._page_cache_lock.release()
 
     def _iter_time(self, start=None, **kwargs):
         day = start or datetime.datetime.today()
@@ -73,18 +385,272 @@ class View(CassandraBase):
     def _iter_days(self, start = None):
         return self._iter_time(start, days=1)
 
+    def _cursor(self, offset):
+        """Return the closest cached (offset, cursor) at or before offset."""
+        if self.merge_key:
+            return 0, None
+        best = max([o for o in self._cursors if o <= offset] or [0])
+        return best, self._cursors.get(best)
+
+    def _remember(self, offset, cursor):
+        """Cache a cursor which resumes iteration at offset."""
+        if offset in self._cursors or offset == 0: return
+        if len(self._cursors) >= self._cursor_cache_size:
+            del self._cursors[self._cursor_order.pop(0)]
+        self._cursors[offset] = cursor
+        self._cursor_order.append(offset)
+
+    def _seek(self, offset):
+        """Return an iterator of (partition key, column) starting at offset.
+
+        Columns are skipped without loading the objects they point
+        at, starting from the nearest cached cursor."""
+        pos, cursor = self._cursor(offset)
+        cols = self._iter_cols(cursor)
+        while pos < offset:
+            partk, col = cols.next()
+            pos += 1
+            if pos % self._cursor_interval == 0:
+                self._remember(pos, (partk, col.name))
+        return cols
+
+    def _window(self, start, stop):
+        """Return the keys of objects from offset start up to stop."""
+        keys = []
+        if stop is not None and stop <= start: return keys
+        try:
+            cols = self._seek(start)
+        except StopIteration:
+            return keys
+
+        cursor = None
+        for (partk, col) in cols:
+            keys.append(col.value)
+            cursor = (partk, col.name)
+            if stop is not None and start + len(keys) >= stop: break
+
+        # Only the end, so a wide window can't evict the seek checkpoints.
+        if cursor is not None:
+            self._remember(start + len(keys), cursor)
+        return keys
+
     def __getitem__(self, item):
-        # Fast-forward
-        i = 0
-        while i < item:
-            self.__iter__().next()
-            i += 1
-        return self.__iter__().next()
+        """Return the object at an offset, or a list of them for a slice.
+
+        If the object at an offset no longer exists, its key is passed
+        to missing_key and None is returned."""
+        if isinstance(item, slice):
+            if (item.start or 0) < 0 or (item.stop or 0) < 0:
+                raise ErrorNotSupported("Negative offsets are unsupported")
+            if item.stop is not None and item.stop <= self.cache_size:
+                cached = self._cached()
+                if cached is not None:
+                    return [obj for (partk, col, obj) in cached[item]
+                            if obj is not None]
+            keys = self._window(item.start or 0, item.stop)
+            return self._load_keys(keys[::item.step])
+
+        if item < 0:
+            raise ErrorNotSupported("Negative offsets are unsupported")
+        if item < self.cache_size:
+            cached = self._cached()
+            if cached is not None and item < len(cached) and \
+                    cached[item][2] is not None:
+                return cached[item][2]
+        keys = self._window(item, item + 1)
+        if not keys:
+            raise IndexError("View index out of range")
+        objs = self._load_keys(keys)
+        if not objs:
+            return None
+        return objs[0]
+
+    def page_async(self, start, stop):
+        """Return a Future for self[start:stop], loaded on the shared pool."""
+        return submit(self.__getitem__, slice(start, stop))
+
+    def _column(self, key, ts):
+        """Return the view column pointing at key, appended at ts."""
+        # This is a workaround, since we can't use `:' in column names yet.
+        colname = md5(key).hexdigest() + '.' + str(ts)
+        return Column(name=colname, value=key, timestamp=ts)
 
     def append(self, column):
+        col = self._column(column.pk.key, time.time())
+        self._cursors, self._cursor_order = {}, []
+        partk = self.current_key()
+        path = ColumnPath(self.pk.family, None, col.name)
+        self._get_cas().insert(self.pk.table, partk,
+                               path, col.value, col.timestamp, 0)
+        self._occupy(partk, col.timestamp)
+        if self.cache_size:
+            self._cache_insert(partk, col, column)
+
+    def extend(self, objects):
+        """Append many objects, with one batch_insert per partition."""
+        partk = self.current_key()
+        self._write({partk: [(self._column(obj.pk.key, time.time()), obj)
+                             for obj in objects]})
+
+    def _write(self, partitions):
+        """Write a dict of partition key -> list of (column, object).
+
+        Each partition is written in batches within the batch limits."""
+        self._cursors, self._cursor_order = {}, []
+        for (partk, entries) in partitions.items():
+            if not entries: continue
+            cols = [col for (col, obj) in entries]
+            self._write_batches(
+                lambda batch, partk=partk: self._get_cas().batch_insert(
+                    self.pk.table,
+                    BatchMutation(partk, {self.pk.family: batch}), 0),
+                self._split_batch(cols, _column_size),
+                lambda batch: [col.value for col in batch])
+            self._occupy(partk, cols[-1].timestamp)
+            if self.cache_size:
+                for (col, obj) in entries:
+                    self._cache_insert(partk, col, obj)
+
+    def buffered(self, max_entries=1000, max_delay=1.0):
+        """Return a BufferedAppender writing to this view."""
+        return BufferedAppender(self, max_entries, max_delay)
+
+    def rebuild_occupancy(self, keys=None, batch_size=100):
+        """Record every partition holding objects in the occupancy row.
+
+        keys defaults to view_keys(). Partitions are checked batch_size
+        at a time, in parallel. Returns the keys of occupied partitions."""
+        if not self.occupancy_key:
+            raise ErrorNotSupported("This view has no occupancy_key")
+
+        keys, occupied = iter(keys or self.view_keys()), []
+        while True:
+            batch = list(itertools.islice(keys, batch_size))
+            if not batch: return occupied
+            pages = pmap(lambda key: self._get_page(key, '', 1), batch)
+            for (key, page) in zip(batch, pages):
+                if page:
+                    self._occupied.discard(key)
+                    self._occupy(key, time.time())
+                    occupied.append(key)
+
+    def _occupy(self, partition_key, ts):
+        """Record partition_key in the occupancy row, if there is one."""
+        if not self.occupancy_key or partition_key in self._occupied:
+            return
+        self._get_cas().insert(
+            self.pk.table, self.occupancy_key,
+            ColumnPath(self.pk.family, None, partition_key), '', ts, 0)
+        self._occupied.add(partition_key)
+
+
+class BufferedAppender(object):
+    """Collects View.append calls and writes them in batches.
+
+    Entries are written once max_entries are buffered, or by a
+    background thread once the oldest has waited max_delay seconds.
+    The thread only runs while entries are buffered. Call close() when
+    done to write whatever is left.
+
+    Entries which fail to write are put back in the buffer and retried
+    max_delay seconds later, or by the next flush(). Errors from
+    background writes are kept in errors."""
+
+    def __init__(self, view, max_entries=1000, max_delay=1.0):
+        self.view = view
+        self.max_entries, self.max_delay = max_entries, max_delay
+        self.errors = []
+        self._buffer, self._size, self._since = {}, 0, None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def append(self, column):
+        """Buffer an object to be appended to the view."""
         ts = time.time()
-        # This is a workaround, since we can't use `:' in column names yet.
-        colname = md5(column.pk.key).hexdigest() + '.' + str(ts)
-        path = cassandra.ColumnPath(self.pk.family, None, colname)
-        self._get_cas().insert(self.pk.table, self.current_key(),
-                               path, column.pk.key, ts, 0)
+        entry = (self.view._column(column.pk.key, ts), column)
+        partk = self.view.current_key()
+        self._cond.acquire()
+        try:
+            self._buffer.setdefault(partk, []).append(entry)
+            self._size += 1
+            if self._since is None:
+                self._since = ts
+                self._start()
+            full = self._size >= self.max_entries or \
+                ts - self._since >= self.max_delay
+        finally:
+            self._cond.release()
+
+        if full:
+            self.flush()
+
+    def extend(self, objects):
+        """Buffer many objects to be appended to the view."""
+        for obj in objects:
+            self.append(obj)
+
+    def flush(self):
+        """Write all buffered entries to the view."""
+        self._cond.acquire()
+        try:
+            buf = self._buffer
+            self._buffer, self._size, self._since = {}, 0, None
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+        try:
+            self.view._write(buf)
+        except:
+            self._restore(buf)
+            raise
+
+    def _restore(self, buf):
+        """Put entries which failed to write back in the buffer."""
+        self._cond.acquire()
+        try:
+            for (partk, entries) in buf.items():
+                self._buffer[partk] = entries + self._buffer.get(partk, [])
+                self._size += len(entries)
+            if self._size:
+                self._since = time.time()
+                self._start()
+        finally:
+            self._cond.release()
+
+    def close(self):
+        """Write all buffered entries and wait for the thread to stop."""
+        self.flush()
+        thread = self._thread
+        if thread is not None and thread is not threading.currentThread():
+            thread.join()
+
+    def _start(self):
+        """Start the thread flushing delayed entries, if it isn't running."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                                            name="lazyboy-view-flush")
+            self._thread.setDaemon(True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._cond.acquire()
+            try:
+                if self._since is None:
+                    self._thread = None
+                    return
+                wait = self._since + self.max_delay - time.time()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+            finally:
+                self._cond.release()
+
+            try:
+                self.flush()
+            except Exception, e:
+                self.errors.append(e)
+
+    def __len__(self):
+        return self._size
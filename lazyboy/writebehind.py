@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Write-behind saving
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import sys
+import atexit
+import threading
+
+from cassandra.ttypes import ColumnPathOrParent, BatchMutation
+
+import lazyboy.connection as connection
+
+
+class WriteBehind(object):
+    """Queues row changes and writes them from a background thread.
+
+    Set a ColumnFamily's _write_behind to an instance of this, and
+    save() queues its changes and returns immediately. Changes to the
+    same row are merged while they wait, keeping whichever write or
+    delete of each column has the newest timestamp, and are written
+    every interval seconds, or sooner once batch_size rows are waiting.
+
+    At most max_rows rows are held; save() blocks while the queue is
+    full. Failed writes are passed to on_error(row, exc_info), or kept
+    in errors if there is no callback. Pending changes are written
+    when the process exits.
+
+    Classes with _indexes or _blobs can't use it, since those rows
+    would be written before the row they refer to."""
+
+    def __init__(self, max_rows=10000, batch_size=100, interval=0.5,
+                 on_error=None):
+        self.max_rows, self.batch_size = max_rows, batch_size
+        self.interval, self.on_error = interval, on_error
+        self.errors = []
+        self._pending = {}
+        self._writing, self._flushing = 0, 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run,
+                                        name="lazyboy-write-behind")
+        self._thread.setDaemon(True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, pk, columns, deleted):
+        """Queue columns to write and {name: timestamp} to delete.
+
+        Raises ValueError once the queue is closed, since nothing
+        would write the changes."""
+        row = (pk.table, pk.key, pk.family)
+        self._cond.acquire()
+        try:
+            while not self._closed and row not in self._pending and \
+                    len(self._pending) >= self.max_rows:
+                self._cond.wait()
+            if self._closed:
+                raise ValueError("Write-behind queue is closed")
+
+            (sets, dels) = self._pending.setdefault(row, ({}, {}))
+            for col in columns:
+                if col.timestamp >= max(
+                    getattr(sets.get(col.name), 'timestamp', 0),
+                    dels.get(col.name, 0)):
+                    sets[col.name] = col
+                    dels.pop(col.name, None)
+
+            for (name, ts) in deleted.items():
+                if ts >= max(getattr(sets.get(name), 'timestamp', 0),
+                             dels.get(name, 0)):
+                    dels[name] = ts
+                    sets.pop(name, None)
+
+            if len(self._pending) >= self.batch_size:
+                self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+    def __len__(self):
+        """Return the number of rows waiting to be written."""
+        return len(self._pending)
+
+    def _take(self):
+        """Wait for rows to write, then remove and return them."""
+        self._cond.acquire()
+        try:
+            if not (self._closed or self._flushing) and \
+                    len(self._pending) < self.batch_size:
+                self._cond.wait(self.interval)
+            pending, self._pending = self._pending, {}
+            self._writing = len(pending)
+            self._cond.notifyAll()
+            return pending
+        finally:
+            self._cond.release()
+
+    def _write(self, row, sets, dels):
+        (table, key, family) = row
+        client = connection.get_pool(table)
+        if sets:
+            client.batch_insert(
+                table, BatchMutation(key, {family: sets.values()}), 0)
+        for (name, ts) in dels.items():
+            client.remove(table, key,
+                          ColumnPathOrParent(family, None, name), ts, 0)
+
+    def _run(self):
+        while True:
+            pending = self._take()
+            for (row, (sets, dels)) in pending.items():
+                try:
+                    self._write(row, sets, dels)
+                except:
+                    if self.on_error:
+                        self.on_error(row, sys.exc_info())
+                    else:
+                        self.errors.append((row, sys.exc_info()[1]))
+
+            self._cond.acquire()
+            try:
+                self._writing = 0
+                self._cond.notifyAll()
+                if self._closed and not self._pending:
+                    return
+            finally:
+                self._cond.release()
+
+    def flush(self):
+        """Wait until every queued change has been written."""
+        self._cond.acquire()
+        try:
+            self._flushing += 1
+            self._cond.notifyAll()
+            while (self._pending or self._writing) and \
+                    self._thread.isAlive():
+                self._cond.wait(self.interval)
+        finally:
+            self._flushing -= 1
+            self._cond.release()
+
+    def close(self):
+        """Write any queued changes and stop the writer thread."""
+        self._cond.acquire()
+        try:
+            self._closed = True
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+        self._thread.join()
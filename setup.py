@@ -17,4 +17,6 @@ setup(name="Lazyboy",
       author="Ian Eure",
       author_email="ian@digg.com",
       license="BSD",
-      keywords="database cassandra")
+      keywords="database cassandra",
+      entry_points={'console_scripts':
+                        ['lazyboy-import = lazyboy.bulk:main']})
@@ -10,7 +10,7 @@ import unittest
 from lazyboy.base import CassandraBase
 import lazyboy.connection
 from lazyboy.primarykey import *
-from lazyboy.exceptions import ErrorUnknownTable
+from lazyboy.exceptions import ErrorUnknownTable, ErrorPartialWrite
 
 class CassandraBaseTest(unittest.TestCase):
     def __init__(self, *args, **kwargs):
@@ -69,6 +69,51 @@ class CassandraBaseTest(unittest.TestCase):
         self.assert_(type(self.object._gen_uuid()) == str)
         self.assert_(self.object._gen_uuid() != self.object._gen_uuid(),
                      "Unique IDs aren't very unique.")
+    def test_lazy_pk(self):
+        calls = []
+        class Lazy(self.class_):
+            _key = {'table': 'eggs', 'family': 'bacon'}
+            _key_generator = staticmethod(lambda: calls.append(1) or 'k')
+
+        obj = Lazy()
+        obj.pk = obj._gen_pk('spam')
+        self.assert_(obj.pk.key == 'spam' and not calls)
+        self.assert_(Lazy().pk.key == 'k' and len(calls) == 1)
+
+        obj = Lazy()
+        self.assert_(obj.pk is obj.pk and len(calls) == 2)
+
+    def test_split_batch(self):
+        self.object._batch_columns, self.object._batch_bytes = 3, 10
+        batches = self.object._split_batch(range(8), lambda i: 1)
+        self.assert_(batches == [[0, 1, 2], [3, 4, 5], [6, 7]])
+        batches = self.object._split_batch(range(5), lambda i: 4)
+        self.assert_(batches == [[0, 1], [2, 3], [4]])
+        batches = self.object._split_batch(['big', 'x'], len)
+        self.assert_(batches == [['big', 'x']])
+        self.assert_(self.object._split_batch([], len) == [])
+        del self.object._batch_columns, self.object._batch_bytes
+
+    def test_write_batches(self):
+        written = []
+        def write(batch):
+            if 'bad' in batch:
+                raise ValueError(batch)
+            written.extend(batch)
+        self.object._write_batches(write, [['a'], ['b', 'c']], list)
+        self.assert_(sorted(written) == ['a', 'b', 'c'])
+
+        try:
+            self.object._write_batches(write, [['d'], ['bad', 'e']], list)
+            self.fail("ErrorPartialWrite not raised")
+        except ErrorPartialWrite, e:
+            self.assert_(e.written == ['d'])
+            self.assert_(sorted(e.failed.keys()) == ['bad', 'e'])
+            self.assert_(e.failed['e'].__class__ is ValueError)
+
+        self.assertRaises(ValueError, self.object._write_batches, write,
+                          [['bad']], list)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Benchmark unit tests
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import os
+import tempfile
+import unittest
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from lazyboy import bench
+
+
+class BenchTest(unittest.TestCase):
+    def test_run_all(self):
+        results = bench.run_all(5)
+        self.assert_(sorted(results['results'].keys()) ==
+                     sorted([name for (name, setup) in bench.BENCHMARKS]))
+        for result in results['results'].values():
+            self.assert_(result['n'] == 5)
+            self.assert_(result['p50'] <= result['p99'] <= result['max'])
+            self.assert_(result['ops_per_sec'] > 0)
+            self.assert_('net_objects_per_op' in result and
+                         'peak_rss_growth_kb' in result)
+
+        results = bench.run_all(5, ['primarykey', 'view.append'])
+        self.assert_(sorted(results['results'].keys()) ==
+                     ['primarykey.clone', 'primarykey.create',
+                      'view.append'])
+
+    def test_fresh_server(self):
+        bench.run_all(3, ['columnfamily.save'])
+        results = bench.run_all(3, ['columnfamily.save', 'view'],
+                                latency=0.01)['results']
+        self.assert_(results['columnfamily.save']['p50'] >= 0.01,
+                     "A cached client ignored the new server's latency.")
+        self.assert_(len(list(bench.StoryView())) == 100,
+                     "Data leaked between benchmarks.")
+
+    def test_compare(self):
+        new = {'results': {'a': {'ops_per_sec': 150.0},
+                           'b': {'ops_per_sec': 10.0}}}
+        old = {'results': {'a': {'ops_per_sec': 100.0}}}
+        self.assert_(bench.compare(new, old) == {'a': 1.5})
+
+    def test_main(self):
+        (fd, path) = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self.assert_(bench.main(['-n', '3', '-o', path,
+                                     'columnfamily.load']) == 0)
+            results = json.load(open(path))
+            self.assert_(results['results'].keys() == ['columnfamily.load'])
+            self.assert_(bench.main(['-n', '3', '-B', path,
+                                     'columnfamily.load']) == 0)
+        finally:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Chunked value unit tests
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import unittest
+from StringIO import StringIO
+
+from cassandra.ttypes import Column
+
+from lazyboy.blob import Blob, write_chunks, remove_chunks, \
+    chunk_name, manifest, parse_manifest
+from lazyboy.columnfamily import ColumnFamily
+from lazyboy.exceptions import ErrorInvalidField, ErrorNotSupported
+
+
+class MockClient(object):
+    """A mock client keeping rows of columns in memory."""
+
+    def __init__(self):
+        self.rows, self.slices = {}, 0
+
+    def batch_insert(self, table, mutation, block_for):
+        for (family, cols) in mutation.cfmap.items():
+            row = self.rows.setdefault((family, mutation.key), {})
+            for col in cols:
+                row[col.name] = col
+
+    def remove(self, table, key, path, ts, block_for):
+        self.rows.get((path.column_family, key), {}).pop(path.column, None)
+
+    def get_slice(self, table, key, parent, start, finish, asc, count):
+        self.slices += 1
+        row = self.rows.get((parent.column_family, key), {})
+        names = [n for n in sorted(row.keys()) if
+                 (not start or n >= start) and (not finish or n <= finish)]
+        return [row[n] for n in names[:count]]
+
+
+class BlobTest(unittest.TestCase):
+    def setUp(self):
+        self.client = MockClient()
+        self.data = ''.join([chr(i % 256) for i in range(1000)])
+
+    def test_manifest(self):
+        self.assert_(parse_manifest(manifest(3, 250)) == (3, 250))
+        self.assert_(chunk_name(12) < chunk_name(100))
+
+    def test_write_chunks(self):
+        man = write_chunks(self.client, 't', 'f', 'k', self.data, 300, 1)
+        self.assert_(parse_manifest(man) == (4, 1000))
+        self.assert_(len(self.client.rows[('f', 'k')]) == 4)
+
+        man = write_chunks(self.client, 't', 'f', 'e', '', 300, 1)
+        self.assert_(parse_manifest(man) == (1, 0))
+
+        man = write_chunks(self.client, 't', 'f', 's',
+                           StringIO(self.data), 100, 1)
+        self.assert_(parse_manifest(man) == (10, 1000))
+
+    def test_remove_chunks(self):
+        write_chunks(self.client, 't', 'f', 'k', self.data, 100, 1)
+        remove_chunks(self.client, 't', 'f', 'k', 5, 10, 2)
+        self.assert_(sorted(self.client.rows[('f', 'k')].keys()) ==
+                     [chunk_name(i) for i in range(5)])
+
+    def test_read(self):
+        write_chunks(self.client, 't', 'f', 'k', self.data, 100, 1)
+        blob = Blob(self.client, 't', 'f', 'k', 10, 1000, page_size=3)
+        self.assert_(len(blob) == 1000)
+        self.assert_(blob.read(150) == self.data[:150])
+        self.assert_(self.client.slices == 1)
+        self.assert_(blob.read(10) == self.data[150:160])
+        self.assert_(blob.read() == self.data[160:])
+        self.assert_(blob.read() == '')
+        self.assert_(self.client.slices == 4)
+
+    def test_iter(self):
+        write_chunks(self.client, 't', 'f', 'k', self.data, 300, 1)
+        blob = Blob(self.client, 't', 'f', 'k', 4, 1000, page_size=2)
+        self.assert_([len(c) for c in blob] == [300, 300, 300, 100])
+        blob.close()
+        self.assert_(blob.closed)
+
+
+class ColumnFamilyBlobTest(unittest.TestCase):
+    class Document(ColumnFamily):
+        _key = {'table': 'eggs', 'family': 'bacon'}
+        _blobs = ('body',)
+        _blob_family = 'bacon_chunks'
+        _blob_chunk_size = 100
+
+    def setUp(self):
+        self.client = MockClient()
+        self.Document._get_cas = lambda s, table=None: self.client
+
+    def test_save(self):
+        doc = self.Document()
+        doc.pk = doc.pk.clone(key='doc')
+        doc['title'] = 'spam'
+        doc['body'] = StringIO('x' * 450)
+        doc.save()
+
+        self.assert_(self.client.rows[('bacon', 'doc')]['body'].value ==
+                     manifest(5, 450))
+        self.assert_(len(self.client.rows[('bacon_chunks', 'doc:body')]) == 5)
+        self.assert_(doc.open_blob('body').read() == 'x' * 450)
+
+        doc['body'] = 'y' * 150
+        doc.save()
+        self.assert_(len(self.client.rows[('bacon_chunks', 'doc:body')]) == 2)
+        self.assert_(doc.open_blob('body').read() == 'y' * 150)
+
+        del doc['body']
+        doc.save()
+        self.assert_(not self.client.rows[('bacon_chunks', 'doc:body')])
+        self.assertRaises(ErrorInvalidField, doc.open_blob, 'title')
+
+    def test_family(self):
+        doc = self.Document()
+        doc['body'] = 'x' * 10
+        for family in (None, 'bacon'):
+            doc._blob_family = family
+            self.assertRaises(ErrorNotSupported, doc.save)
+        self.assert_(not self.client.rows,
+                     "Saved without anywhere to keep the chunks.")
+
+
+if __name__ == '__main__':
+    unittest.main()
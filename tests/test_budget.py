@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: RPC budget unit tests
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+from __future__ import with_statement
+
+import threading
+import unittest
+import warnings
+
+from lazyboy import instrument
+from lazyboy.budget import RPCBudget
+from lazyboy.concurrency import pmap
+from lazyboy.connection import Client
+from lazyboy.exceptions import ErrorBudgetExceeded
+
+from test_instrument import MockCassandra
+
+
+class RPCBudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.client = Client([])
+        self.client._clients.append(MockCassandra())
+
+    def tearDown(self):
+        instrument.hooks = []
+
+    def test_count(self):
+        with RPCBudget() as budget:
+            for key in ('a', 'b', 'a'):
+                self.client.get_slice('eggs', key)
+            self.client.batch_insert('bacon', None, 0)
+        self.client.get_slice('eggs', 'c')
+
+        report = budget.report()
+        self.assert_(report['total'] == 4)
+        self.assert_(report['methods'] == {'get_slice': 3, 'batch_insert': 1})
+        self.assert_(report['tables'] == {'eggs': 3, 'bacon': 1})
+        self.assert_(report['sites'].keys()[0].startswith(
+                __file__.rstrip('c')))
+        self.assert_([r[:4] for r in report['repeated']] ==
+                     [('get_slice', 'eggs', 'a', 2)])
+        self.assert_(not instrument.hooks)
+
+    def test_raise(self):
+        def over():
+            with RPCBudget(limit=2):
+                for i in range(3):
+                    self.client.get_slice('eggs', str(i))
+        self.assertRaises(ErrorBudgetExceeded, over)
+
+        def repeats():
+            with RPCBudget(max_repeats=1):
+                for i in range(2):
+                    self.client.get_slice('eggs', 'a')
+        self.assertRaises(ErrorBudgetExceeded, repeats)
+
+        def method():
+            with RPCBudget(limits={'get_slice': 1}):
+                self.client.batch_insert('eggs', None, 0)
+                self.client.get_slice('eggs', 'a')
+                self.client.get_slice('eggs', 'b')
+        self.assertRaises(ErrorBudgetExceeded, method)
+
+    def test_warn(self):
+        warnings.simplefilter('error', RuntimeWarning)
+        try:
+            def over():
+                with RPCBudget(limit=0, action='warn'):
+                    self.client.get_slice('eggs', 'a')
+            self.assertRaises(RuntimeWarning, over)
+        finally:
+            warnings.resetwarnings()
+
+        with RPCBudget(limit=0, action=None) as budget:
+            self.client.get_slice('eggs', 'a')
+            self.client.get_slice('eggs', 'b')
+        self.assert_(len(budget.exceeded) == 2)
+
+    def test_decorator(self):
+        budget = RPCBudget(limit=1)
+        @budget
+        def fetch(key):
+            return self.client.get_slice('eggs', key)
+        fetch('a')
+        fetch('b')
+        self.assert_(budget.total == 0)
+        self.assert_(fetch.__name__ == 'fetch')
+
+    def test_sample(self):
+        with RPCBudget(limit=0, sample=0.0) as budget:
+            self.client.get_slice('eggs', 'a')
+        self.assert_(not budget.active and budget.total == 0)
+
+    def test_threads(self):
+        fetch = lambda key: self.client.get_slice('eggs', key)
+        with RPCBudget() as budget:
+            pmap(fetch, ['a', 'b', 'c'])
+            other = threading.Thread(target=fetch, args=('d',))
+            other.start()
+            other.join()
+        self.assert_(budget.total == 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Bulk loader unit tests
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import json
+import unittest
+from StringIO import StringIO
+
+from cassandra.ttypes import Column
+
+import lazyboy.connection
+from lazyboy.connection import Client
+from lazyboy.columnfamily import ColumnFamily
+from lazyboy.supercolumnfamily import SuperColumnFamily
+from lazyboy.bulk import Loader, read_jsonl, read_csv
+from lazyboy.export import write_jsonl
+
+
+class MockClient(Client):
+    """A mock Cassandra client which records mutations."""
+    def __init__(self):
+        self.mutations = []
+
+    def batch_insert(self, table, batch_mutation, block_for):
+        if batch_mutation.key == 'fail':
+            raise Exception("Write failed")
+        self.mutations.append(batch_mutation)
+
+    def batch_insert_superColumn(self, table, batch_mutation, block_for):
+        self.mutations.append(batch_mutation)
+
+
+class LoaderTest(unittest.TestCase):
+    class ColumnFamily(ColumnFamily):
+        _key = {'table': 'eggs', 'family': 'bacon'}
+        _required = ('title',)
+
+    class SuperColumnFamily(SuperColumnFamily):
+        _key = {'table': 'eggs', 'supercol': 'sausage'}
+
+    def setUp(self):
+        self.client = MockClient()
+        self.__get_pool = lazyboy.connection.get_pool
+        lazyboy.connection.get_pool = lambda table: self.client
+
+    def tearDown(self):
+        lazyboy.connection.get_pool = self.__get_pool
+
+    def test_read_jsonl(self):
+        records = list(read_jsonl(StringIO('{"key": "a"}\n\nspam\n')))
+        self.assert_(records == [{'key': 'a'}, 'spam\n'])
+
+    def test_read_csv(self):
+        records = list(read_csv(StringIO('key,title\na,eggs\nb,spam\n')))
+        self.assert_(records == [{'key': 'a', 'title': 'eggs'},
+                                 {'key': 'b', 'title': 'spam'}])
+
+    def test_load(self):
+        records = [{'key': 'k%d' % i, 'title': 't%d' % i}
+                   for i in range(200)]
+        progress = []
+        stats = Loader(self.ColumnFamily, workers=4, backlog=5).load(
+            records, progress.append, every=50)
+        self.assert_(stats['read'] == 200 and stats['written'] == 200)
+        self.assert_(len(progress) == 5)
+        self.assert_(sorted([m.key for m in self.client.mutations]) ==
+                     sorted([r['key'] for r in records]))
+        for m in self.client.mutations:
+            cols = dict((c.name, c.value) for c in m.cfmap['bacon'])
+            self.assert_(cols == {'title': 't' + m.key[1:]})
+
+    def test_load_super(self):
+        records = [{'key': 'k%d' % i, 'superkey': 's%d' % i,
+                    'title': 't%d' % i} for i in range(20)]
+        records.append({'key': 'k', 'title': 'no superkey'})
+        stats = Loader(self.SuperColumnFamily).load(records)
+        self.assert_(stats['written'] == 20 and stats['rejected'] == 1)
+        for m in self.client.mutations:
+            [scol] = m.cfmap['sausage']
+            self.assert_(scol.name == 's' + m.key[1:])
+            cols = dict((c.name, c.value) for c in scol.columns)
+            self.assert_(cols == {'title': 't' + m.key[1:]})
+
+    def test_dead_letter_binary(self):
+        dead = StringIO()
+        records = read_csv(StringIO('key,title\n' +
+                                    'fail,caf\xe9\n' * 20))
+        stats = Loader(self.ColumnFamily, workers=2, backlog=2,
+                       dead_letter=dead).load(records)
+        self.assert_(stats['rejected'] == 20)
+        [record] = read_jsonl(StringIO(dead.getvalue().splitlines()[0]))
+        self.assert_(record['record'] ==
+                     {'key': 'fail', 'title': {'__base64__': 'Y2Fm6Q=='}})
+
+    def test_load_exported(self):
+        out = StringIO()
+        write_jsonl(out, 'caf\xc3\xa9',
+                    [Column('superkey', 's\xc3\xa9'),
+                     Column('t\xc3\xaftle', 'na\xc3\xafve')])
+        stats = Loader(self.SuperColumnFamily).load(
+            read_jsonl(StringIO(out.getvalue())))
+        self.assert_(stats['written'] == 1)
+        [m] = self.client.mutations
+        [scol] = m.cfmap['sausage']
+        [col] = scol.columns
+        self.assert_((m.key, scol.name, col.name, col.value) ==
+                     ('caf\xc3\xa9', 's\xc3\xa9', 't\xc3\xaftle',
+                      'na\xc3\xafve'))
+        self.assert_(type(m.key) is type(scol.name) is type(col.name) is str,
+                     "Text wasn't loaded as UTF-8 strings.")
+
+    def test_dead_letter(self):
+        dead = StringIO()
+        records = [{'key': 'a', 'title': 'eggs'}, {'title': 'no key'},
+                   {'key': 'b'}, {'key': 'fail', 'title': 'spam'}, 'junk']
+        stats = Loader(self.ColumnFamily, dead_letter=dead).load(records)
+        self.assert_(stats['written'] == 1 and stats['rejected'] == 4)
+        rejected = [json.loads(line)['record']
+                    for line in dead.getvalue().splitlines()]
+        self.assert_(sorted(rejected) == sorted(records[1:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,7 +15,8 @@ from cassandra.ttypes import Column, ColumnParent, BatchMutation
 
 from lazyboy.connection import Client
 from lazyboy.columnfamily import ColumnFamily
-from lazyboy.exceptions import ErrorMissingField
+from lazyboy.exceptions import ErrorMissingField, ErrorInvalidField, \
+    ErrorNotSupported
 
 from test_base import CassandraBaseTest
 
@@ -158,6 +159,12 @@ class ColumnFamilyTest(CassandraBaseTest):
             self.assert_(self.object[col.name] == col.value)
             self.assert_(self.object._columns[col.name] == col)
 
+    def test_load_async(self):
+        self.object._get_cas = self.get_mock_cassandra
+        future = self.object.load_async('eggs')
+        self.assert_(future.result() is self.object)
+        self.assert_(self.object.pk.key == 'eggs')
+
     def test_save(self):
         self.assertRaises(ErrorMissingField, self.object.save)
         data = {'eggs': 1, 'bacon': 2, 'sausage': 3}
@@ -196,6 +203,73 @@ class ColumnFamilyTest(CassandraBaseTest):
             self.assert_(col == self.object._columns[col.name],
                          "Column from cf._columns wasn't used in mutation_t")
 
+    def test_save_split(self):
+        self.object._get_cas = self.get_mock_cassandra
+        self.object._batch_columns = 2
+        self.object.update(dict(('eggs%d' % i, i) for i in range(5)),
+                           eggs='spam')
+        n = len(_mutations)
+        self.object.save()
+        self.assert_(len(_mutations) == n + 3,
+                     "Save wasn't split into batches.")
+        names = [c.name for m in _mutations[n:] for c in m.cfmap['bacon']]
+        self.assert_(sorted(names) == sorted(self.object.keys()))
+
+    def test_indexes(self):
+        removed = []
+        self.object._indexes = ('email',)
+        self.object._get_cas = self.get_mock_cassandra
+        MockClient.remove = lambda self, table, key, path, ts, block: \
+            removed.append((key, path.column))
+
+        self.object.update({'eggs': 'spam', 'email': 'a@example.com'})
+        n = len(_mutations)
+        self.assertRaises(ErrorNotSupported, self.object.save)
+        self.object._index_family = 'bacon'
+        self.assertRaises(ErrorNotSupported, self.object.save)
+        self.assert_(len(_mutations) == n,
+                     "Saved without anywhere to keep the index.")
+
+        self.object._index_family = 'bacon_index'
+        self.object.save()
+        mutation = _mutations[-1]
+        self.assert_(mutation.key == 'bacon:email:a@example.com',
+                     "Index row %s wasn't written." % (mutation.key,))
+        self.assert_(mutation.cfmap['bacon_index'][0].name ==
+                     self.object.pk.key)
+        self.assert_(removed == [])
+
+        self.object['email'] = 'b@example.com'
+        self.object.save()
+        self.assert_(_mutations[-1].key == 'bacon:email:b@example.com')
+        self.assert_(removed == [('bacon:email:a@example.com',
+                                  self.object.pk.key)],
+                     "Stale index entry wasn't removed.")
+
+        self.object['eggs'] = 'sausage'
+        n = len(_mutations)
+        self.object.save()
+        self.assert_(len(_mutations) == n + 1,
+                     "Unchanged indexed field was rewritten.")
+        del MockClient.remove
+
+    def test_find_keys(self):
+        self.assertRaises(ErrorInvalidField, self.object.find_keys,
+                          'email', 'a@example.com')
+        self.object._indexes = ('email',)
+        self.assertRaises(ErrorNotSupported, self.object.find_keys,
+                          'email', 'a@example.com')
+        self.object._index_family = 'bacon_index'
+        mock = self.get_mock_cassandra()
+        mock.get_slice = lambda table, key, parent, start, finish, asc, \
+            count: [Column(name=k, value=k) for k in ('k1', 'k2', 'k3')
+                    if k >= start and parent.column_family == 'bacon_index'
+                    ][:count]
+        self.object._get_cas = lambda: mock
+        self.assert_(self.object.find_keys('email', 'x', count=2) ==
+                     ['k1', 'k2'])
+        self.assert_(self.object.find_keys('email', 'x', 'k2') == ['k3'])
+
     def test_revert(self):
         data = {'id': 'eggs', 'title': 'bacon'}
         for k in data:
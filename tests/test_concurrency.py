@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Concurrency unit tests
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import time
+import random
+import unittest
+
+from lazyboy.concurrency import WorkerPool, pmap, submit, wait_all, \
+    set_workers, get_workers
+
+
+class WorkerPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = WorkerPool(4)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_submit(self):
+        future = self.pool.submit(lambda a, b: a + b, 1, b=2)
+        self.assert_(future.result() == 3)
+        self.assert_(future.done())
+
+    def test_error(self):
+        def fail():
+            raise ValueError("spam")
+        future = self.pool.submit(fail)
+        self.assertRaises(ValueError, future.result)
+
+    def test_map(self):
+        def slow(i):
+            time.sleep(random.random() / 100)
+            return i * 2
+        self.assert_(self.pool.map(slow, range(20)) ==
+                     [i * 2 for i in range(20)])
+
+    def test_nested(self):
+        inner = lambda i: self.pool.map(lambda j: i + j, range(3))
+        self.assert_(self.pool.map(inner, range(8))[7] == [7, 8, 9])
+
+    def test_wait_all(self):
+        futures = [submit(time.sleep, 0.01) for i in range(5)]
+        self.assert_(wait_all(futures) == [None] * 5)
+
+        slow = submit(time.sleep, 1)
+        self.assertRaises(RuntimeError, wait_all, [slow], 0.01)
+
+        futures = [submit(int, 'spam'), submit(int, '1')]
+        self.assertRaises(ValueError, wait_all, futures)
+        self.assert_(futures[1].done())
+
+    def test_set_workers(self):
+        set_workers(3)
+        self.assert_(get_workers().size == 3)
+        self.assert_(pmap(str, range(3)) == ['0', '1', '2'])
+        set_workers(8)
+
+    def test_pmap(self):
+        self.assert_(pmap(str, range(5)) == ['0', '1', '2', '3', '4'])
+        self.assert_(pmap(str, []) == [])
+
+
+if __name__ == '__main__':
+    unittest.main()
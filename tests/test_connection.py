@@ -1,4 +1,7 @@
 from lazyboy.connection import *
+import math
+import random
+import threading
 import unittest
 import time
 
@@ -56,5 +59,153 @@ class TestClient(unittest.TestCase):
         self.assert_(results[0].name == "12345")
 
 
+class TestPool(unittest.TestCase):
+    def test_per_thread(self):
+        add_pool('threads', ['localhost:9160'])
+        clients, done = [], threading.Event()
+        def worker():
+            clients.append((get_pool('threads'), get_pool('threads')))
+            # Stay alive, so the other thread can't reuse our identity.
+            done.wait()
+        threads = [threading.Thread(target=worker, name="worker")
+                   for i in range(2)]
+        for thread in threads: thread.start()
+        while len(clients) < 2: time.sleep(0.01)
+        done.set()
+        for thread in threads: thread.join()
+        clients = [c for pair in clients for c in pair]
+        self.assert_(clients[0] is clients[1] and clients[2] is clients[3])
+        self.assert_(clients[0] is not clients[2],
+                     "Threads with the same name shared a client.")
+
+
+    def test_replace(self):
+        add_pool('replaced', ['localhost:9160'])
+        old = get_pool('replaced')
+        add_pool('replaced', ['localhost:9161'])
+        new = get_pool('replaced')
+        self.assert_(new is not old,
+                     "The replaced pool's client was still used.")
+        self.assert_(new.listServers()[0].server == 'localhost:9161')
+
+
+class TestLimiter(unittest.TestCase):
+    def test_increase(self):
+        limiter = Limiter(initial=2, maximum=4)
+        for i in range(50):
+            n = limiter.stats()['limit']
+            for j in range(n): limiter.acquire()
+            for j in range(n): limiter.release(0.01)
+        self.assert_(limiter.stats()['limit'] == 4)
+
+        limiter = Limiter(initial=2)
+        for i in range(50):
+            limiter.acquire()
+            limiter.release(0.01)
+        self.assert_(limiter.stats()['limit'] == 2,
+                     "Limit grew without being reached.")
+        self.assert_(limiter.stats()['in_flight'] == 0)
+
+    def test_backoff(self):
+        limiter = Limiter(initial=10, backoff=0.5)
+        limiter.acquire()
+        limiter.release(0.001)
+        limiter.acquire()
+        limiter.release(0.001, failed=True)
+        self.assert_(limiter.stats()['limit'] == 5)
+        limiter.acquire()
+        limiter.release(1.0)
+        self.assert_(limiter.stats()['limit'] == 5,
+                     "Backed off twice for one round trip.")
+
+        limiter.acquire()
+        limiter.release(0.001, method='get_slice')
+        time.sleep(0.02)
+        limiter.acquire()
+        limiter.release(0.01, method='get_slice')
+        self.assert_(limiter.stats()['limit'] == 2)
+
+    def test_variance(self):
+        limiter = Limiter(initial=32)
+        rand = random.Random(0)
+        def worker():
+            for i in range(25):
+                limiter.acquire()
+                start = time.time()
+                time.sleep(rand.lognormvariate(math.log(0.002), 0.5))
+                limiter.release(time.time() - start, method='get_slice')
+        threads = [threading.Thread(target=worker) for i in range(8)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assert_(limiter.stats()['limit'] >= 8,
+                     "Normal latency spread throttled the pool.")
+
+    def test_queue(self):
+        limiter = Limiter(initial=1)
+        limiter.acquire()
+        import threading
+        done = []
+        def worker():
+            limiter.acquire()
+            done.append(True)
+        thread = threading.Thread(target=worker)
+        thread.start()
+        time.sleep(0.05)
+        self.assert_(not done, "Limit wasn't enforced.")
+        limiter.release(0.01)
+        thread.join()
+        self.assert_(done and limiter.stats()['max_queue_delay'] > 0)
+
+
+class TestStack(unittest.TestCase):
+    def test_build(self):
+        (sock, transport, protocol) = Stack().build('localhost', '9160')
+        self.assert_(type(transport) is TTransport.TBufferedTransport)
+        (sock, transport, protocol) = Stack(transport='framed').build(
+            'localhost', 9160)
+        self.assert_(type(transport) is TTransport.TFramedTransport)
+        self.assert_(type(Stack(accelerate=False).build('localhost', 1)[2])
+                     is TBinaryProtocol.TBinaryProtocol)
+
+        self.assertRaises(ValueError, Stack, transport='spam')
+        self.assertRaises(ValueError, Stack, protocol='spam')
+        if TCompactProtocol is None:
+            self.assertRaises(ErrorNotSupported, Stack, protocol='compact')
+
+    def test_tune(self):
+        class Handle(object):
+            options = []
+            def setsockopt(self, level, option, value):
+                self.options.append((option, value))
+        class Sock(object):
+            handle = Handle()
+
+        Stack().tune(Sock())
+        self.assert_(Handle.options == [])
+        Stack(nodelay=True, keepalive=True, sndbuf=65536).tune(Sock())
+        self.assert_(Handle.options == [(socket.TCP_NODELAY, 1),
+                                        (socket.SO_KEEPALIVE, 1),
+                                        (socket.SO_SNDBUF, 65536)])
+
+    def test_describe(self):
+        client = Client(['localhost:9160', 'localhost:9161'],
+                        stack=Stack(transport='framed', rbuf_size=8192))
+        info = client.describe()
+        self.assert_(info['transport'] == 'framed')
+        self.assert_(info['rbuf_size'] == 8192)
+        self.assert_(sorted(info['servers'].keys()) ==
+                     ['localhost:9160', 'localhost:9161'])
+        self.assert_(info['accelerated'] ==
+                     info['servers']['localhost:9160']['accelerated'])
+
+        stack = Stack(accelerate=False)
+        (sock, transport, protocol) = stack.build('localhost', 9160)
+        self.assert_(stack.accelerated(transport, protocol)[0] is False)
+
+        add_pool('stacked', ['localhost:9160'], stack=stack)
+        self.assert_(get_stack('stacked') is stack)
+        self.assert_(get_pool('stacked').stack is stack)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Exporter unit tests
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import os
+import json
+import uuid
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from cassandra.ttypes import Column
+
+import lazyboy.connection
+from lazyboy.columnfamily import ColumnFamily
+from lazyboy.export import Exporter, read_binary, write_jsonl
+from lazyboy.bulk import read_jsonl
+from lazyboy.exceptions import ErrorInvalidField
+
+from test_scan import MockClient as ScanClient
+
+
+class MockClient(ScanClient):
+    """A mock Cassandra client with wide rows."""
+    def get_slice(self, table, key, parent, start, finish, asc, count):
+        cols = [Column(name="c%04d" % i, value=key, timestamp=i)
+                for i in range(25)]
+        return [col for col in cols if col.name >= start][:count]
+
+
+class ExporterTest(unittest.TestCase):
+    class ColumnFamily(ColumnFamily):
+        _key = {'table': 'eggs', 'family': 'bacon'}
+
+    def setUp(self):
+        self.keys = [uuid.uuid4().hex for i in range(200)]
+        client = MockClient(self.keys)
+        self.__get_pool = lazyboy.connection.get_pool
+        lazyboy.connection.get_pool = lambda table: client
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        lazyboy.connection.get_pool = self.__get_pool
+        shutil.rmtree(self.dir)
+
+    def test_jsonl(self):
+        exporter = Exporter(self.ColumnFamily, self.dir, workers=3,
+                            batch_size=9)
+        exporter.chunk_size = 10
+        shards = exporter.export()
+        self.assert_(len(shards) == len(exporter.ranges))
+        rows = [json.loads(line) for path in shards for line in open(path)]
+        self.assert_(sorted([row['key'] for row in rows]) ==
+                     sorted(self.keys))
+        for row in rows:
+            self.assert_(len(row) == 26, "Wide row was truncated.")
+        self.assert_(sum([s['rows'] for s in
+                          exporter.report().values()]) == 200)
+
+    def test_jsonl_binary(self):
+        out = StringIO()
+        cols = [Column('text', 'caf\xc3\xa9'), Column('bytes', '\xff\x00\xfe'),
+                Column('\x9c\x01', 'spam'), Column('__base64__:x', 'eggs')]
+        write_jsonl(out, '\x80key', cols)
+        row = json.loads(out.getvalue())
+        self.assert_(row['text'] == u'caf\xe9',
+                     "UTF-8 text wasn't kept readable.")
+        [record] = read_jsonl(StringIO(out.getvalue()))
+        expected = dict((c.name, c.value) for c in cols)
+        expected['key'] = '\x80key'
+        self.assert_(record == expected,
+                     "Binary data didn't survive the round trip.")
+
+    def test_key_field(self):
+        cols = [Column('key', 'user-supplied'), Column('title', 'spam')]
+        self.assertRaises(ErrorInvalidField, write_jsonl, StringIO(),
+                          'rowkey', cols)
+        out = StringIO()
+        write_jsonl(out, 'rowkey', cols, key_field='_key')
+        self.assert_(json.loads(out.getvalue()) ==
+                     {'_key': 'rowkey', 'key': 'user-supplied',
+                      'title': 'spam'})
+
+        exporter = Exporter(self.ColumnFamily, self.dir, key_field='_key')
+        rows = [json.loads(line) for path in exporter.export()
+                for line in open(path)]
+        self.assert_(sorted([row['_key'] for row in rows]) ==
+                     sorted(self.keys))
+
+    def test_binary(self):
+        exporter = Exporter(self.ColumnFamily, self.dir, format='binary',
+                            workers=2)
+        rows = []
+        for path in exporter.export():
+            rows.extend(read_binary(open(path, 'rb')))
+        self.assert_(sorted([key for (key, cols) in rows]) ==
+                     sorted(self.keys))
+        (key, cols) = rows[0]
+        self.assert_(cols[3] == ('c0003', key, 3.0))
+
+    def test_resume(self):
+        exporter = Exporter(self.ColumnFamily, self.dir, workers=2)
+        shards = exporter.export()
+        open(shards[0], 'w').write('done')
+        Exporter(self.ColumnFamily, self.dir, workers=2).export()
+        self.assert_(open(shards[0]).read() == 'done',
+                     "Complete shard was rewritten.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Identity map unit tests
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+from __future__ import with_statement
+
+import gc
+import time
+import unittest
+
+from cassandra.ttypes import Column
+
+from lazyboy import identity
+from lazyboy.identity import IdentityMap
+from lazyboy.columnfamily import ColumnFamily
+from lazyboy.concurrency import pmap, submit
+
+
+class MockClient(object):
+    """A mock client counting the rows it's asked for."""
+
+    def __init__(self):
+        self.loads = []
+
+    def get_slice(self, table, key, parent, start, finish, asc, count):
+        self.loads.append(key)
+        return [Column('title', 'Row %s' % key, time.time())]
+
+
+class Story(ColumnFamily):
+    _key = {'table': 'eggs', 'family': 'bacon'}
+
+
+class IdentityMapTest(unittest.TestCase):
+    def setUp(self):
+        self.client = MockClient()
+        Story._get_cas = lambda s, table=None: self.client
+
+    def test_scope(self):
+        self.assert_(identity.current() is None)
+        with IdentityMap() as outer:
+            self.assert_(identity.current() is outer)
+            with IdentityMap() as inner:
+                self.assert_(identity.current() is inner)
+            self.assert_(identity.current() is outer)
+        self.assert_(identity.current() is None)
+
+    def test_load(self):
+        self.assert_(Story().load('a') is not Story().load('a'))
+        self.assert_(len(self.client.loads) == 2)
+
+        with IdentityMap() as imap:
+            story = Story().load('a')
+            self.assert_(Story().load('a') is story)
+            self.assert_(Story().load('b') is not story)
+            self.assert_(self.client.loads == ['a', 'a', 'a', 'b'])
+            self.assert_(imap.hits == 1 and imap.misses == 2)
+
+        self.assert_(Story().load('a') is not story)
+
+    def test_weak(self):
+        with IdentityMap() as imap:
+            story = Story().load('a')
+            self.assert_(story.pk in imap)
+            del story
+            gc.collect()
+            self.assert_(len(imap) == 0)
+            Story().load('a')
+            self.assert_(len(self.client.loads) == 2)
+
+    def test_workers(self):
+        with IdentityMap():
+            stories = pmap(lambda k: Story().load(k), ['a', 'b', 'a', 'b'])
+            self.assert_(Story().load('a') in stories)
+            self.assert_(submit(identity.current).result() is not None)
+        self.assert_(submit(identity.current).result() is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
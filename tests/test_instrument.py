@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Instrumentation unit tests
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import unittest
+
+from cassandra.ttypes import Column, BatchMutation
+
+from lazyboy import instrument
+from lazyboy.instrument import Hook, Collector, Histogram, approx_size, \
+    add_hook, remove_hook
+from lazyboy.connection import Client
+
+
+class MockTransport(object):
+    def isOpen(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class MockCassandra(object):
+    """A mock Thrift client."""
+    server = 'localhost:9160'
+    transport = MockTransport()
+
+    def get_slice(self, table, key, *args):
+        return [Column('name', 'value', 1)]
+
+    def batch_insert(self, table, mutation, block_for):
+        return None
+
+    def remove(self, *args):
+        raise ValueError("spam")
+
+
+class Recorder(Hook):
+    def __init__(self):
+        self.events = []
+
+    def before(self, call):
+        self.events.append(('before', call.method, call.table, call.key))
+
+    def after(self, call, result):
+        self.events.append(('after', call.method, call.bytes_in))
+
+    def error(self, call, exc_info):
+        self.events.append(('error', call.method, exc_info[0]))
+
+
+class InstrumentTest(unittest.TestCase):
+    def setUp(self):
+        self.client = Client([])
+        self.client._clients.append(MockCassandra())
+
+    def tearDown(self):
+        instrument.hooks = []
+
+    def test_approx_size(self):
+        self.assert_(approx_size('spam') == 4)
+        self.assert_(approx_size(['a', 'bb', None]) == 3)
+        self.assert_(approx_size(Column('name', 'value', 1)) == 17)
+
+    def test_hooks(self):
+        recorder = Recorder()
+        add_hook(recorder)
+        self.client.get_slice('eggs', 'bacon', None)
+        self.client.batch_insert('eggs', BatchMutation('spam', {}), 0)
+        self.assertRaises(ValueError, self.client.remove, 'eggs', 'ham')
+        self.assert_(recorder.events == [
+                ('before', 'get_slice', 'eggs', 'bacon'),
+                ('after', 'get_slice', 17),
+                ('before', 'batch_insert', 'eggs', 'spam'),
+                ('after', 'batch_insert', 0),
+                ('before', 'remove', 'eggs', 'ham'),
+                ('error', 'remove', ValueError)])
+
+        remove_hook(recorder)
+        self.client.get_slice('eggs', 'bacon', None)
+        self.assert_(len(recorder.events) == 6)
+
+    def test_histogram(self):
+        hist = Histogram()
+        self.assert_(hist.snapshot()['p50'] is None)
+        for i in range(100):
+            hist.add(0.001)
+        hist.add(1.0)
+        snap = hist.snapshot()
+        self.assert_(snap['count'] == 101 and snap['max'] == 1.0)
+        self.assert_(0.001 <= snap['p50'] < 0.002)
+        self.assert_(snap['p99'] < 0.002)
+        self.assert_(sum([n for (bound, n) in snap['buckets']]) == 101)
+
+    def test_collector(self):
+        collector = Collector()
+        add_hook(collector)
+        for i in range(3):
+            self.client.get_slice('eggs', 'bacon', None)
+        self.assertRaises(ValueError, self.client.remove, 'eggs', 'ham')
+
+        snap = collector.snapshot()
+        self.assert_(snap['methods']['get_slice']['calls'] == 3)
+        self.assert_(snap['methods']['get_slice']['bytes_in'] == 51)
+        self.assert_(snap['methods']['remove']['errors'] == 1)
+        server = snap['servers']['localhost:9160']
+        self.assert_(server['calls'] == 4)
+        self.assert_(server['latency']['count'] == 4)
+
+        collector.reset()
+        self.assert_(collector.snapshot()['methods'] == {})
+
+
+if __name__ == '__main__':
+    unittest.main()
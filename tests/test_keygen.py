@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Key generator unit tests
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import time
+import unittest
+
+from lazyboy.keygen import Random, TimeOrdered, key_time
+from lazyboy.columnfamily import ColumnFamily
+
+
+class KeyGeneratorTest(unittest.TestCase):
+    def test_random(self):
+        for gen in (Random(), Random(batch=50)):
+            keys = [gen() for i in range(200)]
+            self.assert_(len(set(keys)) == 200)
+            self.assert_(all([len(k) == 32 and type(k) is str
+                              for k in keys]))
+
+    def test_time_ordered(self):
+        for gen in (TimeOrdered(), TimeOrdered(batch=50)):
+            keys = [gen() for i in range(200)]
+            self.assert_(keys == sorted(keys))
+            self.assert_(len(set(keys)) == 200)
+            self.assert_(len(keys[0]) == 32)
+            self.assert_(abs(key_time(keys[0]) - time.time()) < 5)
+
+    def test_clock_step(self):
+        gen = TimeOrdered()
+        first = gen()
+        gen._last += 10 ** 9
+        self.assert_(gen() > first)
+
+    def test_class(self):
+        class Story(ColumnFamily):
+            _key = {'table': 'eggs', 'family': 'bacon'}
+            _key_generator = TimeOrdered()
+
+        keys = [Story().pk.key for i in range(10)]
+        self.assert_(keys == sorted(keys))
+
+
+if __name__ == '__main__':
+    unittest.main()
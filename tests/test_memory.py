@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: In-memory Cassandra unit tests
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import time
+import unittest
+
+from cassandra.ttypes import Column, SuperColumn, ColumnParent, \
+    ColumnPath, ColumnPathOrParent, BatchMutation, BatchMutationSuper, \
+    NotFoundException
+
+import lazyboy.memory as memory
+from lazyboy.memory import MemoryServer
+from lazyboy.columnfamily import ColumnFamily
+
+
+class MemoryClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MemoryServer()
+        self.client = self.server.client()
+        self.client.batch_insert('eggs', BatchMutation('spam', {'bacon': [
+                        Column(n, 'v' + n, 1) for n in 'dbeac']}), 0)
+
+    def names(self, *args):
+        return [c.name for c in self.client.get_slice(
+                'eggs', 'spam', ColumnParent('bacon'), *args)]
+
+    def test_slice(self):
+        self.assert_(self.names('', '', True, 100) == list('abcde'))
+        self.assert_(self.names('b', 'd', True, 100) == list('bcd'))
+        self.assert_(self.names('b', '', True, 2) == list('bc'))
+        self.assert_(self.names('d', '', False, 100) == list('dcba'))
+        self.assert_(self.names('', 'c', False, 100) == list('edc'))
+        self.assert_(self.client.get_slice('eggs', 'ham', ColumnParent(
+                    'bacon'), '', '', True, 10) == [])
+
+    def test_timestamps(self):
+        path = ColumnPath('bacon', None, 'a')
+        self.client.insert('eggs', 'spam', path, 'old', 0, 0)
+        self.assert_(self.client.get_column('eggs', 'spam', path).value ==
+                     'va')
+        self.client.insert('eggs', 'spam', path, 'new', 2, 0)
+        self.assert_(self.client.get_column('eggs', 'spam', path).value ==
+                     'new')
+
+    def test_remove(self):
+        self.client.remove('eggs', 'spam',
+                           ColumnPathOrParent('bacon', None, 'b'), 2, 0)
+        self.assert_(self.names('', '', True, 100) == list('acde'))
+        self.assertRaises(NotFoundException, self.client.get_column,
+                          'eggs', 'spam', ColumnPath('bacon', None, 'b'))
+
+        # Older writes don't resurrect removed columns.
+        self.client.insert('eggs', 'spam', ColumnPath('bacon', None, 'b'),
+                           'x', 1, 0)
+        self.assert_('b' not in self.names('', '', True, 100))
+
+        self.client.remove('eggs', 'spam',
+                           ColumnPathOrParent('bacon', None, None), 2, 0)
+        self.assert_(self.names('', '', True, 100) == [])
+        self.client.insert('eggs', 'spam', ColumnPath('bacon', None, 'f'),
+                           'x', 1, 0)
+        self.assert_(self.names('', '', True, 100) == [])
+        self.client.insert('eggs', 'spam', ColumnPath('bacon', None, 'f'),
+                           'x', 3, 0)
+        self.assert_(self.names('', '', True, 100) == ['f'])
+
+    def test_super(self):
+        self.client.batch_insert_superColumn('eggs', BatchMutationSuper(
+                'spam', {'sausage': [
+                        SuperColumn('s2', [Column('a', '1', 1)]),
+                        SuperColumn('s1', [Column('b', '2', 1),
+                                           Column('a', '3', 1)])]}), 0)
+        scols = self.client.get_slice_super('eggs', 'spam', 'sausage',
+                                            '', '', True, 0, 10)
+        self.assert_([s.name for s in scols] == ['s1', 's2'])
+        self.assert_([c.name for c in scols[0].columns] == ['a', 'b'])
+        self.assert_(len(self.client.get_slice_super(
+                    'eggs', 'spam', 'sausage', '', '', True, 1, 10)) == 1)
+
+        scol = self.client.get_superColumn('eggs', 'spam', 'sausage:s2')
+        self.assert_(scol.columns[0].value == '1')
+        self.assert_(self.client.get_column_count(
+                'eggs', 'spam', ColumnParent('sausage')) == 2)
+
+        self.client.remove('eggs', 'spam',
+                           ColumnPathOrParent('sausage', 's2', None), 2, 0)
+        self.assertRaises(NotFoundException, self.client.get_superColumn,
+                          'eggs', 'spam', 'sausage:s2')
+        self.assert_(self.client.get_column_count(
+                'eggs', 'spam', ColumnParent('sausage')) == 1)
+
+    def test_key_range(self):
+        for key in ('c', 'a', 'b'):
+            self.client.insert('eggs', key, ColumnPath('ham', None, 'x'),
+                               'y', 1, 0)
+        self.client.remove('eggs', 'b',
+                           ColumnPathOrParent('ham', None, 'x'), 2, 0)
+        self.assert_(self.client.get_key_range('eggs', ['ham'], '', '',
+                                               10) == ['a', 'c'])
+        self.assert_(self.client.get_key_range('eggs', ['ham', 'bacon'],
+                                               'b', '', 1) == ['c'])
+
+    def test_latency(self):
+        server = MemoryServer(latency=0.01, jitter=0.005, seed=1)
+        delays = []
+        for i in range(2):
+            server._random.seed(1)
+            start = time.time()
+            server.client().get_slice('eggs', 'spam', ColumnParent('bacon'),
+                                      '', '', True, 10)
+            delays.append(time.time() - start)
+        self.assert_(all([0.005 <= d < 0.05 for d in delays]))
+
+
+class MemoryPoolTest(unittest.TestCase):
+    class Story(ColumnFamily):
+        _key = {'table': 'memory', 'family': 'Story'}
+
+    def test_pool(self):
+        server = memory.add_pool('memory')
+        story = self.Story({'title': 'Spam', 'body': 'Eggs'})
+        story.save()
+
+        loaded = self.Story().load(story.pk.key)
+        self.assert_(dict(loaded) == {'title': 'Spam', 'body': 'Eggs'})
+        del loaded['body']
+        loaded.save()
+        self.assert_(dict(self.Story().load(story.pk.key)) ==
+                     {'title': 'Spam'})
+
+        server.clear()
+        self.assert_(dict(self.Story().load(story.pk.key)) == {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,7 @@
 # Author: Ian Eure <ian@digg.com>
 #
 
+import pickle
 import unittest
 from lazyboy.primarykey import PrimaryKey
 from lazyboy.exceptions import ErrorIncompleteKey
@@ -72,19 +73,36 @@ class PrimaryKeyTest(unittest.TestCase):
         self.assert_(pk.key == 'spam')
         _pk = pk.clone(supercol='sausage', superkey='tomato')
         self.assert_(_pk.supercol == 'sausage' and _pk.superkey == 'tomato')
-        self.assertRaises(AttributeError, _pk.__getattr__, 'sopdfj')
+        self.assertRaises(AttributeError, getattr, _pk, 'sopdfj')
         self.assert_(hasattr(pk, 'supercol'))
         self.assert_(hasattr(pk, 'key'))
 
-        # Changes to the base propagate to cloned PKs.
-        pk.table = 'beans'
-        self.assert_(_pk.table == 'beans')
+        # Cloning without changes is free.
+        self.assert_(pk.clone() is pk)
+        self.assert_(_pk.clone(superkey='spam').superkey == 'spam')
+        self.assert_(_pk.clone(superkey='spam').key == 'spam')
 
-        __pk = _pk.clone()
-        self.assert_(__pk.table == 'beans')
-        pk.table = 'tomato'
-        self.assert_(__pk.table == 'tomato')
+    def test_immutable(self):
+        pk = PrimaryKey(table='eggs', key='spam', family='bacon')
+        self.assertRaises(AttributeError, setattr, pk, 'table', 'beans')
+        self.assertRaises(AttributeError, setattr, pk, 'sausage', 'beans')
+        self.assertRaises(AttributeError, delattr, pk, 'key')
+        self.assert_(pk.table == 'eggs')
 
+    def test_hash(self):
+        pk = PrimaryKey(table='eggs', key='spam', family='bacon')
+        same = PrimaryKey(table='eggs', key='spam', family='bacon')
+        self.assert_(pk == same and not pk != same)
+        self.assert_(hash(pk) == hash(same))
+        self.assert_(pk != pk.clone(key='sausage'))
+        self.assert_(pk != 'spam')
+        self.assert_({pk: 1}[same] == 1)
+
+    def test_pickle(self):
+        pk = PrimaryKey(table='eggs', key='spam', family='bacon',
+                        supercol='sausage', superkey='tomato')
+        self.assert_(pickle.loads(pickle.dumps(pk)) == pk)
+        self.assert_(pickle.loads(pickle.dumps(pk)).colspec() == pk.colspec())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Record and replay unit tests
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+from __future__ import with_statement
+
+import time
+import unittest
+from StringIO import StringIO
+
+from cassandra.ttypes import Column, ColumnParent, BatchMutation
+
+from lazyboy import instrument, memory
+from lazyboy.replay import Recorder, Replayer, encode, decode, read
+from lazyboy.columnfamily import ColumnFamily
+
+
+class Story(ColumnFamily):
+    _key = {'table': 'replay_test', 'family': 'Story'}
+
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.server = memory.add_pool('replay_test')
+
+    def tearDown(self):
+        instrument.hooks = []
+
+    def record(self, **kwargs):
+        out = StringIO()
+        with Recorder(out, **kwargs):
+            for i in range(5):
+                story = Story({'title': 'Story %d' % i, 'body': '\xff' * i})
+                story.pk = story._gen_pk('story%d' % i)
+                story.save()
+                Story().load(story.pk.key)
+        out.seek(0)
+        return list(read(out))
+
+    def test_encode(self):
+        args = ('eggs', BatchMutation('spam', {'bacon': [
+                        Column('a', '\x00\xff', 1.5)]}), 0)
+        self.assert_(decode(encode(args)) == list(args))
+
+    def test_record(self):
+        records = self.record()
+        self.assert_([r['method'] for r in records] ==
+                     ['batch_insert', 'get_slice'] * 5)
+        self.assert_(records[0]['t'] <= records[-1]['t'])
+        self.assert_(decode(records[1]['args'])[1] == 'story0')
+
+    def test_anonymize(self):
+        records = self.record(hash_keys=True, hash_values=True)
+        args = decode(records[2]['args'])
+        self.assert_(args[1].key != 'story1' and len(args[1].key) == 32)
+        values = sorted([c.value for c in args[1].cfmap['Story']])
+        self.assert_(values == ['x', 'x' * 7])
+        self.assert_(decode(records[3]['args'])[1] == args[1].key)
+
+        records = self.record(sample=0.5)
+        self.assert_(0 < len(records) < 10)
+        self.assert_(len(records) % 2 == 0)
+
+    def test_replay(self):
+        records = self.record()
+        server = memory.add_pool('replay_test')
+        report = Replayer(speed=None, concurrency=2).run(records)
+        self.assert_(report['calls'] == 10 and report['errors'] == 0)
+        self.assert_(report['methods']['get_slice']['calls'] == 5)
+        self.assert_(report['latency']['count'] == 10)
+        self.assert_(dict(Story().load('story3')) ==
+                     {'title': 'Story 3', 'body': '\xff' * 3})
+
+    def test_speed(self):
+        records = [{'t': 0.05 * i, 'method': 'get_slice',
+                    'args': encode(['replay_test', 'spam',
+                                    ColumnParent('Story'), '', '', True,
+                                    10])} for i in range(3)]
+        start = time.time()
+        Replayer(speed=2.0, concurrency=1).run(records)
+        self.assert_(0.05 <= time.time() - start < 0.5)
+
+        records.append({'t': 0, 'method': 'spam', 'args': ['replay_test']})
+        report = Replayer(speed=None).run(records)
+        self.assert_(report['errors'] == 1)
+
+    def test_bad_records(self):
+        records = [{'t': 0, 'method': 'get_slice',
+                    'args': ['no_such_table', 'spam']},
+                   {'t': 0, 'method': 'insert',
+                    'args': [{'__type__': 'Spam', 'fields': {}}]},
+                   {'t': 0, 'method': 'get_slice'}]
+        report = Replayer(speed=None, concurrency=1).run(records * 5)
+        self.assert_(report['calls'] == 15 and report['errors'] == 15)
+
+
+if __name__ == '__main__':
+    unittest.main()
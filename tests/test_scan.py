@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Scanner unit tests
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import os
+import uuid
+import tempfile
+import unittest
+
+from cassandra.ttypes import Column
+
+import lazyboy.connection
+from lazyboy.connection import Client
+from lazyboy.columnfamily import ColumnFamily
+from lazyboy.scan import Scanner, split_ranges
+
+
+class MockClient(Client):
+    """A mock Cassandra client holding sorted rows."""
+    def __init__(self, keys):
+        self.keys = sorted(keys)
+
+    def get_key_range(self, table, families, start, finish, count):
+        return [k for k in self.keys
+                if k >= start and (not finish or k <= finish)][:count]
+
+    def get_slice(self, table, key, parent, start, finish, asc, count):
+        return [Column(name='id', value=key, timestamp=0)]
+
+
+class ScannerTest(unittest.TestCase):
+    class ColumnFamily(ColumnFamily):
+        _key = {'table': 'eggs', 'family': 'bacon'}
+
+    def setUp(self):
+        self.keys = [uuid.uuid4().hex for i in range(500)]
+        client = MockClient(self.keys)
+        self.__get_pool = lazyboy.connection.get_pool
+        lazyboy.connection.get_pool = lambda table: client
+
+    def tearDown(self):
+        lazyboy.connection.get_pool = self.__get_pool
+
+    def test_split_ranges(self):
+        ranges = split_ranges(7)
+        self.assert_(len(ranges) == 7)
+        self.assert_(ranges[0][0] == '' and ranges[-1][1] == '')
+        for (a, b) in zip(ranges[:-1], ranges[1:]):
+            self.assert_(a[1] == b[0] and a[0] < a[1])
+        self.assert_(split_ranges(1) == [('', '')])
+
+    def test_scan(self):
+        scanner = Scanner(self.ColumnFamily, workers=3, batch_size=7)
+        keys = [row['id'] for row in scanner]
+        self.assert_(sorted(keys) == sorted(self.keys),
+                     "Rows were skipped or repeated.")
+
+        report = scanner.report()
+        self.assert_(len(report) == 3)
+        self.assert_(sum([r['rows'] for r in report.values()]) == 500)
+        for stats in report.values():
+            self.assert_(stats['rows_per_sec'] >= 0)
+            self.assert_(stats['bytes_per_sec'] >= 0)
+
+    def test_resume(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        os.unlink(path)
+        try:
+            scanner = Scanner(self.ColumnFamily, workers=2, batch_size=10,
+                              checkpoint=path)
+            seen = []
+            for rows in scanner.iter_batches():
+                seen.extend([row['id'] for row in rows])
+                if len(seen) >= 100: break
+
+            scanner = Scanner(self.ColumnFamily, workers=2, batch_size=10,
+                              checkpoint=path)
+            seen.extend([row['id'] for row in scanner])
+            self.assert_(set(seen) == set(self.keys))
+            self.assert_(len(seen) < 600,
+                         "Resumed scan started over: %d rows" % len(seen))
+        finally:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Sharding unit tests
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import unittest
+
+import lazyboy.connection as connection
+from lazyboy.shard import HashRing, movement, moved_keys
+from lazyboy.memory import MemoryServer
+from lazyboy.columnfamily import ColumnFamily
+from lazyboy.exceptions import ErrorNotSupported
+
+
+class Story(ColumnFamily):
+    _key = {'table': 'sharded', 'family': 'Story'}
+
+
+class HashRingTest(unittest.TestCase):
+    def setUp(self):
+        self.ring = HashRing(['a', 'b', 'c'])
+        self.keys = ['key%d' % i for i in range(3000)]
+
+    def test_shard_for(self):
+        groups = self.ring.group(self.keys)
+        self.assert_(sorted(groups.keys()) == ['a', 'b', 'c'])
+        for keys in groups.values():
+            self.assert_(600 < len(keys) < 1400)
+        self.assert_(HashRing(['a', 'b', 'c']).shard_for('spam') ==
+                     self.ring.shard_for('spam'))
+        self.assertRaises(ValueError, HashRing, [])
+
+    def test_movement(self):
+        bigger = self.ring.add('d')
+        moves = movement(self.ring, bigger)
+        self.assert_([dest for (src, dest) in moves] == ['d'] * 3)
+        self.assert_(0.15 < sum(moves.values()) < 0.35)
+        self.assert_(movement(self.ring, self.ring) == {})
+
+        moved = list(moved_keys(self.ring, bigger, self.keys))
+        self.assert_([dest for (key, src, dest) in moved] ==
+                     ['d'] * len(moved))
+        self.assert_(abs(float(len(moved)) / len(self.keys) -
+                         sum(moves.values())) < 0.05)
+
+        smaller = bigger.remove('d')
+        self.assert_(sorted(movement(bigger, smaller).keys()) ==
+                     sorted([(dest, src) for (src, dest) in moves.keys()]))
+
+
+class ShardedClientTest(unittest.TestCase):
+    def setUp(self):
+        self.servers = dict((name, MemoryServer(name=name))
+                            for name in ('a', 'b'))
+        connection.add_sharded_pool(
+            'sharded', dict((name, [server]) for (name, server)
+                            in self.servers.items()))
+
+    def test_routing(self):
+        keys = []
+        for i in range(20):
+            story = Story({'title': 'Story %d' % i})
+            story.pk = story._gen_pk('story%d' % i)
+            story.save()
+            keys.append(story.pk.key)
+
+        ring = connection.get_ring('sharded')
+        for key in keys:
+            self.assert_(Story().load(key)['title'] ==
+                         'Story %s' % key[5:])
+            server = self.servers[ring.shard_for(key)]
+            self.assert_(('sharded', key) in server._rows)
+            for other in self.servers.values():
+                if other is not server:
+                    self.assert_(('sharded', key) not in other._rows)
+
+        client = connection.get_pool('sharded')
+        self.assert_(client.get_key_range('sharded', ['Story'], '', '',
+                                          100) == sorted(keys))
+        self.assert_(client.get_key_range('sharded', ['Story'], 'story1',
+                                          '', 3) ==
+                     ['story1', 'story10', 'story11'])
+        self.assert_(sum(map(len, client.group(keys).values())) == 20)
+        self.assertRaises(ErrorNotSupported, client.describe_table, 'x')
+
+    def test_limiter(self):
+        self.assert_(connection.get_limiter('sharded/a') is None)
+        connection.add_sharded_pool(
+            'sharded', dict((name, [server]) for (name, server)
+                            in self.servers.items()),
+            limiter=connection.Limiter)
+        (a, b) = [connection.get_limiter('sharded/' + name)
+                  for name in ('a', 'b')]
+        self.assert_(isinstance(a, connection.Limiter))
+        self.assert_(isinstance(b, connection.Limiter) and a is not b)
+
+        story = Story({'title': 'Limited'})
+        story.pk = story._gen_pk('limited')
+        story.save()
+        self.assert_(Story().load('limited')['title'] == 'Limited')
+        self.assert_(a.in_flight == 0 and b.in_flight == 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: View unit tests
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import time
+import unittest
+from md5 import md5
+
+from cassandra.ttypes import Column
+
+from lazyboy.connection import Client
+from lazyboy.columnfamily import ColumnFamily
+from lazyboy.view import View, append_time
+from lazyboy.exceptions import ErrorNotSupported
+
+from test_base import CassandraBaseTest
+
+
+class MockClient(Client):
+    """A mock Cassandra client which serves ordered slices of partitions."""
+    def __init__(self, partitions):
+        self.partitions = partitions
+        self.calls = []
+
+    def get_slice(self, table, key, parent, start, finish, ascending, count):
+        self.calls.append(('get_slice', key, start))
+        cols = [col for col in self.partitions.get(key, [])
+                if col.name >= start]
+        return cols[:count]
+
+    def insert(self, table, key, path, value, timestamp, block_for):
+        self.calls.append(('insert', key, path.column))
+        cols = [col for col in self.partitions.setdefault(key, [])
+                if col.name != path.column]
+        cols.append(Column(name=path.column, value=value,
+                           timestamp=timestamp))
+        cols.sort(key=lambda col: col.name)
+        self.partitions[key] = cols
+
+    def batch_insert(self, table, batch_mutation, block_for):
+        self.calls.append(('batch_insert', batch_mutation.key, None))
+        cols = self.partitions.setdefault(batch_mutation.key, [])
+        for col in batch_mutation.cfmap.values()[0]:
+            cols.append(col)
+        cols.sort(key=lambda col: col.name)
+
+
+def make_partitions(keys, per_partition):
+    """Return a dict of partition key -> sorted list of Columns."""
+    partitions = {}
+    n = 0
+    for partk in keys:
+        cols = []
+        for i in range(per_partition):
+            cols.append(Column(name="%05d" % n, value="key%d" % n,
+                               timestamp=time.time()))
+            n += 1
+        partitions[partk] = cols
+    return partitions
+
+
+class ViewTest(CassandraBaseTest):
+    class View(View):
+        _key = {'table': 'eggs', 'family': 'bacon'}
+
+        def view_keys(self, start=''):
+            return ('p0', 'p1', 'p2')
+
+    class Family(ColumnFamily):
+        _key = {'table': 'eggs', 'family': 'sausage'}
+        loaded = []
+        gone = ()
+
+        def load(self, key):
+            self.loaded.append(key)
+            self.pk = self._gen_pk(key)
+            if key not in self.gone:
+                self._original = [Column(name='key', value=key)]
+            return self
+
+    def __init__(self, *args, **kwargs):
+        super(ViewTest, self).__init__(*args, **kwargs)
+        self.class_ = self.View
+
+    def get_mock_cassandra(self):
+        """Point the view at a mock cassandra instance and return it."""
+        client = MockClient(make_partitions(('p0', 'p1', 'p2'), 150))
+        self.object._get_cas = lambda table=None: client
+        self.object.family = self.Family
+        self.Family.loaded, self.Family.gone = [], ()
+        return client
+
+    def test_iter_keys(self):
+        self.get_mock_cassandra()
+        keys = list(self.object._iter_keys())
+        self.assert_(keys == ["key%d" % i for i in range(450)],
+                     "Keys were skipped or repeated across pages.")
+
+    def test_fanout(self):
+        self.get_mock_cassandra()
+        serial = list(self.object._iter_keys())
+        self.object.fanout = 2
+        self.assert_(list(self.object._iter_keys()) == serial,
+                     "Prefetching partitions changed the sequence.")
+        self.object.chunk_size = 40
+        self.assert_(list(self.object._iter_keys()) == serial)
+
+    def test_merge_key(self):
+        client = self.get_mock_cassandra()
+        for (n, partk) in enumerate(('p0', 'p1', 'p2')):
+            for (i, col) in enumerate(client.partitions[partk]):
+                col.name = "%032d.%d.%d" % (0, 1000 + i, n)
+        self.object.fanout = 2
+        self.object.merge_key = append_time
+        cols = [col for (partk, col) in self.object._iter_cols()]
+        self.assert_(len(cols) == 450)
+        times = map(append_time, cols)
+        self.assert_(times == sorted(times),
+                     "Partitions weren't merged by merge_key.")
+
+        self.object.view_keys = lambda start='': iter(('p0', 'p1', 'p2'))
+        self.assertRaises(ErrorNotSupported, self.object._iter_cols)
+        self.object.occupancy_key = 'partitions'
+        client.partitions['partitions'] = [Column(name='p1', value='')]
+        self.assert_(len(list(self.object._iter_cols())) == 150)
+
+    def test_occupancy(self):
+        client = self.get_mock_cassandra()
+        keys = ["d%04d" % i for i in range(1000, 0, -1)]
+        self.object.view_keys = lambda start='': (key for key in keys)
+        self.object.occupancy_key = 'partitions'
+        client.partitions['d0500'] = client.partitions['p1']
+        client.partitions['partitions'] = [Column(name='d0500', value='')]
+
+        self.assert_(len(list(self.object._iter_keys())) == 150)
+        self.assert_([call[1] for call in client.calls] ==
+                     ['partitions', 'd0500', 'd0500'],
+                     "Empty partitions were read: %s" % (client.calls,))
+
+        self.object.append(self.Family())
+        self.object.append(self.Family())
+        self.assert_(len(client.partitions['d1000']) == 2)
+        self.assert_([col.name for col in client.partitions['partitions']]
+                     == ['d0500', 'd1000'])
+        self.assert_([call[1] for call in client.calls].count('partitions')
+                     == 2, "Occupancy was recorded more than once.")
+        self.assert_(len(list(self.object._iter_keys())) == 152)
+
+    def test_rebuild_occupancy(self):
+        client = self.get_mock_cassandra()
+        self.object.view_keys = lambda start='': ('p0', 'px', 'p1', 'p2')
+        self.assertRaises(ErrorNotSupported, self.object.rebuild_occupancy)
+
+        self.object.occupancy_key = 'partitions'
+        self.assert_(list(self.object._iter_keys()) == [],
+                     "Partitions missing from the occupancy row were read.")
+        occupied = self.object.rebuild_occupancy(batch_size=3)
+        self.assert_(occupied == ['p0', 'p1', 'p2'])
+        self.assert_([col.name for col in client.partitions['partitions']]
+                     == ['p0', 'p1', 'p2'])
+        self.assert_(len(list(self.object._iter_keys())) == 450)
+
+    def test_extend(self):
+        client = self.get_mock_cassandra()
+        self.object.view_keys = lambda start='': (k for k in ('p9', 'p0'))
+        objs = [self.Family() for i in range(50)]
+        self.object.extend(objs)
+        self.assert_(client.calls == [('batch_insert', 'p9', None)])
+        self.assert_(sorted(col.value for col in client.partitions['p9'])
+                     == sorted(obj.pk.key for obj in objs))
+        for col in client.partitions['p9']:
+            self.assert_(col.name.startswith(md5(col.value).hexdigest()))
+            self.assert_(abs(append_time(col) - col.timestamp) < 0.01)
+
+    def test_buffered(self):
+        client = self.get_mock_cassandra()
+        self.object.view_keys = lambda start='': (k for k in ('p9', 'p0'))
+        appender = self.object.buffered(max_entries=10, max_delay=3600)
+        appender.extend(self.Family() for i in range(25))
+        self.assert_(len(client.calls) == 2)
+        self.assert_(len(appender) == 5)
+        appender.flush()
+        self.assert_(len(client.calls) == 3)
+        self.assert_(len(client.partitions['p9']) == 25)
+
+        appender.max_delay = 0
+        appender.append(self.Family())
+        self.assert_(len(appender) == 0, "Old entries weren't flushed.")
+        appender.close()
+
+    def test_buffered_delay(self):
+        client = self.get_mock_cassandra()
+        self.object.view_keys = lambda start='': (k for k in ('p9', 'p0'))
+        appender = self.object.buffered(max_entries=10, max_delay=0.05)
+        appender.extend(self.Family() for i in range(3))
+        self.assert_(len(appender) == 3)
+        time.sleep(0.3)
+        self.assert_(len(appender) == 0 and
+                     len(client.partitions['p9']) == 3,
+                     "Delayed entries weren't flushed.")
+        self.assert_(appender._thread is None,
+                     "Flusher kept running with nothing buffered.")
+
+    def test_buffered_retry(self):
+        client = self.get_mock_cassandra()
+        self.object.view_keys = lambda start='': (k for k in ('p9', 'p0'))
+        appender = self.object.buffered(max_entries=10, max_delay=0.05)
+        insert, failures = client.batch_insert, [1, 1]
+        def batch_insert(*args):
+            if failures:
+                failures.pop()
+                raise Exception("Write failed")
+            insert(*args)
+        client.batch_insert = batch_insert
+
+        appender.extend(self.Family() for i in range(3))
+        self.assertRaises(Exception, appender.flush)
+        self.assert_(len(appender) == 3, "Unwritten entries were dropped.")
+        time.sleep(0.3)
+        self.assert_(len(appender.errors) == 1)
+        self.assert_(len(appender) == 0 and
+                     len(client.partitions['p9']) == 3,
+                     "Failed entries weren't retried.")
+        appender.close()
+
+    def test_write_split(self):
+        client = self.get_mock_cassandra()
+        self.object.view_keys = lambda start='': (k for k in ('p9', 'p0'))
+        self.object._batch_columns = 20
+        self.object.extend([self.Family() for i in range(50)])
+        self.assert_([call[1] for call in client.calls] == ['p9'] * 3,
+                     "Partition wasn't split into batches.")
+        self.assert_(len(client.partitions['p9']) == 50)
+
+    def test_page_cache(self):
+        client = self.get_mock_cassandra()
+        self.object._page_cache.clear()
+        self.object.cache_size = 30
+        first = [obj.pk.key for obj in self.object[0:20]]
+        self.assert_(first == ["key%d" % i for i in range(20)])
+
+        client.calls, self.Family.loaded = [], []
+        view = self.View()
+        view.cache_size = 30
+        view._get_cas, view.family = self.object._get_cas, self.Family
+        self.assert_([obj.pk.key for obj in view[0:20]] == first)
+        self.assert_(view[5].pk.key == 'key5')
+        self.assert_(client.calls == [] and self.Family.loaded == [],
+                     "Cached page cost RPCs.")
+
+        keys = [obj.pk.key for obj in view]
+        self.assert_(keys == ["key%d" % i for i in range(450)])
+
+        view.cache_ttl = 0
+        client.calls = []
+        view[0:5]
+        self.assert_(client.calls, "Stale page was served.")
+
+    def test_page_cache_bounded(self):
+        self.get_mock_cassandra()
+        self.object._page_cache.clear()
+        self.object._page_cache_size = 3
+        self.object.cache_size, self.object.cache_ttl = 5, 0.5
+        for partk in ('p0', 'p1', 'p2', 'p3'):
+            self.object.current_key = lambda partk=partk: partk
+            self.object[0:5]
+        self.object.current_key = lambda: 'p1'
+        self.object[0:5]
+        self.object.current_key = lambda: 'p4'
+        self.object[0:5]
+        self.assert_(sorted(key[-1] for key in self.object._page_cache) ==
+                     ['p1', 'p3', 'p4'],
+                     "Least recently used pages weren't dropped.")
+
+        time.sleep(0.5)
+        self.object.current_key = lambda: 'p5'
+        self.object[0:5]
+        self.assert_([key[-1] for key in self.object._page_cache] == ['p5'],
+                     "Expired pages were kept.")
+
+    def test_page_cache_append(self):
+        client = self.get_mock_cassandra()
+        self.object._page_cache.clear()
+        self.object.cache_size = 5
+        self.object[0:5]
+
+        obj = self.Family()
+        obj.pk = obj._gen_pk('newkey')
+        col = self.object._column('newkey', time.time())
+        col.name = '00001.5'
+        self.object._column = lambda key, ts: col
+        self.object.append(obj)
+
+        client.calls = []
+        page = self.object[0:5]
+        self.assert_(client.calls == [])
+        self.assert_([o.pk.key for o in page] ==
+                     ['key0', 'key1', 'newkey', 'key2', 'key3'])
+
+    def test_iter(self):
+        self.get_mock_cassandra()
+        self.object.page_size = 7
+        keys = [obj.pk.key for obj in self.object]
+        self.assert_(keys == ["key%d" % i for i in range(450)],
+                     "Objects were loaded out of order.")
+
+    def test_iter_missing(self):
+        self.get_mock_cassandra()
+        self.Family.gone = ('key3', 'key17')
+        missing = []
+        self.object.missing_key = missing.append
+        keys = [obj.pk.key for obj in self.object]
+        self.assert_(len(keys) == 448)
+        self.assert_('key3' not in keys and 'key17' not in keys)
+        self.assert_(missing == ['key3', 'key17'])
+
+    def test_getitem(self):
+        self.get_mock_cassandra()
+        obj = self.object[210]
+        self.assert_(obj.pk.key == 'key210')
+        self.assert_(self.Family.loaded == ['key210'],
+                     "Skipped objects were loaded: %s" % self.Family.loaded)
+        self.assertRaises(IndexError, self.object.__getitem__, 1000)
+        self.assertRaises(ErrorNotSupported, self.object.__getitem__, -1)
+
+        self.Family.gone = ('key211',)
+        missing = []
+        self.object.missing_key = missing.append
+        self.assert_(self.object[211] is None)
+        self.assert_(missing == ['key211'])
+
+    def test_getitem_slice(self):
+        self.get_mock_cassandra()
+        objs = self.object[100:120]
+        self.assert_([o.pk.key for o in objs] ==
+                     ["key%d" % i for i in range(100, 120)])
+        self.assert_(len(self.Family.loaded) == 20)
+        self.assert_(self.object[440:500][-1].pk.key == 'key449')
+        self.assert_(self.object[10:5] == [])
+
+    def test_cursor_cache(self):
+        client = self.get_mock_cassandra()
+        self.object[320]
+        self.assert_(sorted(self.object._cursors) == [100, 200, 300, 321])
+        self.object[0:250]
+        self.assert_(sorted(self.object._cursors) == [100, 200, 250, 300, 321],
+                     "Window cursors crowded out the checkpoints.")
+        client.calls = []
+        self.object[321]
+        self.assert_(client.calls[0][1:] == ('p2', '00320'),
+                     "Deep offset was rescanned from the start: %s" % \
+                         (client.calls,))
+
+        self.object._cursor_cache_size = 2
+        self.object._cursors, self.object._cursor_order = {}, []
+        self.object[5:8]
+        self.assert_(len(self.object._cursors) <= 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# Lazyboy: Write-behind unit tests
+#
+# © 2009 Digg, Inc. All rights reserved.
+# Author: Ian Eure <ian@digg.com>
+#
+
+import unittest
+
+from cassandra.ttypes import Column
+
+import lazyboy.connection
+from lazyboy.connection import Client
+from lazyboy.columnfamily import ColumnFamily
+from lazyboy.primarykey import PrimaryKey
+from lazyboy.exceptions import ErrorNotSupported
+from lazyboy.writebehind import WriteBehind
+
+
+class MockClient(Client):
+    """A mock Cassandra client which records writes."""
+    def __init__(self):
+        self.inserts, self.removes = [], []
+
+    def batch_insert(self, table, batch_mutation, block_for):
+        if batch_mutation.key == 'fail':
+            raise Exception("Write failed")
+        self.inserts.append(batch_mutation)
+
+    def remove(self, table, key, path, timestamp, block_for):
+        self.removes.append((key, path.column, timestamp))
+
+
+class WriteBehindTest(unittest.TestCase):
+    class ColumnFamily(ColumnFamily):
+        _key = {'table': 'eggs', 'family': 'bacon'}
+
+    def setUp(self):
+        self.client = MockClient()
+        self.__get_pool = lazyboy.connection.get_pool
+        lazyboy.connection.get_pool = lambda table: self.client
+        self.queue = WriteBehind(interval=60)
+
+    def tearDown(self):
+        self.queue.close()
+        lazyboy.connection.get_pool = self.__get_pool
+
+    def test_coalesce(self):
+        pk = PrimaryKey(table='eggs', key='spam', family='bacon')
+        self.queue.put(pk, [Column('a', '1', 1), Column('b', '1', 1)], {})
+        self.queue.put(pk, [Column('a', '2', 3)], {'b': 2})
+        self.queue.put(pk, [Column('a', 'old', 2), Column('b', 'old', 1)],
+                       {})
+        self.assert_(len(self.queue) == 1)
+        self.queue.flush()
+
+        self.assert_(len(self.client.inserts) == 1)
+        cols = self.client.inserts[0].cfmap['bacon']
+        self.assert_([(c.name, c.value) for c in cols] == [('a', '2')],
+                     "Newest write didn't win.")
+        self.assert_(self.client.removes == [('spam', 'b', 2)])
+
+    def test_save(self):
+        obj = self.ColumnFamily()
+        obj._write_behind = self.queue
+        for i in range(10):
+            obj['count'] = i
+            self.assert_(obj.save() is obj)
+        self.assert_(self.client.inserts == [],
+                     "save() didn't return before writing.")
+        self.queue.flush()
+        self.assert_(len(self.client.inserts) == 1)
+        self.assert_(self.client.inserts[0].cfmap['bacon'][0].value == '9')
+
+    def test_unsupported(self):
+        obj = self.ColumnFamily()
+        obj._write_behind = self.queue
+        obj['email'] = 'a@example.com'
+        for attrs in ({'_indexes': ('email',), '_index_family': 'idx'},
+                      {'_blobs': ('body',), '_blob_family': 'chunks'}):
+            for (attr, value) in attrs.items(): setattr(obj, attr, value)
+            self.assertRaises(ErrorNotSupported, obj.save)
+            for attr in attrs: delattr(obj, attr)
+        self.assert_(len(self.queue) == 0 and self.client.inserts == [])
+
+    def test_errors(self):
+        errors = []
+        self.queue.on_error = lambda row, exc: errors.append(row)
+        pk = PrimaryKey(table='eggs', key='fail', family='bacon')
+        self.queue.put(pk, [Column('a', '1', 1)], {})
+        self.queue.flush()
+        self.assert_(errors == [('eggs', 'fail', 'bacon')])
+
+    def test_close(self):
+        pk = PrimaryKey(table='eggs', key='spam', family='bacon')
+        self.queue.put(pk, [Column('a', '1', 1)], {})
+        self.queue.close()
+        self.assert_(len(self.client.inserts) == 1,
+                     "Queued changes were dropped on close.")
+
+        obj = self.ColumnFamily()
+        obj._write_behind = self.queue
+        obj['count'] = 2
+        self.assertRaises(ValueError, obj.save)
+        self.assert_(len(self.queue) == 0)
+
+
+if __name__ == '__main__':
+    unittest.main()